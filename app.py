@@ -1,4 +1,4 @@
-from flask import Flask, request, abort, render_template, session, jsonify
+from flask import Flask, Response, request, abort, render_template, session, jsonify, redirect, url_for
 from linebot import LineBotApi, WebhookHandler
 from linebot.exceptions import InvalidSignatureError
 from linebot.models import (
@@ -13,31 +13,117 @@ from linebot.models import (
 import os
 from dotenv import load_dotenv
 import json
-from datetime import datetime, timedelta
-import uuid
+from datetime import datetime, timedelta, timezone
 import logging
+import time
+import hashlib
+import hmac
+import secrets
+from functools import partial, lru_cache, wraps
+import metrics
+from webhook_queue import WebhookQueue
+from menu_cache import MenuRenderCache, StaticMessages
+from flex_templates import FlexTemplate, Slot, Repeat, postback_button
+from store import (
+    Database, CartStore, OrderStore, EventLog, WorkerSlots, DeadLetterStore, AdminUserStore,
+    CHECKOUT_CREATED, CHECKOUT_DUPLICATE, CHECKOUT_CHANGED, ORDER_STATUS_CHANGED
+)
+from event_dedup import EventDeduplicator
+from order_ids import OrderIdGenerator, MAX_WORKERS, is_order_id
+from order_events import OrderEventBroker, format_event
+from notifier import StatusNotifier
+from outbound import OutboundQueue
+from menu_catalog import MenuCatalog
+from line_client import PooledHttpClient, send_messages, reply_raw
+from postback_router import PostbackRouter, postback_data
+from command_matcher import CommandMatcher, ITEM
+from menu_search import MenuSearchIndex
 
 # 載入環境變數
 load_dotenv()
 
 app = Flask(__name__)
-app.secret_key = os.getenv("FLASK_SECRET_KEY", "default_secret_key")
 
 # 設置日誌
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 管理後台以 session 登入，secret key 必須保密；未設定時每次啟動隨機產生
+app.secret_key = os.getenv("FLASK_SECRET_KEY")
+if not app.secret_key:
+    app.secret_key = secrets.token_hex(32)
+    logger.warning("未設定 FLASK_SECRET_KEY，管理後台登入只在同一個 worker 行程內有效，重新啟動後需重新登入")
+app.config.update(SESSION_COOKIE_HTTPONLY=True, SESSION_COOKIE_SAMESITE="Lax")
+
 LINE_CHANNEL_SECRET = os.getenv("LINE_CHANNEL_SECRET")
 LINE_CHANNEL_ACCESS_TOKEN = os.getenv("LINE_CHANNEL_ACCESS_TOKEN")
 
-line_bot_api = LineBotApi(LINE_CHANNEL_ACCESS_TOKEN)
+# LINE API 連線池設定：共用 keep-alive 連線；HTTP 層只重試連線失敗，
+# 429/5xx 由發送佇列 (OutboundQueue) 以指數退避重試並遵守 Retry-After
+LINE_API_TIMEOUT = float(os.getenv("LINE_API_TIMEOUT", "10"))
+LINE_HTTP_POOL_SIZE = int(os.getenv("LINE_HTTP_POOL_SIZE", "10"))
+LINE_HTTP_RETRIES = int(os.getenv("LINE_HTTP_RETRIES", "3"))
+LINE_HTTP_BACKOFF = float(os.getenv("LINE_HTTP_BACKOFF", "0.3"))
+# 壓力測試時可指向本機的模擬伺服器 (見 benchmarks/loadtest.py)
+LINE_API_ENDPOINT = os.getenv("LINE_API_ENDPOINT", "https://api.line.me")
+
+line_bot_api = LineBotApi(
+    LINE_CHANNEL_ACCESS_TOKEN,
+    endpoint=LINE_API_ENDPOINT,
+    timeout=LINE_API_TIMEOUT,
+    http_client=partial(
+        PooledHttpClient,
+        pool_size=LINE_HTTP_POOL_SIZE,
+        max_retries=LINE_HTTP_RETRIES,
+        backoff_factor=LINE_HTTP_BACKOFF,
+        status_forcelist=()
+    )
+)
 handler = WebhookHandler(LINE_CHANNEL_SECRET)
 
-# 完整菜單數據 - 使用更好看的圖片
+# postback 動作路由表
+postback_router = PostbackRouter()
+
+# Prometheus 指標 (見 /metrics)
+WEBHOOK_REQUESTS = metrics.counter(
+    "linebot_webhook_requests_total", "Webhook 請求數", ["result"]
+)
+WEBHOOK_SECONDS = metrics.histogram(
+    "linebot_webhook_request_seconds", "/callback 回應時間"
+)
+TEXT_COMMAND_SECONDS = metrics.histogram(
+    "linebot_text_command_seconds", "各文字指令的處理時間", ["command"]
+)
+FLEX_BUILD_SECONDS = metrics.histogram(
+    "linebot_flex_build_seconds", "Flex 訊息建構時間", ["view"]
+)
+
+# 文字指令別名：中文、英文、簡體字與常見說法；英文指令錯一個字母也能辨識 (見 command_matcher.py)
+COMMAND_ALIASES = {
+    "menu": ["點餐", "菜單", "點菜", "我要點餐", "看菜單", "点餐", "菜单", "menus", "order food"],
+    "cart": ["購物車", "我的購物車", "看購物車", "购物车", "basket", "shopping cart"],
+    "orders": ["訂單", "我的訂單", "查訂單", "訂單查詢", "订单", "order", "my orders"],
+    "help": ["幫助", "說明", "使用說明", "怎麼用", "帮助", "说明"]
+}
+# 前綴指令：「搜尋 漢堡」「search burger」
+# 不使用單一字元的前綴，避免「找不到路」之類的句子被當成搜尋
+COMMAND_PREFIXES = {
+    "search": ["搜尋", "搜索", "search", "find"]
+}
+# 以文字點餐時單一商品的數量上限
+TEXT_ORDER_MAX_QUANTITY = int(os.getenv("TEXT_ORDER_MAX_QUANTITY", "20"))
+
+# 非同步 Webhook 設定：簽章驗證後立即回應，事件交由背景執行緒處理
+WEBHOOK_ASYNC = os.getenv("WEBHOOK_ASYNC", "false").lower() == "true"
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "4"))
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", "1000"))
+
+# 內建菜單數據 - 資料庫尚未初始化時使用 (見 init_database.py)
 MENU = {
     "recommended": {
         "id": "recommended",
         "name": "🔥 推薦餐點",
+        "image": "https://images.unsplash.com/photo-1514933651103-005eec06c04b?w=1024&h=1024&fit=crop",
         "items": {
             "1號餐": {"name": "1號餐", "price": 120, "desc": "漢堡+薯條+可樂", "image": "https://images.unsplash.com/photo-1571091718767-18b5b1457add?w=400&h=300&fit=crop"},
             "2號餐": {"name": "2號餐", "price": 150, "desc": "雙層漢堡+薯條+紅茶", "image": "https://images.unsplash.com/photo-1553979459-d2229ba7433a?w=400&h=300&fit=crop"},
@@ -47,6 +133,7 @@ MENU = {
     "main": {
         "id": "main",
         "name": "🍔 主餐",
+        "image": "https://images.unsplash.com/photo-1571091718767-18b5b1457add?w=1024&h=1024&fit=crop",
         "items": {
             "經典漢堡": {"name": "經典漢堡", "price": 70, "desc": "100%純牛肉漢堡", "image": "https://images.unsplash.com/photo-1568901346375-23c9450c58cd?w=400&h=300&fit=crop"},
             "雙層起司堡": {"name": "雙層起司堡", "price": 90, "desc": "雙倍起司雙倍滿足", "image": "https://images.unsplash.com/photo-1572802419224-296b0aeee0d9?w=400&h=300&fit=crop"},
@@ -57,6 +144,7 @@ MENU = {
     "side": {
         "id": "side",
         "name": "🍟 副餐",
+        "image": "https://images.unsplash.com/photo-1573080496219-bb080dd4f877?w=1024&h=1024&fit=crop",
         "items": {
             "薯條": {"name": "薯條", "price": 50, "desc": "金黃酥脆薯條", "image": "https://images.unsplash.com/photo-1573080496219-bb080dd4f877?w=400&h=300&fit=crop"},
             "洋蔥圈": {"name": "洋蔥圈", "price": 60, "desc": "香脆可口洋蔥圈", "image": "https://images.unsplash.com/photo-1639024471283-03518883512d?w=400&h=300&fit=crop"},
@@ -67,6 +155,7 @@ MENU = {
     "drink": {
         "id": "drink",
         "name": "🥤 飲料",
+        "image": "https://images.unsplash.com/photo-1544145945-f90425340c7e?w=1024&h=1024&fit=crop",
         "items": {
             "可樂": {"name": "可樂", "price": 30, "desc": "冰涼暢快可樂", "image": "https://images.unsplash.com/photo-1629203851122-3726ecdf080e?w=400&h=300&fit=crop"},
             "雪碧": {"name": "雪碧", "price": 30, "desc": "清爽解渴雪碧", "image": "https://images.unsplash.com/photo-1581636625402-29b2a704ef13?w=400&h=300&fit=crop"},
@@ -86,15 +175,176 @@ ORDER_STATUS = {
     "cancelled": "❌ 已取消"
 }
 
-# 用戶數據存儲 (實際應用中應使用數據庫)
-user_carts = {}
-user_orders = {}
+# 訂單狀態可轉換的下一個狀態
+ORDER_TRANSITIONS = {
+    "pending": {"confirmed", "cancelled"},
+    "confirmed": {"preparing", "cancelled"},
+    "preparing": {"ready", "cancelled"},
+    "ready": set(),
+    "cancelled": set()
+}
+
+# 狀態變更時通知顧客的訊息
+STATUS_NOTIFICATIONS = {
+    "confirmed": "✅ 您的訂單已確認",
+    "preparing": "👨‍🍳 您的餐點正在準備中",
+    "ready": "🍽️ 您的餐點已完成，請前往取餐",
+    "cancelled": "❌ 您的訂單已取消，如有疑問請聯繫店家"
+}
+
+# 單次批次更新的訂單數上限
+ORDER_BULK_UPDATE_LIMIT = 500
+
+# 每頁顯示的訂單數
+ORDERS_PAGE_SIZE = 5
+
+# 管理 API 每頁訂單數上限
+ADMIN_ORDERS_MAX_LIMIT = 100
+
+# 用戶數據存儲：購物車與訂單存放於 SQLite，多個 gunicorn worker 共用
+DATABASE_PATH = os.getenv("DATABASE_PATH", "restaurant.db")
+db = Database(DATABASE_PATH)
+db.init_schema()
+
+# 購物車保存期限與數量上限，第一次加入商品後由背景執行緒定期清理
+CART_TTL_HOURS = float(os.getenv("CART_TTL_HOURS", "24"))
+CART_MAX_RESIDENT = int(os.getenv("CART_MAX_RESIDENT", "100000"))
+CART_SWEEP_INTERVAL = float(os.getenv("CART_SWEEP_INTERVAL", "300"))
+cart_store = CartStore(
+    db,
+    ttl=timedelta(hours=CART_TTL_HOURS),
+    max_carts=CART_MAX_RESIDENT,
+    sweep_interval=CART_SWEEP_INTERVAL
+)
+
+order_store = OrderStore(db)
+admin_users = AdminUserStore(db)
+
+# LINE 訊息發送佇列：handler 只負責排入佇列，由背景執行緒限流發送、失敗時退避重試，
+# 重試後仍失敗的訊息存入 dead letter 資料表
+# 發送執行緒數不要超過 LINE_HTTP_POOL_SIZE，才能全部重複使用 keep-alive 連線
+OUTBOUND_WORKERS = int(os.getenv("OUTBOUND_WORKERS", "8"))
+OUTBOUND_QUEUE_SIZE = int(os.getenv("OUTBOUND_QUEUE_SIZE", "10000"))
+OUTBOUND_MAX_RETRIES = int(os.getenv("OUTBOUND_MAX_RETRIES", "4"))
+OUTBOUND_BACKOFF = float(os.getenv("OUTBOUND_BACKOFF", "0.5"))
+# 每個 worker 行程的每秒呼叫上限，多個 worker 時請依 LINE 配額分攤
+LINE_API_RATE = float(os.getenv("LINE_API_RATE", "1000"))
+LINE_MULTICAST_RATE = float(os.getenv("LINE_MULTICAST_RATE", "100"))
+# 回覆直接送出已序列化的訊息 JSON，不經過 SDK 的 as_json_dict / json.dumps
+LINE_RAW_REPLY = os.getenv("LINE_RAW_REPLY", "true").lower() == "true"
+dead_letters = DeadLetterStore(db)
+messenger = OutboundQueue(
+    line_bot_api,
+    dead_letters=dead_letters,
+    workers=OUTBOUND_WORKERS,
+    max_size=OUTBOUND_QUEUE_SIZE,
+    rate=LINE_API_RATE,
+    multicast_rate=LINE_MULTICAST_RATE,
+    max_retries=OUTBOUND_MAX_RETRIES,
+    backoff=OUTBOUND_BACKOFF,
+    reply=partial(reply_raw, line_bot_api) if LINE_RAW_REPLY else None
+)
+
+# 訂單即時推播 (SSE)：訂單建立與狀態變更透過行程內廣播送到各個管理畫面
+ORDER_STREAM_HEARTBEAT = float(os.getenv("ORDER_STREAM_HEARTBEAT", "15"))
+ORDER_STREAM_MAX_SECONDS = float(os.getenv("ORDER_STREAM_MAX_SECONDS", "300"))
+# 每條 SSE 連線占用一個 gthread 執行緒 (見 gunicorn.conf.py)，連線數上限必須低於執行緒數，
+# 保留 ORDER_STREAM_RESERVED_THREADS 個執行緒給 /callback，避免管理畫面占滿執行緒讓 Webhook 逾時
+WEB_THREADS = int(os.getenv("WEB_THREADS", "16"))
+ORDER_STREAM_RESERVED_THREADS = int(os.getenv("ORDER_STREAM_RESERVED_THREADS", "6"))
+ORDER_STREAM_THREAD_LIMIT = max(WEB_THREADS - ORDER_STREAM_RESERVED_THREADS, 0)
+ORDER_STREAM_MAX_CLIENTS = int(os.getenv("ORDER_STREAM_MAX_CLIENTS", str(ORDER_STREAM_THREAD_LIMIT)))
+if ORDER_STREAM_MAX_CLIENTS > ORDER_STREAM_THREAD_LIMIT:
+    logger.warning(
+        "ORDER_STREAM_MAX_CLIENTS=%d 超過 WEB_THREADS - ORDER_STREAM_RESERVED_THREADS，改為 %d",
+        ORDER_STREAM_MAX_CLIENTS, ORDER_STREAM_THREAD_LIMIT
+    )
+    ORDER_STREAM_MAX_CLIENTS = ORDER_STREAM_THREAD_LIMIT
+# 連線數已滿時管理畫面改以輪詢 /admin/api/orders 更新的間隔 (秒)
+ORDER_STREAM_POLL_SECONDS = int(os.getenv("ORDER_STREAM_POLL_SECONDS", "10"))
+order_events = OrderEventBroker(max_subscribers=ORDER_STREAM_MAX_CLIENTS)
+order_store.add_listener(order_events.publish)
+
+# 訂單狀態通知：背景合併後以 multicast / push 交給發送佇列
+NOTIFY_BATCH_WINDOW = float(os.getenv("NOTIFY_BATCH_WINDOW", "1"))
+
+# 仍可能需要通知的訂單狀態 (已完成但可能還沒取餐的訂單也算在內)
+NOTIFY_OPEN_STATUSES = ["pending", "confirmed", "preparing", "ready"]
+
+# 訂單狀態通知文字：用戶今天沒有其他進行中的訂單時省略訂單編號，內容相同的通知可合併成 multicast；
+# 有其他訂單時附上編號，讓用戶知道是哪一筆
+def format_status_notification(user_id, updates):
+    if len(updates) == 1:
+        order_id, status = updates[0]
+        today = datetime.combine(datetime.now().date(), datetime.min.time())
+        if not order_store.count_other_orders(user_id, order_id, NOTIFY_OPEN_STATUSES, today):
+            return STATUS_NOTIFICATIONS[status]
+        return f"{STATUS_NOTIFICATIONS[status]}\n訂單編號：{order_id}"
+    lines = ["📦 訂單狀態更新"]
+    for order_id, status in updates:
+        lines.append(f"訂單 {order_id}：{ORDER_STATUS[status]}")
+    return "\n".join(lines)
+
+status_notifier = StatusNotifier(
+    messenger,
+    format_status_notification,
+    batch_window=NOTIFY_BATCH_WINDOW
+)
+
+def notify_status_change(event_type, data):
+    if event_type == ORDER_STATUS_CHANGED and data["status"] in STATUS_NOTIFICATIONS:
+        status_notifier.notify(data["user_id"], data["id"], data["status"])
+
+order_store.add_listener(notify_status_change)
+
+# 訂單編號：NODE_ID 區分主機，WORKER_ID 未設定時從資料庫分配給每個 worker 行程
+NODE_ID = int(os.getenv("NODE_ID", "0"))
+WORKER_ID = os.getenv("WORKER_ID")
+worker_slots = WorkerSlots(db)
+order_id_generator = OrderIdGenerator(
+    NODE_ID,
+    (lambda: int(WORKER_ID)) if WORKER_ID else (lambda: worker_slots.claim(os.getpid(), MAX_WORKERS))
+)
+
+# 重送事件去重：記住時間窗內處理過的 webhookEventId，可選擇透過 SQLite 讓多個 worker 共用
+WEBHOOK_DEDUP_WINDOW = float(os.getenv("WEBHOOK_DEDUP_WINDOW", "3600"))
+WEBHOOK_DEDUP_MAX_SIZE = int(os.getenv("WEBHOOK_DEDUP_MAX_SIZE", "50000"))
+WEBHOOK_DEDUP_SHARED = os.getenv("WEBHOOK_DEDUP_SHARED", "true").lower() == "true"
+event_dedup = EventDeduplicator(
+    window=WEBHOOK_DEDUP_WINDOW,
+    max_size=WEBHOOK_DEDUP_MAX_SIZE,
+    shared=EventLog(db) if WEBHOOK_DEDUP_SHARED else None
+)
+
+# 菜單目錄：從資料庫載入並建立索引，菜單版本變更時自動重新載入
+MENU_CHECK_INTERVAL = float(os.getenv("MENU_CHECK_INTERVAL", "5"))
+menu_catalog = MenuCatalog(db, MENU, check_interval=MENU_CHECK_INTERVAL)
+
+# 文字指令比對：別名索引在啟動時建立，商品名稱索引隨菜單版本重建
+command_matcher = CommandMatcher(
+    COMMAND_ALIASES,
+    prefixes=COMMAND_PREFIXES,
+    menu_items=menu_catalog.get_items,
+    menu_version=menu_catalog.current_version,
+    max_quantity=TEXT_ORDER_MAX_QUANTITY
+)
+
+# 菜單全文搜尋：商品名稱與描述的 n-gram 索引，菜單版本變更時只更新有異動的商品
+MENU_SEARCH_API_MAX_LIMIT = 50
+menu_search = MenuSearchIndex(menu_catalog.get_items, menu_catalog.current_version)
+
+# 已序列化的菜單訊息快取，隨菜單版本失效
+menu_render_cache = MenuRenderCache(menu_catalog.current_version)
+
+# 內容固定的訊息，啟動時預先建立並序列化，所有請求共用
+static_messages = StaticMessages()
 
 # 生成唯一訂單ID
 def generate_order_id():
-    return datetime.now().strftime("%Y%m%d") + str(uuid.uuid4().int)[:6]
+    return order_id_generator.next_id()
 
-# 創建快速回覆按鈕 - 優化版
+# 創建快速回覆按鈕 - 優化版 (內容固定，只建立一次)
+@lru_cache(maxsize=None)
 def create_quick_reply():
     items = [
         QuickReplyButton(action=PostbackAction(label="📋 查看菜單", data="action=view_categories")),
@@ -104,23 +354,49 @@ def create_quick_reply():
     ]
     return QuickReply(items=items)
 
+# 快速回覆按鈕的 JSON，供訊息骨架直接引用
+QUICK_REPLY = create_quick_reply().as_json_dict()
+
+# 內容固定的文字訊息
+static_messages.register("empty_cart", lambda: TextSendMessage(
+    text="🛒 您的購物車是空的\n快去選購美味的餐點吧！",
+    quick_reply=create_quick_reply()
+))
+static_messages.register("empty_cart_checkout", lambda: TextSendMessage(
+    text="🛒 您的購物車是空的，無法建立訂單\n快去選購美味的餐點吧！",
+    quick_reply=create_quick_reply()
+))
+static_messages.register("nothing_to_checkout", lambda: TextSendMessage(
+    text="🛒 您目前沒有訂單可以結帳\n快去選購美味的餐點吧！",
+    quick_reply=create_quick_reply()
+))
+static_messages.register("cart_changed", lambda: TextSendMessage(
+    text="🛒 購物車內容已變更\n請重新確認訂單後再結帳",
+    quick_reply=QuickReply(items=[
+        QuickReplyButton(action=PostbackAction(label="✅ 重新確認", data="action=confirm_order")),
+        QuickReplyButton(action=PostbackAction(label="🛒 購物車", data="action=view_cart"))
+    ])
+))
+static_messages.register("search_hint", lambda: TextSendMessage(
+    text="🔍 請在「搜尋」後輸入想找的餐點\n例如：搜尋 漢堡",
+    quick_reply=create_quick_reply()
+))
+static_messages.register("cart_cleared", lambda: TextSendMessage(
+    text="🗑️ 購物車已清空\n快去選購美味的餐點吧！",
+    quick_reply=create_quick_reply()
+))
+
 # 創建分類選單 - 優化版
+@FLEX_BUILD_SECONDS.time("categories")
 def create_categories_menu():
     columns = []
     
-    categories = [
-        {"id": "recommended", "name": "🔥 推薦餐點", "image": "https://images.unsplash.com/photo-1514933651103-005eec06c04b?w=1024&h=1024&fit=crop"},
-        {"id": "main", "name": "🍔 主餐", "image": "https://images.unsplash.com/photo-1571091718767-18b5b1457add?w=1024&h=1024&fit=crop"},
-        {"id": "side", "name": "🍟 副餐", "image": "https://images.unsplash.com/photo-1573080496219-bb080dd4f877?w=1024&h=1024&fit=crop"},
-        {"id": "drink", "name": "🥤 飲料", "image": "https://images.unsplash.com/photo-1544145945-f90425340c7e?w=1024&h=1024&fit=crop"}
-    ]
-    
-    for category in categories:
+    for category in menu_catalog.menu.values():
         column = ImageCarouselColumn(
             image_url=category["image"],
             action=PostbackAction(
                 label=category["name"],
-                data=f"action=view_menu&category={category['id']}"
+                data=postback_data("view_menu", category=category["id"])
             )
         )
         columns.append(column)
@@ -130,1153 +406,859 @@ def create_categories_menu():
         template=ImageCarouselTemplate(columns=columns)
     )
 
+# 菜單商品 bubble，分類菜單與搜尋結果共用
+MENU_ITEM_BUBBLE = {
+    "type": "bubble",
+    "size": "kilo",
+    "hero": {
+        "type": "image",
+        "url": Slot("image"),
+        "size": "full",
+        "aspectRatio": "4:3",
+        "aspectMode": "cover",
+        "animated": False
+    },
+    "body": {
+        "type": "box",
+        "layout": "vertical",
+        "spacing": "sm",
+        "contents": [
+            {"type": "text", "text": Slot("name"), "margin": "md", "size": "xl", "wrap": True, "weight": "bold", "color": "#2c3e50"},
+            {"type": "text", "text": Slot("desc"), "margin": "sm", "size": "md", "wrap": True, "color": "#7f8c8d"},
+            {
+                "type": "box",
+                "layout": "baseline",
+                "margin": "lg",
+                "contents": [
+                    {"type": "text", "text": "NT$", "flex": 0, "size": "md", "color": "#e74c3c"},
+                    {"type": "text", "text": Slot("price"), "flex": 0, "margin": "sm", "size": "xxl", "weight": "bold", "color": "#e74c3c"}
+                ]
+            }
+        ]
+    },
+    "footer": {
+        "type": "box",
+        "layout": "vertical",
+        "contents": [
+            postback_button("🛒 加入購物車", Slot("data"), "primary", color="#e74c3c")
+        ]
+    },
+    "styles": {
+        "body": {"backgroundColor": "#ffffff"},
+        "footer": {"backgroundColor": "#f8f9fa"}
+    }
+}
+
+MENU_PAGE = {
+    "type": "flex",
+    "altText": Slot("alt_text"),
+    "contents": {
+        "type": "carousel",
+        "contents": [Repeat("items", MENU_ITEM_BUBBLE)]
+    }
+}
+MENU_PAGE_TEMPLATE = FlexTemplate(MENU_PAGE)
+# 快速回覆只會顯示在最後一則訊息
+MENU_LAST_PAGE_TEMPLATE = FlexTemplate(dict(MENU_PAGE, quickReply=QUICK_REPLY))
+
+# 每個 carousel 最多 10 個 bubble (LINE限制)
+CAROUSEL_MAX_BUBBLES = 10
+
+def menu_item_values(item):
+    return {
+        "image": item["image"],
+        "name": item["name"],
+        "desc": item["desc"],
+        "price": str(item["price"]),
+        "data": postback_data("add_to_cart", category=item["category"], item=item["name"])
+    }
+
+# 將商品分成每10個一組，回傳菜單訊息列表
+def menu_pages(alt_text, items):
+    values = [menu_item_values(item) for item in items]
+    pages = []
+    for i in range(0, len(values), CAROUSEL_MAX_BUBBLES):
+        last = i + CAROUSEL_MAX_BUBBLES >= len(values)
+        template = MENU_LAST_PAGE_TEMPLATE if last else MENU_PAGE_TEMPLATE
+        pages.append(template.message({"alt_text": alt_text, "items": values[i:i + CAROUSEL_MAX_BUBBLES]}))
+    return pages
+
 # 創建分類菜單 - 大幅優化UI版本
+@FLEX_BUILD_SECONDS.time("menu")
 def create_menu_template(category_id):
-    if category_id not in MENU:
+    category = menu_catalog.get_category(category_id)
+    if category is None:
         return None
-        
-    category = MENU[category_id]
-    bubbles = []
-    
-    for item_name, item_data in category["items"].items():
-        bubble = BubbleContainer(
-            size="kilo",
-            hero=ImageComponent(
-                url=item_data["image"],
-                size="full",
-                aspect_mode="cover",
-                aspect_ratio="4:3"
-            ),
-            body=BoxComponent(
-                layout="vertical",
-                contents=[
-                    TextComponent(
-                        text=item_data["name"],
-                        weight="bold",
-                        size="xl",
-                        wrap=True,
-                        color="#2c3e50",
-                        margin="md"
-                    ),
-                    TextComponent(
-                        text=item_data["desc"],
-                        size="md",
-                        color="#7f8c8d",
-                        wrap=True,
-                        margin="sm"
-                    ),
-                    BoxComponent(
-                        layout="baseline",
-                        margin="lg",
-                        contents=[
-                            TextComponent(
-                                text="NT$",
-                                size="md",
-                                color="#e74c3c",
-                                flex=0
-                            ),
-                            TextComponent(
-                                text=str(item_data['price']),
-                                size="xxl",
-                                weight="bold",
-                                color="#e74c3c",
-                                flex=0,
-                                margin="sm"
-                            )
-                        ]
-                    )
-                ],
-                spacing="sm",
-                paddingAll="20px"
-            ),
-            footer=BoxComponent(
-                layout="vertical",
-                contents=[
-                    ButtonComponent(
-                        style="primary",
-                        color="#e74c3c",
-                        height="md",
-                        action=PostbackAction(
-                            label="🛒 加入購物車",
-                            data=f"action=add_to_cart&category={category_id}&item={item_name}"
-                        )
-                    )
-                ],
-                paddingAll="20px"
-            ),
-            styles={
+    return menu_pages(f"{category['name']} 菜單", category["items"].values())
+
+# 取得快取的分類選單
+def get_categories_menu():
+    return menu_render_cache.get("categories", create_categories_menu)
+
+# 取得快取的分類菜單
+def get_menu_messages(category_id):
+    if menu_catalog.get_category(category_id) is None:
+        return None
+    return menu_render_cache.get(
+        ("menu", category_id),
+        lambda: create_menu_template(category_id)
+    )
+
+# 查看購物車 - 優化版
+# 以下訊息骨架與原本用 SDK 元件建立的 JSON 相同；SDK 會略過 paddingAll 等 camelCase 參數，骨架中也不含這些欄位
+CART_TEMPLATE = FlexTemplate({
+    "type": "flex",
+    "altText": "🛒 購物車內容",
+    "contents": {
+        "type": "bubble",
+        "body": {
+            "type": "box",
+            "layout": "vertical",
+            "contents": [
+                # 標題
+                {"type": "text", "text": "🛒 購物車", "weight": "bold", "size": "xxl", "color": "#e74c3c", "align": "center"},
+                {"type": "separator", "margin": "xl", "color": "#ecf0f1"},
+
+                # 商品列表
+                {
+                    "type": "box",
+                    "layout": "vertical",
+                    "margin": "xl",
+                    "spacing": "md",
+                    "contents": [Repeat("lines", {
+                        "type": "box",
+                        "layout": "vertical",
+                        "contents": [
+                            {
+                                "type": "box",
+                                "layout": "baseline",
+                                "contents": [
+                                    {"type": "text", "text": Slot("name"), "size": "lg", "weight": "bold", "color": "#2c3e50", "flex": 4},
+                                    {"type": "text", "text": Slot("quantity"), "size": "md", "color": "#7f8c8d", "flex": 1, "align": "end"}
+                                ]
+                            },
+                            {
+                                "type": "box",
+                                "layout": "baseline",
+                                "contents": [
+                                    {"type": "text", "text": Slot("price"), "size": "sm", "color": "#95a5a6", "flex": 3},
+                                    {"type": "text", "text": Slot("subtotal"), "size": "md", "weight": "bold", "color": "#e74c3c", "flex": 1, "align": "end"}
+                                ],
+                                "margin": "xs"
+                            }
+                        ],
+                        "margin": "md"
+                    })]
+                },
+
+                # 總計
+                {"type": "separator", "margin": "xl", "color": "#ecf0f1"},
+                {
+                    "type": "box",
+                    "layout": "baseline",
+                    "margin": "xl",
+                    "contents": [
+                        {"type": "text", "text": "總金額", "size": "xl", "color": "#2c3e50", "weight": "bold", "flex": 2},
+                        {"type": "text", "text": Slot("total"), "size": "xxl", "color": "#e74c3c", "weight": "bold", "flex": 2, "align": "end"}
+                    ]
+                }
+            ]
+        },
+        "footer": {
+            "type": "box",
+            "layout": "vertical",
+            "spacing": "md",
+            "contents": [
+                postback_button("✅ 確認訂單", "action=confirm_order", "primary", color="#27ae60"),
+                postback_button("✏️ 編輯購物車", "action=edit_cart"),
+                postback_button("⬅️ 繼續點餐", "action=view_categories")
+            ]
+        }
+    }
+})
+
+@FLEX_BUILD_SECONDS.time("cart")
+def view_cart(user_id):
+    cart = cart_store.get(user_id)
+    if not cart:
+        return static_messages.get("empty_cart")
+    return cart_message(cart)
+
+# 購物車訊息：依購物車內容填入骨架
+def cart_message(cart):
+    return CART_TEMPLATE.message({
+        "lines": [
+            {
+                "name": f"{idx}. {line.name}",
+                "quantity": f"x{line.quantity}",
+                "price": f"單價 ${line.price}",
+                "subtotal": f"${line.subtotal}"
+            }
+            for idx, line in enumerate(cart.lines.values(), 1)
+        ],
+        "total": f"NT$ {cart.total}"
+    })
+
+# 編輯購物車選單
+EDIT_CART_TEMPLATE = FlexTemplate({
+    "type": "flex",
+    "altText": "✏️ 編輯購物車",
+    "contents": {
+        "type": "carousel",
+        "contents": [
+            Repeat("lines", {
+                "type": "bubble",
+                "size": "kilo",
+                "body": {
+                    "type": "box",
+                    "layout": "vertical",
+                    "contents": [
+                        {"type": "text", "text": Slot("name"), "weight": "bold", "size": "lg", "color": "#2c3e50"},
+                        {
+                            "type": "box",
+                            "layout": "baseline",
+                            "margin": "md",
+                            "contents": [
+                                {"type": "text", "text": Slot("quantity"), "size": "md", "color": "#7f8c8d", "flex": 2},
+                                {"type": "text", "text": Slot("subtotal"), "size": "lg", "weight": "bold", "color": "#e74c3c", "flex": 1, "align": "end"}
+                            ]
+                        }
+                    ]
+                },
+                "footer": {
+                    "type": "box",
+                    "layout": "vertical",
+                    "spacing": "sm",
+                    "contents": [
+                        {
+                            "type": "box",
+                            "layout": "horizontal",
+                            "spacing": "sm",
+                            "contents": [
+                                postback_button("➖", Slot("decrease"), height="sm", flex=1),
+                                postback_button("➕", Slot("increase"), height="sm", flex=1)
+                            ]
+                        },
+                        postback_button("🗑️ 移除", Slot("remove"), color="#e74c3c", height="sm")
+                    ]
+                }
+            }),
+
+            # 完成編輯按鈕
+            {
+                "type": "bubble",
                 "body": {
-                    "backgroundColor": "#ffffff"
+                    "type": "box",
+                    "layout": "vertical",
+                    "contents": [
+                        {"type": "text", "text": "✅ 編輯完成", "weight": "bold", "size": "xl", "color": "#27ae60", "align": "center"},
+                        {"type": "text", "text": "點擊下方按鈕完成編輯", "size": "md", "color": "#7f8c8d", "align": "center", "margin": "md"}
+                    ]
                 },
                 "footer": {
-                    "backgroundColor": "#f8f9fa"
+                    "type": "box",
+                    "layout": "vertical",
+                    "spacing": "md",
+                    "contents": [
+                        postback_button("🛒 查看購物車", "action=view_cart", "primary", color="#3498db"),
+                        postback_button("⬅️ 繼續點餐", "action=view_categories")
+                    ]
                 }
             }
-        )
-        bubbles.append(bubble)
+        ]
+    }
+})
+
+@FLEX_BUILD_SECONDS.time("edit_cart")
+def create_edit_cart_menu(user_id):
+    """創建編輯購物車選單"""
+    cart = cart_store.get(user_id)
+    if not cart:
+        return static_messages.get("empty_cart")
+    return edit_cart_message(cart)
+
+def edit_cart_message(cart):
+    return EDIT_CART_TEMPLATE.message({
+        "lines": [
+            {
+                "name": line.name,
+                "quantity": f"數量: {line.quantity}",
+                "subtotal": f"${line.subtotal}",
+                "decrease": postback_data("decrease_item", item_id=line.item_id),
+                "increase": postback_data("increase_item", item_id=line.item_id),
+                "remove": postback_data("remove_item", item_id=line.item_id)
+            }
+            for line in cart.lines.values()
+        ]
+    })
+
+def modify_cart_item(user_id, item_id, action_type):
+    """修改購物車商品數量或移除商品"""
+    if item_id is None:
+        return None, "操作失敗，請重試"
     
-    # 將商品分成每10個一組 (LINE限制)
-    flex_messages = []
-    for i in range(0, len(bubbles), 10):
-        carousel = {
-            "type": "carousel",
-            "contents": bubbles[i:i+10]
-        }
+    if action_type == "increase":
+        line = cart_store.change_quantity(user_id, item_id, 1)
+        if line is None:
+            return None, "找不到該商品"
+        return "success", f"✅ {line.name} 數量已增加到 {line.quantity}"
         
-        flex_message = FlexSendMessage(
-            alt_text=f"{category['name']} 菜單",
-            contents=carousel
-        )
-        flex_messages.append(flex_message)
+    elif action_type == "decrease":
+        # 數量為1時，直接移除
+        line = cart_store.change_quantity(user_id, item_id, -1)
+        if line is None:
+            return None, "找不到該商品"
+        if line.quantity == 0:
+            return "removed", f"🗑️ {line.name} 已從購物車移除"
+        return "success", f"✅ {line.name} 數量已減少到 {line.quantity}"
+        
+    elif action_type == "remove":
+        line = cart_store.remove_item(user_id, item_id)
+        if line is None:
+            return None, "找不到該商品"
+        return "removed", f"🗑️ {line.name} 已從購物車移除"
     
-    return flex_messages
+    return None, "操作失敗，請重試"
 
-# 查看購物車 - 優化版
-def view_cart(user_id):
-    if user_id not in user_carts or not user_carts[user_id]["items"]:
-        return TextSendMessage(
-            text="🛒 您的購物車是空的\n快去選購美味的餐點吧！",
-            quick_reply=create_quick_reply()
-        )
+@static_messages.register("clear_cart_confirmation")
+@FLEX_BUILD_SECONDS.time("clear_cart_confirmation")
+def create_clear_cart_confirmation():
+    """創建清空購物車確認對話框"""
+    confirm_template = ConfirmTemplate(
+        text="確定要清空購物車嗎？\n此操作無法復原",
+        actions=[
+            PostbackAction(
+                label="✅ 確定清空",
+                data="action=clear_cart_confirm"
+            ),
+            PostbackAction(
+                label="❌ 取消",
+                data="action=view_cart"
+            )
+        ]
+    )
     
-    cart = user_carts[user_id]
-    total = 0
-    item_components = []
+    return TemplateSendMessage(
+        alt_text="清空購物車確認",
+        template=confirm_template
+    )
+
+def reply_cart_modification(event, user_id, item_id, action_type):
+    """修改購物車後重新顯示編輯選單"""
+    result, message = modify_cart_item(user_id, item_id, action_type)
     
-    for idx, item in enumerate(cart["items"], 1):
-        item_total = item["price"] * item["quantity"]
-        total += item_total
-        
-        item_box = BoxComponent(
-            layout="vertical",
-            contents=[
-                BoxComponent(
-                    layout="baseline",
-                    contents=[
-                        TextComponent(
-                            text=f"{idx}. {item['name']}",
-                            size="lg",
-                            weight="bold",
-                            color="#2c3e50",
-                            flex=4
-                        ),
-                        TextComponent(
-                            text=f"x{item['quantity']}",
-                            size="md",
-                            color="#7f8c8d",
-                            flex=1,
-                            align="end"
-                        )
-                    ]
-                ),
-                BoxComponent(
-                    layout="baseline",
-                    contents=[
-                        TextComponent(
-                            text=f"單價 ${item['price']}",
-                            size="sm",
-                            color="#95a5a6",
-                            flex=3
-                        ),
-                        TextComponent(
-                            text=f"${item_total}",
-                            size="md",
-                            weight="bold",
-                            color="#e74c3c",
-                            flex=1,
-                            align="end"
-                        )
-                    ],
-                    margin="xs"
-                )
-            ],
-            margin="md",
-            paddingAll="12px",
-            backgroundColor="#f8f9fa",
-            cornerRadius="8px"
+    if result in ["success", "removed"]:
+        reply_message = create_edit_cart_menu(user_id)
+        messenger.reply_message(event.reply_token, reply_message)
+    else:
+        messenger.reply_message(
+            event.reply_token,
+            TextSendMessage(text=f"❌ {message}")
         )
-        item_components.append(item_box)
-    
-    bubble = BubbleContainer(
-        body=BoxComponent(
-            layout="vertical",
-            contents=[
+
+# 購物車編輯相關動作
+@postback_router.route("edit_cart")
+def handle_edit_cart(event, user_id):
+    reply_message = create_edit_cart_menu(user_id)
+    messenger.reply_message(event.reply_token, reply_message)
+
+@postback_router.route("increase_item", item_id=int)
+def handle_increase_item(event, user_id, item_id):
+    reply_cart_modification(event, user_id, item_id, "increase")
+
+@postback_router.route("decrease_item", item_id=int)
+def handle_decrease_item(event, user_id, item_id):
+    reply_cart_modification(event, user_id, item_id, "decrease")
+
+@postback_router.route("remove_item", item_id=int)
+def handle_remove_item(event, user_id, item_id):
+    reply_cart_modification(event, user_id, item_id, "remove")
+
+@postback_router.route("clear_cart")
+def handle_clear_cart(event, user_id):
+    messenger.reply_message(event.reply_token, static_messages.get("clear_cart_confirmation"))
+
+@postback_router.route("clear_cart_confirm")
+def handle_clear_cart_confirm(event, user_id):
+    cart_store.clear(user_id)
+    messenger.reply_message(event.reply_token, static_messages.get("cart_cleared"))
+
+# 確認訂單模板 - 優化版
+ORDER_CONFIRMATION_TEMPLATE = FlexTemplate({
+    "type": "flex",
+    "altText": "✅ 訂單確認",
+    "contents": {
+        "type": "bubble",
+        "body": {
+            "type": "box",
+            "layout": "vertical",
+            "contents": [
                 # 標題
-                TextComponent(
-                    text="🛒 購物車",
-                    weight="bold",
-                    size="xxl",
-                    color="#e74c3c",
-                    align="center"
-                ),
-                SeparatorComponent(margin="xl", color="#ecf0f1"),
-                
+                {"type": "text", "text": "✅ 訂單確認", "weight": "bold", "size": "xxl", "color": "#27ae60", "align": "center"},
+
+                # 訂單編號
+                {
+                    "type": "box",
+                    "layout": "vertical",
+                    "margin": "xl",
+                    "contents": [
+                        {"type": "text", "text": "訂單編號", "size": "sm", "color": "#7f8c8d"},
+                        {"type": "text", "text": Slot("order_id"), "size": "lg", "weight": "bold", "color": "#2c3e50", "margin": "xs"}
+                    ]
+                },
+
+                {"type": "separator", "margin": "xl", "color": "#ecf0f1"},
+
+                # 商品列表標題
+                {"type": "text", "text": "📋 訂單內容", "size": "lg", "weight": "bold", "color": "#2c3e50", "margin": "xl"},
+
                 # 商品列表
-                BoxComponent(
-                    layout="vertical",
-                    margin="xl",
-                    spacing="md",
-                    contents=item_components
-                ),
-                
+                {
+                    "type": "box",
+                    "layout": "vertical",
+                    "margin": "md",
+                    "spacing": "sm",
+                    "contents": [Repeat("lines", {
+                        "type": "box",
+                        "layout": "baseline",
+                        "contents": [
+                            {"type": "text", "text": Slot("name"), "size": "md", "color": "#2c3e50", "flex": 3},
+                            {"type": "text", "text": Slot("subtotal"), "size": "md", "weight": "bold", "color": "#e74c3c", "flex": 1, "align": "end"}
+                        ],
+                        "margin": "sm"
+                    })]
+                },
+
                 # 總計
-                SeparatorComponent(margin="xl", color="#ecf0f1"),
-                BoxComponent(
-                    layout="baseline",
-                    margin="xl",
-                    contents=[
-                        TextComponent(
-                            text="總金額",
-                            size="xl",
-                            color="#2c3e50",
-                            weight="bold",
-                            flex=2
-                        ),
-                        TextComponent(
-                            text=f"NT$ {total}",
-                            size="xxl",
-                            color="#e74c3c",
-                            weight="bold",
-                            flex=2,
-                            align="end"
-                        )
+                {"type": "separator", "margin": "xl", "color": "#ecf0f1"},
+                {
+                    "type": "box",
+                    "layout": "baseline",
+                    "margin": "xl",
+                    "contents": [
+                        {"type": "text", "text": "總金額", "size": "xl", "color": "#2c3e50", "weight": "bold", "flex": 2},
+                        {"type": "text", "text": Slot("total"), "size": "xxl", "color": "#e74c3c", "weight": "bold", "flex": 2, "align": "end"}
                     ]
-                )
-            ],
-            paddingAll="20px"
-        ),
-        footer=BoxComponent(
-            layout="vertical",
-            spacing="md",
-            contents=[
-                ButtonComponent(
-                    style="primary",
-                    color="#27ae60",
-                    height="md",
-                    action=PostbackAction(
-                        label="✅ 確認訂單",
-                        data="action=confirm_order"
-                    )
-                ),
-                ButtonComponent(
-                    style="secondary",
-                    height="md",
-                    action=PostbackAction(
-                        label="✏️ 編輯購物車",
-                        data="action=edit_cart"
-                    )
-                ),
-                ButtonComponent(
-                    style="secondary",
-                    height="md",
-                    action=PostbackAction(
-                        label="⬅️ 繼續點餐",
-                        data="action=view_categories"
-                    )
-                )
-            ],
-            paddingAll="20px"
-        )
-    )
+                }
+            ]
+        },
+        "footer": {
+            "type": "box",
+            "layout": "vertical",
+            "spacing": "md",
+            "contents": [
+                postback_button("💳 確認付款", Slot("checkout"), "primary", color="#27ae60"),
+                postback_button("✏️ 修改訂單", "action=edit_cart")
+            ]
+        }
+    }
+})
+
+@FLEX_BUILD_SECONDS.time("order_confirmation")
+def create_order_confirmation(user_id):
+    cart = cart_store.get(user_id)
+    if not cart:
+        return None
+    return order_confirmation_message(cart, generate_order_id())
+
+def order_confirmation_message(cart, order_id):
+    return ORDER_CONFIRMATION_TEMPLATE.message({
+        "order_id": order_id,
+        "lines": [
+            {"name": f"{line.name} x{line.quantity}", "subtotal": f"${line.subtotal}"}
+            for line in cart.lines.values()
+        ],
+        "total": f"NT$ {cart.total}",
+        "checkout": postback_data("checkout", order_id=order_id, version=cart.version)
+    })
+
+# 首頁
+@app.route("/")
+def index():
+    return render_template("index.html", menu=menu_catalog.menu)
+
+# 訂單統計數據：總訂單、今日訂單、待處理訂單
+def order_counts():
+    return {
+        "orders_count": order_store.count(),
+        "today_orders": order_store.count_on(datetime.now().date()),
+        "pending_orders": order_store.count_by_status(["pending", "confirmed"])
+    }
+
+# 管理後台權限：未登入時頁面導向登入畫面、API 回應 401；
+# 會改變資料的請求另外比對 X-CSRF-Token 標頭與 session 中的 csrf_token
+def admin_required(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if "admin_user" not in session:
+            if request.path.startswith("/admin/api/"):
+                return jsonify({"error": "請先登入管理後台"}), 401
+            return redirect(url_for("admin_login"))
+        if request.method not in ("GET", "HEAD", "OPTIONS"):
+            token = request.headers.get("X-CSRF-Token", "")
+            if not hmac.compare_digest(token, session.get("csrf_token", "")):
+                return jsonify({"error": "CSRF token 錯誤"}), 403
+        return view(*args, **kwargs)
+    return wrapper
+
+# 管理後台登入
+@app.route("/admin/login", methods=["GET", "POST"])
+def admin_login():
+    if request.method == "GET":
+        return render_template("admin_login.html")
     
-    return FlexSendMessage(
-        alt_text="🛒 購物車內容",
-        contents=bubble
-    )
+    username = request.form.get("username", "")
+    role = admin_users.authenticate(username, request.form.get("password", ""))
+    if role is None:
+        return render_template("admin_login.html", error="帳號或密碼錯誤"), 401
+    session.clear()
+    session["admin_user"] = username
+    session["admin_role"] = role
+    session["csrf_token"] = secrets.token_urlsafe(32)
+    return redirect(url_for("admin"))
 
-def create_edit_cart_menu(user_id):
-    """創建編輯購物車選單"""
-    if user_id not in user_carts or not user_carts[user_id]["items"]:
-        return TextSendMessage(
-            text="🛒 您的購物車是空的\n快去選購美味的餐點吧！",
-            quick_reply=create_quick_reply()
-        )
-    
-    cart = user_carts[user_id]
-    bubbles = []
-    
-    for idx, item in enumerate(cart["items"]):
-        item_total = item["price"] * item["quantity"]
-        
-        bubble = BubbleContainer(
-            size="kilo",
-            body=BoxComponent(
-                layout="vertical",
-                contents=[
-                    TextComponent(
-                        text=item["name"],
-                        weight="bold",
-                        size="lg",
-                        color="#2c3e50"
-                    ),
-                    BoxComponent(
-                        layout="baseline",
-                        margin="md",
-                        contents=[
-                            TextComponent(
-                                text=f"數量: {item['quantity']}",
-                                size="md",
-                                color="#7f8c8d",
-                                flex=2
-                            ),
-                            TextComponent(
-                                text=f"${item_total}",
-                                size="lg",
-                                weight="bold",
-                                color="#e74c3c",
-                                flex=1,
-                                align="end"
-                            )
-                        ]
-                    )
-                ],
-                paddingAll="20px"
-            ),
-            footer=BoxComponent(
-                layout="vertical",
-                spacing="sm",
-                contents=[
-                    BoxComponent(
-                        layout="horizontal",
-                        spacing="sm",
-                        contents=[
-                            ButtonComponent(
-                                style="secondary",
-                                height="sm",
-                                action=PostbackAction(
-                                    label="➖",
-                                    data=f"action=decrease_item&item_index={idx}"
-                                ),
-                                flex=1
-                            ),
-                            ButtonComponent(
-                                style="secondary",
-                                height="sm",
-                                action=PostbackAction(
-                                    label="➕",
-                                    data=f"action=increase_item&item_index={idx}"
-                                ),
-                                flex=1
-                            )
-                        ]
-                    ),
-                    ButtonComponent(
-                        style="secondary",
-                        color="#e74c3c",
-                        height="sm",
-                        action=PostbackAction(
-                            label="🗑️ 移除",
-                            data=f"action=remove_item&item_index={idx}"
-                        )
-                    )
-                ],
-                paddingAll="20px"
-            )
-        )
-        bubbles.append(bubble)
-    
-    # 添加完成編輯按鈕
-    finish_bubble = BubbleContainer(
-        body=BoxComponent(
-            layout="vertical",
-            contents=[
-                TextComponent(
-                    text="✅ 編輯完成",
-                    weight="bold",
-                    size="xl",
-                    color="#27ae60",
-                    align="center"
-                ),
-                TextComponent(
-                    text="點擊下方按鈕完成編輯",
-                    size="md",
-                    color="#7f8c8d",
-                    align="center",
-                    margin="md"
-                )
-            ],
-            paddingAll="20px"
-        ),
-        footer=BoxComponent(
-            layout="vertical",
-            spacing="md",
-            contents=[
-                ButtonComponent(
-                    style="primary",
-                    color="#3498db",
-                    height="md",
-                    action=PostbackAction(
-                        label="🛒 查看購物車",
-                        data="action=view_cart"
-                    )
-                ),
-                ButtonComponent(
-                    style="secondary",
-                    height="md",
-                    action=PostbackAction(
-                        label="⬅️ 繼續點餐",
-                        data="action=view_categories"
-                    )
-                )
-            ],
-            paddingAll="20px"
-        )
-    )
-    bubbles.append(finish_bubble)
-    
-    return FlexSendMessage(
-        alt_text="✏️ 編輯購物車",
-        contents={
-            "type": "carousel",
-            "contents": bubbles
-        }
-    )
-
-def modify_cart_item(user_id, item_index, action_type):
-    """修改購物車商品數量或移除商品"""
-    if user_id not in user_carts or not user_carts[user_id]["items"]:
-        return None, "購物車是空的"
-    
-    cart = user_carts[user_id]
-    
-    try:
-        item_index = int(item_index)
-        if item_index < 0 or item_index >= len(cart["items"]):
-            return None, "找不到該商品"
-        
-        item = cart["items"][item_index]
-        item_name = item["name"]
-        
-        if action_type == "increase":
-            item["quantity"] += 1
-            cart["updated_at"] = datetime.now().isoformat()
-            return "success", f"✅ {item_name} 數量已增加到 {item['quantity']}"
-            
-        elif action_type == "decrease":
-            if item["quantity"] > 1:
-                item["quantity"] -= 1
-                cart["updated_at"] = datetime.now().isoformat()
-                return "success", f"✅ {item_name} 數量已減少到 {item['quantity']}"
-            else:
-                # 數量為1時，直接移除
-                cart["items"].pop(item_index)
-                cart["updated_at"] = datetime.now().isoformat()
-                return "removed", f"🗑️ {item_name} 已從購物車移除"
-                
-        elif action_type == "remove":
-            cart["items"].pop(item_index)
-            cart["updated_at"] = datetime.now().isoformat()
-            return "removed", f"🗑️ {item_name} 已從購物車移除"
-            
-    except (ValueError, IndexError):
-        return None, "操作失敗，請重試"
-
-def create_clear_cart_confirmation():
-    """創建清空購物車確認對話框"""
-    confirm_template = ConfirmTemplate(
-        text="確定要清空購物車嗎？\n此操作無法復原",
-        actions=[
-            PostbackAction(
-                label="✅ 確定清空",
-                data="action=clear_cart_confirm"
-            ),
-            PostbackAction(
-                label="❌ 取消",
-                data="action=view_cart"
-            )
-        ]
-    )
-    
-    return TemplateSendMessage(
-        alt_text="清空購物車確認",
-        template=confirm_template
-    )
-
-def handle_cart_editing_actions(event, user_id, data_dict):
-    """處理購物車編輯相關動作"""
-    action = data_dict.get('action', '')
-    
-    if action == 'edit_cart':
-        reply_message = create_edit_cart_menu(user_id)
-        line_bot_api.reply_message(event.reply_token, reply_message)
-        
-    elif action == 'increase_item':
-        item_index = data_dict.get('item_index', '')
-        result, message = modify_cart_item(user_id, item_index, "increase")
-        
-        if result == "success":
-            # 重新顯示編輯選單
-            reply_message = create_edit_cart_menu(user_id)
-            line_bot_api.reply_message(event.reply_token, reply_message)
-        else:
-            line_bot_api.reply_message(
-                event.reply_token,
-                TextSendMessage(text=f"❌ {message}")
-            )
-            
-    elif action == 'decrease_item':
-        item_index = data_dict.get('item_index', '')
-        result, message = modify_cart_item(user_id, item_index, "decrease")
-        
-        if result in ["success", "removed"]:
-            # 重新顯示編輯選單
-            reply_message = create_edit_cart_menu(user_id)
-            line_bot_api.reply_message(event.reply_token, reply_message)
-        else:
-            line_bot_api.reply_message(
-                event.reply_token,
-                TextSendMessage(text=f"❌ {message}")
-            )
-            
-    elif action == 'remove_item':
-        item_index = data_dict.get('item_index', '')
-        result, message = modify_cart_item(user_id, item_index, "remove")
-        
-        if result == "removed":
-            # 重新顯示編輯選單
-            reply_message = create_edit_cart_menu(user_id)
-            line_bot_api.reply_message(event.reply_token, reply_message)
-        else:
-            line_bot_api.reply_message(
-                event.reply_token,
-                TextSendMessage(text=f"❌ {message}")
-            )
-            
-    elif action == 'clear_cart':
-        reply_message = create_clear_cart_confirmation()
-        line_bot_api.reply_message(event.reply_token, reply_message)
-        
-    elif action == 'clear_cart_confirm':
-        if user_id in user_carts:
-            user_carts[user_id]["items"] = []
-            user_carts[user_id]["updated_at"] = datetime.now().isoformat()
-        
-        success_message = TextSendMessage(
-            text="🗑️ 購物車已清空\n快去選購美味的餐點吧！",
-            quick_reply=create_quick_reply()
-        )
-        line_bot_api.reply_message(event.reply_token, success_message)
-
-# 確認訂單模板 - 優化版
-def create_order_confirmation(user_id):
-    if user_id not in user_carts or not user_carts[user_id]["items"]:
-        return None
-        
-    cart = user_carts[user_id]
-    total = 0
-    item_components = []
-    
-    for item in cart["items"]:
-        item_total = item["price"] * item["quantity"]
-        total += item_total
-        
-        item_box = BoxComponent(
-            layout="baseline",
-            contents=[
-                TextComponent(
-                    text=f"{item['name']} x{item['quantity']}",
-                    size="md",
-                    color="#2c3e50",
-                    flex=3
-                ),
-                TextComponent(
-                    text=f"${item_total}",
-                    size="md",
-                    weight="bold",
-                    color="#e74c3c",
-                    flex=1,
-                    align="end"
-                )
-            ],
-            margin="sm"
-        )
-        item_components.append(item_box)
-    
-    order_id = generate_order_id()
-    
-    bubble = BubbleContainer(
-        body=BoxComponent(
-            layout="vertical",
-            contents=[
-                # 標題
-                TextComponent(
-                    text="✅ 訂單確認",
-                    weight="bold",
-                    size="xxl",
-                    color="#27ae60",
-                    align="center"
-                ),
-                
-                # 訂單編號
-                BoxComponent(
-                    layout="vertical",
-                    margin="xl",
-                    contents=[
-                        TextComponent(
-                            text="訂單編號",
-                            size="sm",
-                            color="#7f8c8d"
-                        ),
-                        TextComponent(
-                            text=order_id,
-                            size="lg",
-                            weight="bold",
-                            color="#2c3e50",
-                            margin="xs"
-                        )
-                    ],
-                    paddingAll="12px",
-                    backgroundColor="#e8f5e8",
-                    cornerRadius="8px"
-                ),
-                
-                SeparatorComponent(margin="xl", color="#ecf0f1"),
-                
-                # 商品列表標題
-                TextComponent(
-                    text="📋 訂單內容",
-                    size="lg",
-                    weight="bold",
-                    color="#2c3e50",
-                    margin="xl"
-                ),
-                
-                # 商品列表
-                BoxComponent(
-                    layout="vertical",
-                    margin="md",
-                    spacing="sm",
-                    contents=item_components
-                ),
-                
-                # 總計
-                SeparatorComponent(margin="xl", color="#ecf0f1"),
-                BoxComponent(
-                    layout="baseline",
-                    margin="xl",
-                    contents=[
-                        TextComponent(
-                            text="總金額",
-                            size="xl",
-                            color="#2c3e50",
-                            weight="bold",
-                            flex=2
-                        ),
-                        TextComponent(
-                            text=f"NT$ {total}",
-                            size="xxl",
-                            color="#e74c3c",
-                            weight="bold",
-                            flex=2,
-                            align="end"
-                        )
-                    ],
-                    paddingAll="12px",
-                    backgroundColor="#fff5f5",
-                    cornerRadius="8px"
-                )
-            ],
-            paddingAll="20px"
-        ),
-        footer=BoxComponent(
-            layout="vertical",
-            spacing="md",
-            contents=[
-                ButtonComponent(
-                    style="primary",
-                    color="#27ae60",
-                    height="md",
-                    action=PostbackAction(
-                        label="💳 確認付款",
-                        data=f"action=checkout&order_id={order_id}"
-                    )
-                ),
-                ButtonComponent(
-                    style="secondary",
-                    height="md",
-                    action=PostbackAction(
-                        label="✏️ 修改訂單",
-                        data="action=edit_cart"
-                    )
-                )
-            ],
-            paddingAll="20px"
-        )
-    )
-    
-    return FlexSendMessage(
-        alt_text="✅ 訂單確認",
-        contents=bubble
-    )
-
-# 首頁
-@app.route("/")
-def index():
-    return render_template("index.html", menu=MENU)
+# 管理後台登出
+@app.route("/admin/logout")
+def admin_logout():
+    session.clear()
+    return redirect(url_for("admin_login"))
 
 # 管理後台
 @app.route("/admin")
+@admin_required
 def admin():
-    # 計算訂單統計數據
-    orders_count = sum(len(orders) for orders in user_orders.values())
-    
-    # 計算今日訂單
-    today = datetime.now().date()
-    today_orders = 0
-    for user_id, orders in user_orders.items():
-        for order in orders:
-            order_date = datetime.fromisoformat(order["created_at"]).date()
-            if order_date == today:
-                today_orders += 1
-    
-    # 計算待處理訂單
-    pending_orders = 0
-    for user_id, orders in user_orders.items():
-        for order in orders:
-            if order["status"] in ["pending", "confirmed"]:
-                pending_orders += 1
-    
     # 獲取最近5筆訂單
-    all_orders = []
-    for user_id, orders in user_orders.items():
-        for order in orders:
-            all_orders.append({
-                "id": order["id"],
-                "user_id": user_id,
-                "total": order["total"],
-                "status": order["status"],
-                "created_at": order["created_at"]
-            })
-    
-    # 按創建時間排序
-    all_orders.sort(key=lambda x: x["created_at"], reverse=True)
-    recent_orders = all_orders[:5]
+    recent_orders = order_store.recent(5)
     
     return render_template(
         "admin_dashboard.html", 
-        orders_count=orders_count,
-        today_orders=today_orders,
-        pending_orders=pending_orders,
-        recent_orders=recent_orders
+        recent_orders=recent_orders,
+        poll_seconds=ORDER_STREAM_POLL_SECONDS,
+        csrf_token=session["csrf_token"],
+        **order_counts()
     )
 
+# 訂單統計數據 (管理畫面輪詢用)
+@app.route("/admin/api/order-counts")
+@admin_required
+def admin_order_counts():
+    return jsonify(order_counts())
+
 # LINE Webhook
 @app.route("/callback", methods=['POST'])
+@WEBHOOK_SECONDS.time()
 def callback():
     signature = request.headers.get('X-Line-Signature')
     body = request.get_data(as_text=True)
     
     try:
-        handler.handle(body, signature)
+        events = handler.parser.parse(body, signature)
     except InvalidSignatureError:
+        WEBHOOK_REQUESTS.inc(1, "invalid_signature")
         abort(400)
+    
+    for event in events:
+        # 佇列已滿時由當前請求同步處理，形成自然的背壓
+        if not WEBHOOK_ASYNC or not webhook_queue.submit(event):
+            process_event(event)
+    WEBHOOK_REQUESTS.inc(1, "ok")
     return 'OK'
 
-# 處理文字訊息 - 優化版
-@handler.add(MessageEvent, message=TextMessage)
-def handle_message(event):
-    user_id = event.source.user_id
-    text = event.message.text.strip().lower()
-    
-    if text == "點餐" or text == "menu":
-        # 發送分類菜單
-        reply_message = create_categories_menu()
-        line_bot_api.reply_message(event.reply_token, reply_message)
-        
-    elif text == "購物車" or text == "cart":
-        reply_message = view_cart(user_id)
-        line_bot_api.reply_message(event.reply_token, reply_message)
-        
-    elif text == "訂單" or text == "orders":
-        view_orders(event, user_id)
-        
-    elif text == "幫助" or text == "help":
-        help_bubble = BubbleContainer(
-            body=BoxComponent(
-                layout="vertical",
-                contents=[
-                    TextComponent(
-                        text="🎯 使用說明",
-                        weight="bold",
-                        size="xxl",
-                        color="#3498db",
-                        align="center"
-                    ),
-                    SeparatorComponent(margin="xl", color="#ecf0f1"),
-                    BoxComponent(
-                        layout="vertical",
-                        margin="xl",
-                        spacing="lg",
-                        contents=[
-                            BoxComponent(
-                                layout="baseline",
-                                contents=[
-                                    TextComponent(
-                                        text="📋",
-                                        size="lg",
-                                        flex=1
-                                    ),
-                                    TextComponent(
-                                        text="點餐 - 查看完整菜單",
-                                        size="md",
-                                        color="#2c3e50",
-                                        flex=4,
-                                        wrap=True
-                                    )
-                                ]
-                            ),
-                            BoxComponent(
-                                layout="baseline",
-                                contents=[
-                                    TextComponent(
-                                        text="🛒",
-                                        size="lg",
-                                        flex=1
-                                    ),
-                                    TextComponent(
-                                        text="購物車 - 查看已選商品",
-                                        size="md",
-                                        color="#2c3e50",
-                                        flex=4,
-                                        wrap=True
-                                    )
-                                ]
-                            ),
-                            BoxComponent(
-                                layout="baseline",
-                                contents=[
-                                    TextComponent(
-                                        text="📦",
-                                        size="lg",
-                                        flex=1
-                                    ),
-                                    TextComponent(
-                                        text="訂單 - 查看訂單狀態",
-                                        size="md",
-                                        color="#2c3e50",
-                                        flex=4,
-                                        wrap=True
-                                    )
-                                ]
-                            ),
-                            BoxComponent(
-                                layout="baseline",
-                                contents=[
-                                    TextComponent(
-                                        text="❓",
-                                        size="lg",
-                                        flex=1
-                                    ),
-                                    TextComponent(
-                                        text="幫助 - 顯示使用說明",
-                                        size="md",
-                                        color="#2c3e50",
-                                        flex=4,
-                                        wrap=True
-                                    )
-                                ]
-                            )
-                        ]
-                    ),
-                    SeparatorComponent(margin="xl", color="#ecf0f1"),
-                    TextComponent(
-                        text="💡 您也可以使用下方的快速按鈕",
-                        size="sm",
-                        color="#7f8c8d",
-                        align="center",
-                        margin="xl"
-                    )
-                ],
-                paddingAll="20px"
-            )
-        )
-        
-        help_message = FlexSendMessage(
-            alt_text="🎯 使用說明",
-            contents=help_bubble,
-            quick_reply=create_quick_reply()
-        )
-        line_bot_api.reply_message(event.reply_token, help_message)
-        
+# Webhook 佇列狀態
+@app.route("/admin/api/webhook-stats")
+@admin_required
+def webhook_stats():
+    return jsonify(webhook_queue.stats())
+
+# 解析管理 API 的時間參數：YYYY-MM-DD 或 ISO 格式，end 為日期時包含當天
+def parse_order_time(value, end=False):
+    if len(value) == 10:
+        day = datetime.strptime(value, "%Y-%m-%d")
+        return day + timedelta(days=1) if end else day
+    return datetime.fromisoformat(value)
+
+# 訂單查詢 API：?status=pending,confirmed&user_id=&from=&to=&limit=&cursor=
+@app.route("/admin/api/orders")
+@admin_required
+def admin_orders():
+    # 訂單沒有異動時直接回應 304，不執行查詢
+    revision, modified = order_store.revision()
+    etag = hashlib.sha1(f"{revision}:{request.query_string.decode()}".encode()).hexdigest()[:20]
+    last_modified = datetime.fromtimestamp(modified, timezone.utc)
+    if request.if_none_match:
+        not_modified = request.if_none_match.contains(etag)
     else:
-        # 預設回覆 - 優化版
-        welcome_bubble = BubbleContainer(
-            hero=ImageComponent(
-                url="https://images.unsplash.com/photo-1513475382585-d06e58bcb0e0?w=1024&h=400&fit=crop",
-                size="full",
-                aspect_mode="cover",
-                aspect_ratio="5:2"
-            ),
-            body=BoxComponent(
-                layout="vertical",
-                contents=[
-                    TextComponent(
-                        text="🍽️ 美食點餐系統",
-                        weight="bold",
-                        size="xxl",
-                        color="#e74c3c",
-                        align="center"
-                    ),
-                    TextComponent(
-                        text="歡迎使用線上點餐服務",
-                        size="lg",
-                        color="#2c3e50",
-                        align="center",
-                        margin="md"
-                    ),
-                    SeparatorComponent(margin="xl", color="#ecf0f1"),
-                    TextComponent(
-                        text="請選擇您需要的服務：",
-                        size="md",
-                        color="#7f8c8d",
-                        align="center",
-                        margin="xl"
-                    )
-                ],
-                paddingAll="20px"
-            ),
-            footer=BoxComponent(
-                layout="vertical",
-                spacing="md",
-                contents=[
-                    ButtonComponent(
-                        style="primary",
-                        color="#e74c3c",
-                        height="md",
-                        action=PostbackAction(
-                            label="📋 開始點餐",
-                            data="action=view_categories"
-                        )
-                    ),
-                    ButtonComponent(
-                        style="secondary",
-                        height="md",
-                        action=PostbackAction(
-                            label="🛒 查看購物車",
-                            data="action=view_cart"
-                        )
-                    )
-                ],
-                paddingAll="20px"
-            )
+        not_modified = (
+            request.if_modified_since is not None and modified
+            and int(last_modified.timestamp()) <= request.if_modified_since.timestamp()
         )
+    if not_modified:
+        response = app.response_class(status=304)
+    else:
+        try:
+            limit = min(max(int(request.args.get("limit", "20")), 1), ADMIN_ORDERS_MAX_LIMIT)
+            start = request.args.get("from")
+            end = request.args.get("to")
+            start = parse_order_time(start) if start else None
+            end = parse_order_time(end, end=True) if end else None
+        except ValueError:
+            return jsonify({"error": "limit、from、to 參數格式錯誤"}), 400
         
-        welcome_message = FlexSendMessage(
-            alt_text="🍽️ 歡迎使用美食點餐系統",
-            contents=welcome_bubble,
-            quick_reply=create_quick_reply()
+        statuses = [status for status in request.args.get("status", "").split(",") if status]
+        # 多取一筆用來判斷是否還有下一頁
+        orders = order_store.search(
+            statuses=statuses,
+            user_id=request.args.get("user_id"),
+            start=start,
+            end=end,
+            limit=limit + 1,
+            before=request.args.get("cursor")
         )
-        line_bot_api.reply_message(event.reply_token, welcome_message)
-
-@handler.add(PostbackEvent)
-def handle_postback(event):
-    user_id = event.source.user_id
-    data = event.postback.data
-    
-    # 解析數據
-    data_dict = {}
-    for item in data.split('&'):
-        if '=' in item:
-            key, value = item.split('=', 1)
-            data_dict[key] = value
-    
-    action = data_dict.get('action', '')
-    
-    # 購物車編輯相關動作
-    if action in ['edit_cart', 'increase_item', 'decrease_item', 'remove_item', 'clear_cart', 'clear_cart_confirm']:
-        handle_cart_editing_actions(event, user_id, data_dict)
-        return
+        has_more = len(orders) > limit
+        orders = orders[:limit]
+        response = jsonify({
+            "orders": orders,
+            "next_cursor": orders[-1]["id"] if has_more else None
+        })
     
-    if action == 'view_categories':
-        reply_message = create_categories_menu()
-        line_bot_api.reply_message(event.reply_token, reply_message)
-        
-    elif action == 'view_menu':
-        category_id = data_dict.get('category', '')
-        menu_messages = create_menu_template(category_id)
-        if menu_messages:
-            # 如果有多個Flex訊息，需要逐個發送
-            if len(menu_messages) > 1:
-                line_bot_api.reply_message(event.reply_token, menu_messages[0])
-                for msg in menu_messages[1:]:
-                    line_bot_api.push_message(user_id, msg)
-            else:
-                line_bot_api.reply_message(event.reply_token, menu_messages[0])
-        else:
-            line_bot_api.reply_message(
-                event.reply_token,
-                TextSendMessage(text="❌ 找不到該菜單分類")
-            )
-            
-    elif action == 'add_to_cart':
-        category_id = data_dict.get('category', '')
-        item_name = data_dict.get('item', '')
-        add_to_cart(event, user_id, category_id, item_name)
-        
-    elif action == 'view_cart':
-        reply_message = view_cart(user_id)
-        line_bot_api.reply_message(event.reply_token, reply_message)
-        
-    elif action == 'confirm_order':
-        reply_message = create_order_confirmation(user_id)
-        if reply_message:
-            line_bot_api.reply_message(event.reply_token, reply_message)
+    response.set_etag(etag)
+    if modified:
+        response.last_modified = last_modified
+    response.cache_control.no_cache = True
+    return response
+
+# 訂單狀態轉換：只允許 ORDER_TRANSITIONS 定義的轉換
+def transition_orders(order_ids, status):
+    allowed_from = [old for old, targets in ORDER_TRANSITIONS.items() if status in targets]
+    old_statuses = order_store.update_statuses(order_ids, status, allowed_from=allowed_from)
+    updated, rejected, not_found = [], [], []
+    for order_id in dict.fromkeys(order_ids):
+        old_status = old_statuses.get(order_id)
+        if old_status is None:
+            not_found.append(order_id)
+        elif old_status in allowed_from:
+            updated.append({"id": order_id, "status": status, "old_status": old_status})
         else:
-            line_bot_api.reply_message(
-                event.reply_token,
-                TextSendMessage(
-                    text="🛒 您的購物車是空的，無法建立訂單\n快去選購美味的餐點吧！",
-                    quick_reply=create_quick_reply()
-                )
-            )
-            
-    elif action == 'checkout':
-        order_id = data_dict.get('order_id', '')
-        checkout_order(event, user_id, order_id)
-        
-    elif action == 'view_orders':
-        view_orders(event, user_id)
-        
-    elif action == 'go_home':
-        # 優化版歡迎訊息
-        welcome_bubble = BubbleContainer(
-            hero=ImageComponent(
-                url="https://images.unsplash.com/photo-1513475382585-d06e58bcb0e0?w=1024&h=400&fit=crop",
-                size="full",
-                aspect_mode="cover",
-                aspect_ratio="5:2"
-            ),
-            body=BoxComponent(
-                layout="vertical",
-                contents=[
-                    TextComponent(
-                        text="🍽️ 美食點餐系統",
-                        weight="bold",
-                        size="xxl",
-                        color="#e74c3c",
-                        align="center"
-                    ),
-                    TextComponent(
-                        text="歡迎使用線上點餐服務",
-                        size="lg",
-                        color="#2c3e50",
-                        align="center",
-                        margin="md"
-                    ),
-                    SeparatorComponent(margin="xl", color="#ecf0f1"),
-                    TextComponent(
-                        text="請選擇您需要的服務：",
-                        size="md",
-                        color="#7f8c8d",
-                        align="center",
-                        margin="xl"
-                    )
-                ],
-                paddingAll="20px"
-            ),
-            footer=BoxComponent(
-                layout="vertical",
-                spacing="md",
-                contents=[
-                    ButtonComponent(
-                        style="primary",
-                        color="#e74c3c",
-                        height="md",
-                        action=PostbackAction(
-                            label="📋 開始點餐",
-                            data="action=view_categories"
-                        )
-                    ),
-                    ButtonComponent(
-                        style="secondary",
-                        height="md",
-                        action=PostbackAction(
-                            label="🛒 查看購物車",
-                            data="action=view_cart"
-                        )
-                    )
-                ],
-                paddingAll="20px"
-            )
-        )
-        
-        welcome_message = FlexSendMessage(
-            alt_text="🍽️ 歡迎使用美食點餐系統",
-            contents=welcome_bubble,
-            quick_reply=create_quick_reply()
-        )
-        line_bot_api.reply_message(event.reply_token, welcome_message)
+            rejected.append({"id": order_id, "status": old_status})
+    return updated, rejected, not_found
 
-# 添加到購物車 - 優化版
-def add_to_cart(event, user_id, category_id, item_name):
-    if category_id not in MENU or item_name not in MENU[category_id]["items"]:
-        line_bot_api.reply_message(
-            event.reply_token,
-            TextSendMessage(text="❌ 找不到該商品")
-        )
-        return
+# 更新單筆訂單狀態：{"status": "preparing"}
+@app.route("/admin/api/orders/<order_id>/status", methods=["POST"])
+@admin_required
+def update_order_status(order_id):
+    status = (request.get_json(silent=True) or {}).get("status")
+    if status not in ORDER_TRANSITIONS:
+        return jsonify({"error": "未知的訂單狀態"}), 400
     
-    # 初始化用戶購物車
-    if user_id not in user_carts:
-        user_carts[user_id] = {
-            "items": [],
-            "updated_at": datetime.now().isoformat()
-        }
-    
-    # 檢查商品是否已在購物車中
-    item_data = MENU[category_id]["items"][item_name]
-    cart = user_carts[user_id]
+    updated, rejected, not_found = transition_orders([order_id], status)
+    if not_found:
+        return jsonify({"error": "找不到訂單"}), 404
+    if rejected:
+        return jsonify({
+            "error": f"無法從 {rejected[0]['status']} 轉換為 {status}",
+            "allowed": sorted(ORDER_TRANSITIONS[rejected[0]["status"]])
+        }), 409
+    return jsonify(updated[0])
+
+# 批次更新訂單狀態：{"order_ids": [...], "status": "ready"}
+@app.route("/admin/api/orders/status", methods=["POST"])
+@admin_required
+def bulk_update_order_status():
+    payload = request.get_json(silent=True) or {}
+    status = payload.get("status")
+    order_ids = payload.get("order_ids")
+    if status not in ORDER_TRANSITIONS:
+        return jsonify({"error": "未知的訂單狀態"}), 400
+    if not isinstance(order_ids, list) or not all(isinstance(order_id, str) for order_id in order_ids):
+        return jsonify({"error": "order_ids 必須是訂單編號列表"}), 400
+    if len(order_ids) > ORDER_BULK_UPDATE_LIMIT:
+        return jsonify({"error": f"單次最多更新 {ORDER_BULK_UPDATE_LIMIT} 筆訂單"}), 400
     
-    item_found = False
-    for item in cart["items"]:
-        if item["name"] == item_name:
-            item["quantity"] += 1
-            item_found = True
-            break
+    updated, rejected, not_found = transition_orders(order_ids, status)
+    return jsonify({"updated": updated, "rejected": rejected, "not_found": not_found})
+
+# 訊息發送佇列狀態
+@app.route("/admin/api/outbound-stats")
+@admin_required
+def outbound_stats():
+    return jsonify(dict(messenger.stats(), dead_letters_total=dead_letters.count()))
+
+# 最近無法送出的訊息
+@app.route("/admin/api/dead-letters")
+@admin_required
+def dead_letter_list():
+    limit = min(max(request.args.get("limit", 50, type=int), 1), ADMIN_ORDERS_MAX_LIMIT)
+    return jsonify(dead_letters.recent(limit))
+
+# 訂單狀態通知發送狀態
+@app.route("/admin/api/notifier-stats")
+@admin_required
+def notifier_stats():
+    return jsonify(status_notifier.stats())
+
+# 訂單即時推播：order_created / order_status 事件，其他 worker 的異動以 resync 通知重新載入
+@app.route("/admin/api/orders/stream")
+@admin_required
+def order_stream():
+    subscription = order_events.subscribe(request.headers.get("Last-Event-ID"))
+    if subscription is None:
+        # 管理畫面收到 503 後改以輪詢更新
+        response = jsonify({"error": "連線數已達上限", "poll_seconds": ORDER_STREAM_POLL_SECONDS})
+        response.status_code = 503
+        response.headers["Retry-After"] = str(ORDER_STREAM_POLL_SECONDS)
+        return response
     
-    # 如果商品不在購物車中，添加它
-    if not item_found:
-        cart["items"].append({
-            "name": item_name,
-            "price": item_data["price"],
-            "quantity": 1,
-            "category": category_id
-        })
+    def stream():
+        try:
+            yield "retry: 3000\n\n"
+            revision = order_store.revision()[0]
+            # 連線定期結束，讓瀏覽器以 Last-Event-ID 重新連線並釋放執行緒
+            deadline = time.monotonic() + ORDER_STREAM_MAX_SECONDS
+            while not subscription.closed and time.monotonic() < deadline:
+                item = subscription.get(ORDER_STREAM_HEARTBEAT)
+                if item is not None:
+                    event_revision, message = item
+                    yield message
+                    if event_revision is not None:
+                        # revision 跳號表示中間有其他 worker 的異動
+                        if event_revision > revision + 1:
+                            yield format_event("resync", {"revision": event_revision, "counts": order_counts()})
+                        revision = max(revision, event_revision)
+                    continue
+                # 其他 worker 的異動不會經過這個行程的廣播，閒置時以計數器檢查
+                current = order_store.revision()[0]
+                if current > revision:
+                    revision = current
+                    yield format_event("resync", {"revision": current, "counts": order_counts()})
+                else:
+                    yield ": keepalive\n\n"
+        finally:
+            order_events.unsubscribe(subscription)
     
-    cart["updated_at"] = datetime.now().isoformat()
+    return Response(stream(), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+
+# 訂單推播連線狀態
+@app.route("/admin/api/order-stream-stats")
+@admin_required
+def order_stream_stats():
+    return jsonify(order_events.stats())
+
+# 重送事件去重狀態
+@app.route("/admin/api/dedup-stats")
+@admin_required
+def dedup_stats():
+    return jsonify(event_dedup.stats())
+
+# 購物車存放狀態
+@app.route("/admin/api/cart-stats")
+@admin_required
+def cart_stats():
+    return jsonify(cart_store.stats())
+
+# LINE API 呼叫延遲與連線重用率
+@app.route("/admin/api/line-api-stats")
+@admin_required
+def line_api_stats():
+    return jsonify(line_bot_api.http_client.stats())
+
+# 各 postback 動作的處理時間
+@app.route("/admin/api/postback-stats")
+@admin_required
+def postback_stats():
+    return jsonify(postback_router.stats())
+
+# 文字指令比對的命中與未命中次數
+@app.route("/admin/api/command-stats")
+@admin_required
+def command_stats():
+    return jsonify(command_matcher.stats())
+
+# 菜單搜尋索引狀態
+@app.route("/admin/api/menu-search-stats")
+@admin_required
+def menu_search_stats():
+    return jsonify(menu_search.stats())
+
+# 菜單搜尋 API
+@app.route("/api/menu/search")
+def menu_search_api():
+    query = request.args.get("q", "").strip()
+    limit = request.args.get("limit", "10")
+    if not limit.isdigit() or not 1 <= int(limit) <= MENU_SEARCH_API_MAX_LIMIT:
+        return jsonify({"error": f"limit 必須介於 1 到 {MENU_SEARCH_API_MAX_LIMIT}"}), 400
     
-    # 優化版確認訊息
-    confirm_bubble = BubbleContainer(
+    started = time.perf_counter()
+    results = menu_search.search(query, limit=int(limit)) if query else []
+    return jsonify({
+        "query": query,
+        "took_ms": round((time.perf_counter() - started) * 1000, 3),
+        "results": [
+            {
+                "id": item["id"],
+                "name": item["name"],
+                "category": item["category"],
+                "price": item["price"],
+                "desc": item["desc"],
+                "image": item["image"],
+                "score": round(score, 4)
+            }
+            for score, item in results
+        ]
+    })
+
+# Prometheus 指標
+@app.route("/metrics")
+def metrics_endpoint():
+    return metrics.REGISTRY.render(), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
+# 處理文字訊息，並依指令記錄處理時間
+@handler.add(MessageEvent, message=TextMessage)
+def handle_message(event):
+    match = command_matcher.match(event.message.text)
+    started = time.perf_counter()
+    try:
+        reply_text_command(event, match)
+    finally:
+        TEXT_COMMAND_SECONDS.observe(time.perf_counter() - started, match.command if match else "other")
+
+# 歡迎訊息 - 優化版
+@static_messages.register("welcome")
+@FLEX_BUILD_SECONDS.time("welcome")
+def create_welcome_message():
+    welcome_bubble = BubbleContainer(
+        hero=ImageComponent(
+            url="https://images.unsplash.com/photo-1513475382585-d06e58bcb0e0?w=1024&h=400&fit=crop",
+            size="full",
+            aspect_mode="cover",
+            aspect_ratio="5:2"
+        ),
         body=BoxComponent(
             layout="vertical",
             contents=[
                 TextComponent(
-                    text="✅ 加入成功！",
+                    text="🍽️ 美食點餐系統",
                     weight="bold",
-                    size="xl",
-                    color="#27ae60",
+                    size="xxl",
+                    color="#e74c3c",
                     align="center"
                 ),
-                SeparatorComponent(margin="lg", color="#ecf0f1"),
-                BoxComponent(
-                    layout="vertical",
-                    margin="lg",
-                    contents=[
-                        TextComponent(
-                            text=f"🍽️ {item_name}",
-                            size="lg",
-                            weight="bold",
-                            color="#2c3e50",
-                            align="center"
-                        ),
-                        TextComponent(
-                            text="已成功加入購物車",
-                            size="md",
-                            color="#7f8c8d",
-                            align="center",
-                            margin="sm"
-                        )
-                    ]
+                TextComponent(
+                    text="歡迎使用線上點餐服務",
+                    size="lg",
+                    color="#2c3e50",
+                    align="center",
+                    margin="md"
+                ),
+                SeparatorComponent(margin="xl", color="#ecf0f1"),
+                TextComponent(
+                    text="請選擇您需要的服務：",
+                    size="md",
+                    color="#7f8c8d",
+                    align="center",
+                    margin="xl"
                 )
             ],
             paddingAll="20px"
@@ -1287,19 +1269,19 @@ def add_to_cart(event, user_id, category_id, item_name):
             contents=[
                 ButtonComponent(
                     style="primary",
-                    color="#3498db",
+                    color="#e74c3c",
                     height="md",
                     action=PostbackAction(
-                        label="🛒 查看購物車",
-                        data="action=view_cart"
+                        label="📋 開始點餐",
+                        data="action=view_categories"
                     )
                 ),
                 ButtonComponent(
                     style="secondary",
                     height="md",
                     action=PostbackAction(
-                        label="⬅️ 繼續點餐",
-                        data="action=view_categories"
+                        label="🛒 查看購物車",
+                        data="action=view_cart"
                     )
                 )
             ],
@@ -1307,63 +1289,25 @@ def add_to_cart(event, user_id, category_id, item_name):
         )
     )
     
-    template_message = FlexSendMessage(
-        alt_text="✅ 已加入購物車",
-        contents=confirm_bubble
+    return FlexSendMessage(
+        alt_text="🍽️ 歡迎使用美食點餐系統",
+        contents=welcome_bubble,
+        quick_reply=create_quick_reply()
     )
-    
-    line_bot_api.reply_message(event.reply_token, template_message)
 
-# 結帳 - 優化版
-def checkout_order(event, user_id, order_id):
-    if user_id not in user_carts or not user_carts[user_id]["items"]:
-        line_bot_api.reply_message(
-            event.reply_token,
-            TextSendMessage(
-                text="🛒 您目前沒有訂單可以結帳\n快去選購美味的餐點吧！",
-                quick_reply=create_quick_reply()
-            )
-        )
-        return
-    
-    # 創建訂單
-    cart = user_carts[user_id]
-    total = sum(item["price"] * item["quantity"] for item in cart["items"])
-    
-    if user_id not in user_orders:
-        user_orders[user_id] = []
-    
-    order = {
-        "id": order_id,
-        "user_id": user_id,
-        "items": cart["items"].copy(),
-        "total": total,
-        "status": "confirmed",
-        "created_at": datetime.now().isoformat(),
-        "updated_at": datetime.now().isoformat()
-    }
-    
-    user_orders[user_id].append(order)
-    
-    # 清空購物車
-    user_carts[user_id]["items"] = []
-    
-    # 優化版成功訊息
-    success_bubble = BubbleContainer(
-        hero=ImageComponent(
-            url="https://images.unsplash.com/photo-1556909114-f6e7ad7d3136?w=1024&h=400&fit=crop",
-            size="full",
-            aspect_mode="cover",
-            aspect_ratio="5:2"
-        ),
+# 使用說明 - 優化版
+@static_messages.register("help")
+@FLEX_BUILD_SECONDS.time("help")
+def create_help_message():
+    help_bubble = BubbleContainer(
         body=BoxComponent(
             layout="vertical",
             contents=[
                 TextComponent(
-                    text="🎉 訂單成功！",
+                    text="🎯 使用說明",
                     weight="bold",
                     size="xxl",
-                    color="#27ae60",
+                    color="#3498db",
                     align="center"
                 ),
                 SeparatorComponent(margin="xl", color="#ecf0f1"),
@@ -1376,18 +1320,33 @@ def checkout_order(event, user_id, order_id):
                             layout="baseline",
                             contents=[
                                 TextComponent(
-                                    text="📋 訂單編號",
+                                    text="📋",
+                                    size="lg",
+                                    flex=1
+                                ),
+                                TextComponent(
+                                    text="點餐 - 查看完整菜單",
                                     size="md",
-                                    color="#7f8c8d",
-                                    flex=2
+                                    color="#2c3e50",
+                                    flex=4,
+                                    wrap=True
+                                )
+                            ]
+                        ),
+                        BoxComponent(
+                            layout="baseline",
+                            contents=[
+                                TextComponent(
+                                    text="🛒",
+                                    size="lg",
+                                    flex=1
                                 ),
                                 TextComponent(
-                                    text=order_id,
+                                    text="購物車 - 查看已選商品",
                                     size="md",
-                                    weight="bold",
                                     color="#2c3e50",
-                                    flex=3,
-                                    align="end"
+                                    flex=4,
+                                    wrap=True
                                 )
                             ]
                         ),
@@ -1395,18 +1354,50 @@ def checkout_order(event, user_id, order_id):
                             layout="baseline",
                             contents=[
                                 TextComponent(
-                                    text="💰 總金額",
+                                    text="📦",
+                                    size="lg",
+                                    flex=1
+                                ),
+                                TextComponent(
+                                    text="訂單 - 查看訂單狀態",
                                     size="md",
-                                    color="#7f8c8d",
-                                    flex=2
+                                    color="#2c3e50",
+                                    flex=4,
+                                    wrap=True
+                                )
+                            ]
+                        ),
+                        BoxComponent(
+                            layout="baseline",
+                            contents=[
+                                TextComponent(
+                                    text="🔍",
+                                    size="lg",
+                                    flex=1
                                 ),
                                 TextComponent(
-                                    text=f"NT$ {total}",
+                                    text="搜尋 - 以關鍵字找餐點",
+                                    size="md",
+                                    color="#2c3e50",
+                                    flex=4,
+                                    wrap=True
+                                )
+                            ]
+                        ),
+                        BoxComponent(
+                            layout="baseline",
+                            contents=[
+                                TextComponent(
+                                    text="❓",
                                     size="lg",
-                                    weight="bold",
-                                    color="#e74c3c",
-                                    flex=3,
-                                    align="end"
+                                    flex=1
+                                ),
+                                TextComponent(
+                                    text="幫助 - 顯示使用說明",
+                                    size="md",
+                                    color="#2c3e50",
+                                    flex=4,
+                                    wrap=True
                                 )
                             ]
                         )
@@ -1414,243 +1405,554 @@ def checkout_order(event, user_id, order_id):
                 ),
                 SeparatorComponent(margin="xl", color="#ecf0f1"),
                 TextComponent(
-                    text="👨‍🍳 我們將開始準備您的餐點\n請稍候，感謝您的訂購！",
-                    size="md",
-                    color="#2c3e50",
+                    text="💡 您也可以使用下方的快速按鈕",
+                    size="sm",
+                    color="#7f8c8d",
                     align="center",
-                    margin="xl",
-                    wrap=True
-                )
-            ],
-            paddingAll="20px"
-        ),
-        footer=BoxComponent(
-            layout="vertical",
-            contents=[
-                ButtonComponent(
-                    style="primary",
-                    color="#3498db",
-                    height="md",
-                    action=PostbackAction(
-                        label="📦 查看我的訂單",
-                        data="action=view_orders"
-                    )
+                    margin="xl"
                 )
             ],
             paddingAll="20px"
         )
     )
     
-    line_bot_api.reply_message(
-        event.reply_token,
-        FlexSendMessage(
-            alt_text="🎉 訂單成功",
-            contents=success_bubble,
-            quick_reply=create_quick_reply()
-        )
+    return FlexSendMessage(
+        alt_text="🎯 使用說明",
+        contents=help_bubble,
+        quick_reply=create_quick_reply()
     )
 
-# 查看訂單 - 優化版
-def view_orders(event, user_id):
-    if user_id not in user_orders or not user_orders[user_id]:
-        empty_bubble = BubbleContainer(
-            body=BoxComponent(
-                layout="vertical",
-                contents=[
-                    TextComponent(
-                        text="📦 我的訂單",
-                        weight="bold",
-                        size="xxl",
-                        color="#3498db",
-                        align="center"
-                    ),
-                    SeparatorComponent(margin="xl", color="#ecf0f1"),
-                    BoxComponent(
-                        layout="vertical",
-                        margin="xl",
-                        contents=[
-                            TextComponent(
-                                text="📋",
-                                size="xxl",
-                                align="center",
-                                color="#bdc3c7"
-                            ),
-                            TextComponent(
-                                text="您目前沒有訂單",
-                                size="lg",
-                                color="#7f8c8d",
-                                align="center",
-                                margin="md"
-                            ),
-                            TextComponent(
-                                text="快去點些美味的餐點吧！",
-                                size="md",
-                                color="#95a5a6",
-                                align="center",
-                                margin="sm"
-                            )
-                        ]
-                    )
-                ],
-                paddingAll="20px"
-            ),
-            footer=BoxComponent(
-                layout="vertical",
-                contents=[
-                    ButtonComponent(
-                        style="primary",
-                        color="#e74c3c",
-                        height="md",
-                        action=PostbackAction(
-                            label="📋 開始點餐",
-                            data="action=view_categories"
-                        )
-                    )
-                ],
-                paddingAll="20px"
-            )
-        )
+# 回覆文字指令 - 優化版
+def reply_text_command(event, match):
+    user_id = event.source.user_id
+    command = match.command if match else None
+    
+    if command == "menu":
+        # 發送分類菜單
+        reply_message = get_categories_menu()
+        messenger.reply_message(event.reply_token, reply_message)
+        
+    elif command == "cart":
+        reply_message = view_cart(user_id)
+        messenger.reply_message(event.reply_token, reply_message)
+        
+    elif command == "orders":
+        view_orders(event, user_id)
         
-        line_bot_api.reply_message(
+    elif command == "help":
+        messenger.reply_message(event.reply_token, static_messages.get("help"))
+        
+    elif command == "search":
+        reply_menu_search(event, match.argument)
+        
+    elif command == ITEM and match.kind == "typo":
+        # 名稱只差一個字 (例如「洋蔥」對到「洋蔥圈」) 時先請用戶確認
+        messenger.reply_message(event.reply_token, create_item_confirmation(match.item, match.quantity))
+        
+    elif command == ITEM:
+        # 「2 可樂」之類的文字直接加入購物車
+        add_to_cart(event, user_id, match.item["category"], match.item["name"], match.quantity)
+        
+    else:
+        # 預設回覆 - 優化版
+        messenger.reply_message(event.reply_token, static_messages.get("welcome"))
+
+# 文字點餐的商品名稱不完全相同時的確認對話框
+def create_item_confirmation(item, quantity):
+    return TemplateSendMessage(
+        alt_text=f"是要點 {item['name']} 嗎？",
+        template=ConfirmTemplate(
+            text=f"您是要點「{item['name']}」x{quantity} 嗎？",
+            actions=[
+                PostbackAction(
+                    label="✅ 加入購物車",
+                    data=postback_data("add_to_cart", category=item["category"], item=item["name"], quantity=quantity)
+                ),
+                PostbackAction(label="📋 查看菜單", data="action=view_categories")
+            ]
+        )
+    )
+
+# 搜尋菜單，結果以商品 carousel 回覆
+def reply_menu_search(event, query):
+    if not query:
+        messenger.reply_message(event.reply_token, static_messages.get("search_hint"))
+        return
+    
+    results = menu_search.search(query, limit=CAROUSEL_MAX_BUBBLES)
+    if not results:
+        messenger.reply_message(
             event.reply_token,
-            FlexSendMessage(
-                alt_text="📦 我的訂單",
-                contents=empty_bubble,
+            TextSendMessage(
+                text=f"🔍 找不到符合「{query}」的餐點\n試試其他關鍵字，或直接查看菜單",
                 quick_reply=create_quick_reply()
             )
         )
         return
     
-    orders = user_orders[user_id]
-    bubbles = []
+    messenger.reply_message(
+        event.reply_token,
+        menu_pages(f"🔍 「{query}」的搜尋結果", [item for _, item in results])
+    )
+
+@handler.add(PostbackEvent)
+def handle_postback(event):
+    user_id = event.source.user_id
+    data = event.postback.data
     
-    for order in orders[-5:]:  # 顯示最近5筆訂單
-        item_components = []
-        for item in order["items"]:
-            item_box = BoxComponent(
-                layout="baseline",
-                contents=[
-                    TextComponent(
-                        text=f"{item['name']} x{item['quantity']}",
-                        size="sm",
-                        color="#2c3e50",
-                        flex=3
-                    ),
-                    TextComponent(
-                        text=f"${item['price'] * item['quantity']}",
-                        size="sm",
-                        color="#e74c3c",
-                        flex=1,
-                        align="end"
-                    )
-                ]
-            )
-        item_components.append(item_box)
-        
-        status_text = ORDER_STATUS.get(order["status"], "❓ 未知狀態")
-        created_time = datetime.fromisoformat(order["created_at"]).strftime("%m/%d %H:%M")
-        
-        # 狀態顏色對應
-        status_colors = {
-            "pending": "#f39c12",
-            "confirmed": "#27ae60",
-            "preparing": "#3498db",
-            "ready": "#2ecc71",
-            "cancelled": "#e74c3c"
+    if not postback_router.dispatch(event, user_id, data):
+        logger.info("未知的 postback 動作: %s", data)
+
+@postback_router.route("view_categories")
+def handle_view_categories(event, user_id):
+    reply_message = get_categories_menu()
+    messenger.reply_message(event.reply_token, reply_message)
+
+@postback_router.route("view_menu", category=str)
+def handle_view_menu(event, user_id, category):
+    menu_messages = get_menu_messages(category)
+    if menu_messages:
+        # 多個Flex訊息合併在同一次回覆，超過5則才改用推播
+        send_messages(messenger, event.reply_token, user_id, menu_messages)
+    else:
+        messenger.reply_message(
+            event.reply_token,
+            TextSendMessage(text="❌ 找不到該菜單分類")
+        )
+
+@postback_router.route("add_to_cart", category=str, item=str, quantity=int)
+def handle_add_to_cart(event, user_id, category, item, quantity):
+    # 菜單按鈕不帶數量；文字點餐的確認按鈕帶有數量
+    if quantity is None or not 0 < quantity <= TEXT_ORDER_MAX_QUANTITY:
+        quantity = 1
+    add_to_cart(event, user_id, category, item, quantity)
+
+@postback_router.route("view_cart")
+def handle_view_cart(event, user_id):
+    reply_message = view_cart(user_id)
+    messenger.reply_message(event.reply_token, reply_message)
+
+@postback_router.route("confirm_order")
+def handle_confirm_order(event, user_id):
+    reply_message = create_order_confirmation(user_id)
+    if reply_message:
+        messenger.reply_message(event.reply_token, reply_message)
+    else:
+        messenger.reply_message(event.reply_token, static_messages.get("empty_cart_checkout"))
+
+@postback_router.route("checkout", order_id=str, version=int)
+def handle_checkout(event, user_id, order_id, version):
+    # 沒有訂單編號 (或格式不符) 的 postback 不是由確認畫面產生的，請用戶重新確認取得新的編號
+    if not is_order_id(order_id):
+        messenger.reply_message(event.reply_token, static_messages.get("cart_changed"))
+        return
+    checkout_order(event, user_id, order_id, version)
+
+@postback_router.route("view_orders")
+def handle_view_orders(event, user_id):
+    view_orders(event, user_id)
+
+@postback_router.route("more_orders", before=str)
+def handle_more_orders(event, user_id, before):
+    view_orders(event, user_id, before=before)
+
+@postback_router.route("go_home")
+def handle_go_home(event, user_id):
+    messenger.reply_message(event.reply_token, static_messages.get("welcome"))
+
+# 加入購物車成功訊息
+ADD_TO_CART_TEMPLATE = FlexTemplate({
+    "type": "flex",
+    "altText": "✅ 已加入購物車",
+    "contents": {
+        "type": "bubble",
+        "body": {
+            "type": "box",
+            "layout": "vertical",
+            "contents": [
+                {"type": "text", "text": "✅ 加入成功！", "weight": "bold", "size": "xl", "color": "#27ae60", "align": "center"},
+                {"type": "separator", "margin": "lg", "color": "#ecf0f1"},
+                {
+                    "type": "box",
+                    "layout": "vertical",
+                    "margin": "lg",
+                    "contents": [
+                        {"type": "text", "text": Slot("name"), "size": "lg", "weight": "bold", "color": "#2c3e50", "align": "center"},
+                        {"type": "text", "text": "已成功加入購物車", "size": "md", "color": "#7f8c8d", "align": "center", "margin": "sm"}
+                    ]
+                }
+            ]
+        },
+        "footer": {
+            "type": "box",
+            "layout": "vertical",
+            "spacing": "md",
+            "contents": [
+                postback_button("🛒 查看購物車", "action=view_cart", "primary", color="#3498db"),
+                postback_button("⬅️ 繼續點餐", "action=view_categories")
+            ]
         }
-        status_color = status_colors.get(order["status"], "#95a5a6")
-        
-        bubble = BubbleContainer(
-            size="kilo",
-            body=BoxComponent(
-                layout="vertical",
-                contents=[
-                    # 訂單標題
-                    BoxComponent(
-                        layout="baseline",
-                        contents=[
-                            TextComponent(
-                                text=f"📋 #{order['id']}",
-                                weight="bold",
-                                size="lg",
-                                color="#2c3e50",
-                                flex=3
-                            ),
-                            TextComponent(
-                                text=created_time,
-                                size="xs",
-                                color="#95a5a6",
-                                flex=2,
-                                align="end"
-                            )
-                        ]
-                    ),
-                    
-                    # 狀態
-                    BoxComponent(
-                        layout="vertical",
-                        margin="md",
-                        contents=[
-                            TextComponent(
-                                text=status_text,
-                                size="md",
-                                weight="bold",
-                                color=status_color
-                            )
-                        ],
-                        paddingAll="8px",
-                        backgroundColor="#f8f9fa",
-                        cornerRadius="6px"
-                    ),
-                    
-                    SeparatorComponent(margin="md", color="#ecf0f1"),
-                    
-                    # 商品列表
-                    BoxComponent(
-                        layout="vertical",
-                        margin="md",
-                        spacing="xs",
-                        contents=item_components
-                    ),
-                    
-                    SeparatorComponent(margin="md", color="#ecf0f1"),
-                    
-                    # 總計
-                    BoxComponent(
-                        layout="baseline",
-                        margin="md",
-                        contents=[
-                            TextComponent(
-                                text="總金額",
-                                color="#7f8c8d",
-                                size="md",
-                                flex=2
-                            ),
-                            TextComponent(
-                                text=f"NT$ {order['total']}",
-                                size="lg",
-                                color="#e74c3c",
-                                weight="bold",
-                                flex=2,
-                                align="end"
-                            )
-                        ]
-                    )
-                ],
-                paddingAll="20px"
-            )
+    }
+})
+
+# 添加到購物車 - 優化版
+def add_to_cart(event, user_id, category_id, item_name, quantity=1):
+    item_data = menu_catalog.get_item(category_id, item_name)
+    if item_data is None:
+        messenger.reply_message(
+            event.reply_token,
+            TextSendMessage(text="❌ 找不到該商品")
         )
-        bubbles.append(bubble)
+        return
     
-    flex_message = FlexSendMessage(
-        alt_text="📦 我的訂單",
-        contents={
-            "type": "carousel",
-            "contents": bubbles
+    # 加入購物車，商品已存在時增加數量
+    cart_store.add_item(user_id, item_data["id"], category_id, item_name, item_data["price"], quantity)
+    
+    messenger.reply_message(
+        event.reply_token,
+        ADD_TO_CART_TEMPLATE.message({"name": f"🍽️ {item_name}" + (f" x{quantity}" if quantity > 1 else "")})
+    )
+
+# 結帳成功訊息
+CHECKOUT_SUCCESS_TEMPLATE = FlexTemplate({
+    "type": "flex",
+    "altText": "🎉 訂單成功",
+    "contents": {
+        "type": "bubble",
+        "hero": {
+            "type": "image",
+            "url": "https://images.unsplash.com/photo-1556909114-f6e7ad7d3136?w=1024&h=400&fit=crop",
+            "size": "full",
+            "aspectMode": "cover",
+            "aspectRatio": "5:2",
+            "animated": False
+        },
+        "body": {
+            "type": "box",
+            "layout": "vertical",
+            "contents": [
+                {"type": "text", "text": "🎉 訂單成功！", "weight": "bold", "size": "xxl", "color": "#27ae60", "align": "center"},
+                {"type": "separator", "margin": "xl", "color": "#ecf0f1"},
+                {
+                    "type": "box",
+                    "layout": "vertical",
+                    "margin": "xl",
+                    "spacing": "lg",
+                    "contents": [
+                        {
+                            "type": "box",
+                            "layout": "baseline",
+                            "contents": [
+                                {"type": "text", "text": "📋 訂單編號", "size": "md", "color": "#7f8c8d", "flex": 2},
+                                {"type": "text", "text": Slot("order_id"), "size": "md", "weight": "bold", "color": "#2c3e50", "flex": 3, "align": "end"}
+                            ]
+                        },
+                        {
+                            "type": "box",
+                            "layout": "baseline",
+                            "contents": [
+                                {"type": "text", "text": "💰 總金額", "size": "md", "color": "#7f8c8d", "flex": 2},
+                                {"type": "text", "text": Slot("total"), "size": "lg", "weight": "bold", "color": "#e74c3c", "flex": 3, "align": "end"}
+                            ]
+                        }
+                    ]
+                },
+                {"type": "separator", "margin": "xl", "color": "#ecf0f1"},
+                {
+                    "type": "text",
+                    "text": "👨‍🍳 我們將開始準備您的餐點\n請稍候，感謝您的訂購！",
+                    "size": "md",
+                    "color": "#2c3e50",
+                    "align": "center",
+                    "margin": "xl",
+                    "wrap": True
+                }
+            ]
+        },
+        "footer": {
+            "type": "box",
+            "layout": "vertical",
+            "contents": [
+                postback_button("📦 查看我的訂單", "action=view_orders", "primary", color="#3498db")
+            ]
         }
+    },
+    "quickReply": QUICK_REPLY
+})
+
+# 結帳 - 優化版
+def checkout_order(event, user_id, order_id, cart_version=None):
+    # 建立訂單與清空購物車在同一個交易內完成
+    result, order = order_store.checkout(
+        user_id, order_id, "confirmed",
+        cart_ttl=cart_store.ttl,
+        expected_version=cart_version
+    )
+    
+    if result == CHECKOUT_CHANGED:
+        messenger.reply_message(event.reply_token, static_messages.get("cart_changed"))
+        return
+    
+    if result not in (CHECKOUT_CREATED, CHECKOUT_DUPLICATE) or order["user_id"] != user_id:
+        messenger.reply_message(event.reply_token, static_messages.get("nothing_to_checkout"))
+        return
+    
+    # 重複結帳時回覆同一筆訂單
+    messenger.reply_message(
+        event.reply_token,
+        CHECKOUT_SUCCESS_TEMPLATE.message({"order_id": order_id, "total": f"NT$ {order['total']}"})
     )
+
+# 訂單狀態顏色對應
+ORDER_STATUS_COLORS = {
+    "pending": "#f39c12",
+    "confirmed": "#27ae60",
+    "preparing": "#3498db",
+    "ready": "#2ecc71",
+    "cancelled": "#e74c3c"
+}
+
+# 查看訂單 - 沒有訂單時
+NO_ORDERS_TEMPLATE = FlexTemplate({
+    "type": "flex",
+    "altText": "📦 我的訂單",
+    "contents": {
+        "type": "bubble",
+        "body": {
+            "type": "box",
+            "layout": "vertical",
+            "contents": [
+                {"type": "text", "text": "📦 我的訂單", "weight": "bold", "size": "xxl", "color": "#3498db", "align": "center"},
+                {"type": "separator", "margin": "xl", "color": "#ecf0f1"},
+                {
+                    "type": "box",
+                    "layout": "vertical",
+                    "margin": "xl",
+                    "contents": [
+                        {"type": "text", "text": "📋", "size": "xxl", "align": "center", "color": "#bdc3c7"},
+                        {"type": "text", "text": "您目前沒有訂單", "size": "lg", "color": "#7f8c8d", "align": "center", "margin": "md"},
+                        {"type": "text", "text": "快去點些美味的餐點吧！", "size": "md", "color": "#95a5a6", "align": "center", "margin": "sm"}
+                    ]
+                }
+            ]
+        },
+        "footer": {
+            "type": "box",
+            "layout": "vertical",
+            "contents": [
+                postback_button("📋 開始點餐", "action=view_categories", "primary", color="#e74c3c")
+            ]
+        }
+    },
+    "quickReply": QUICK_REPLY
+})
+
+# 查看訂單 - 每筆訂單一個 bubble，還有更早的訂單時加入「更多訂單」按鈕
+ORDERS_TEMPLATE = FlexTemplate({
+    "type": "flex",
+    "altText": "📦 我的訂單",
+    "contents": {
+        "type": "carousel",
+        "contents": [
+            Repeat("orders", {
+                "type": "bubble",
+                "size": "kilo",
+                "body": {
+                    "type": "box",
+                    "layout": "vertical",
+                    "contents": [
+                        # 訂單標題
+                        {
+                            "type": "box",
+                            "layout": "baseline",
+                            "contents": [
+                                {"type": "text", "text": Slot("title"), "weight": "bold", "size": "lg", "color": "#2c3e50", "flex": 3},
+                                {"type": "text", "text": Slot("created_at"), "size": "xs", "color": "#95a5a6", "flex": 2, "align": "end"}
+                            ]
+                        },
+
+                        # 狀態
+                        {
+                            "type": "box",
+                            "layout": "vertical",
+                            "margin": "md",
+                            "contents": [
+                                {"type": "text", "text": Slot("status"), "size": "md", "weight": "bold", "color": Slot("status_color")}
+                            ]
+                        },
+
+                        {"type": "separator", "margin": "md", "color": "#ecf0f1"},
+
+                        # 商品列表
+                        {
+                            "type": "box",
+                            "layout": "vertical",
+                            "margin": "md",
+                            "spacing": "xs",
+                            "contents": [Repeat("items", {
+                                "type": "box",
+                                "layout": "baseline",
+                                "contents": [
+                                    {"type": "text", "text": Slot("name"), "size": "sm", "color": "#2c3e50", "flex": 3},
+                                    {"type": "text", "text": Slot("subtotal"), "size": "sm", "color": "#e74c3c", "flex": 1, "align": "end"}
+                                ]
+                            })]
+                        },
+
+                        {"type": "separator", "margin": "md", "color": "#ecf0f1"},
+
+                        # 總計
+                        {
+                            "type": "box",
+                            "layout": "baseline",
+                            "margin": "md",
+                            "contents": [
+                                {"type": "text", "text": "總金額", "color": "#7f8c8d", "size": "md", "flex": 2},
+                                {"type": "text", "text": Slot("total"), "size": "lg", "color": "#e74c3c", "weight": "bold", "flex": 2, "align": "end"}
+                            ]
+                        }
+                    ]
+                }
+            }),
+
+            # 更多訂單
+            Repeat("more", {
+                "type": "bubble",
+                "size": "kilo",
+                "body": {
+                    "type": "box",
+                    "layout": "vertical",
+                    "contents": [
+                        {"type": "text", "text": "📜 更早的訂單", "weight": "bold", "size": "lg", "color": "#2c3e50", "align": "center"},
+                        {"type": "text", "text": "點擊下方按鈕查看更多", "size": "sm", "color": "#7f8c8d", "align": "center", "margin": "md"}
+                    ]
+                },
+                "footer": {
+                    "type": "box",
+                    "layout": "vertical",
+                    "contents": [
+                        postback_button("➡️ 更多訂單", Slot("data"), "primary", color="#3498db")
+                    ]
+                }
+            })
+        ]
+    }
+})
+
+# 訂單 bubble 的欄位
+def order_view_values(order):
+    return {
+        "title": f"📋 #{order['id']}",
+        "created_at": datetime.fromisoformat(order["created_at"]).strftime("%m/%d %H:%M"),
+        "status": ORDER_STATUS.get(order["status"], "❓ 未知狀態"),
+        "status_color": ORDER_STATUS_COLORS.get(order["status"], "#95a5a6"),
+        "items": [
+            {"name": f"{item['name']} x{item['quantity']}", "subtotal": f"${item['price'] * item['quantity']}"}
+            for item in order["items"]
+        ],
+        "total": f"NT$ {order['total']}"
+    }
+
+# 查看訂單 - 優化版
+@FLEX_BUILD_SECONDS.time("orders")
+def create_orders_view(user_id, before=None):
+    # 多取一筆用來判斷是否還有更早的訂單
+    orders = order_store.list_by_user(user_id, ORDERS_PAGE_SIZE + 1, before=before)
+    has_more = len(orders) > ORDERS_PAGE_SIZE
+    orders = orders[:ORDERS_PAGE_SIZE]
+    return orders_message(orders, has_more)
+
+def orders_message(orders, has_more=False):
+    if not orders:
+        return NO_ORDERS_TEMPLATE.message()
     
-    line_bot_api.reply_message(event.reply_token, flex_message)
+    return ORDERS_TEMPLATE.message({
+        "orders": [order_view_values(order) for order in orders],
+        "more": [{"data": postback_data("more_orders", before=orders[-1]["id"])}] if has_more else []
+    })
+
+def view_orders(event, user_id, before=None):
+    messenger.reply_message(event.reply_token, create_orders_view(user_id, before))
+
+# 依事件類型分派至對應的處理函式，重送的事件直接略過
+def process_event(event):
+    if not event_dedup.first_seen(event):
+        logger.info("略過重送的事件: %s", getattr(event, "webhook_event_id", None))
+        return
+    try:
+        if isinstance(event, MessageEvent) and isinstance(event.message, TextMessage):
+            handle_message(event)
+        elif isinstance(event, PostbackEvent):
+            handle_postback(event)
+    except Exception:
+        # 處理失敗的事件允許 LINE 重送後再處理一次
+        event_dedup.forget(event)
+        raise
+
+webhook_queue = WebhookQueue(
+    process_event,
+    workers=WEBHOOK_WORKERS,
+    max_size=WEBHOOK_QUEUE_SIZE
+)
+
+# 存放量與快取狀態，於 /metrics 讀取時計算
+metrics.gauge(
+    "linebot_webhook_queue_depth", "Webhook 佇列中等待處理的事件數",
+    lambda: webhook_queue.stats()["depth"]
+)
+metrics.gauge(
+    "linebot_carts_resident", "目前保存的購物車數 (新增購物車與清理時更新)",
+    lambda: cart_store.resident
+)
+metrics.gauge("linebot_orders", "訂單總數", order_store.count)
+metrics.gauge(
+    "linebot_outbound_queue_depth", "等待發送的 LINE 訊息數",
+    lambda: messenger.stats()["depth"]
+)
+metrics.gauge(
+    "linebot_outbound_waiting_retry", "等待重試的 LINE 訊息數",
+    lambda: messenger.stats()["waiting_retry"]
+)
+metrics.gauge(
+    "linebot_status_notifications_pending", "等待發送的訂單狀態通知數",
+    lambda: status_notifier.stats()["pending"]
+)
+metrics.gauge(
+    "linebot_order_stream_subscribers", "連線中的訂單推播畫面數",
+    lambda: order_events.stats()["subscribers"]
+)
+metrics.gauge(
+    "linebot_webhook_dedup_resident", "記憶體中記錄的已處理事件數",
+    lambda: event_dedup.stats()["resident"]
+)
+metrics.gauge(
+    "linebot_menu_render_cache_entries", "已快取的菜單訊息數",
+    lambda: menu_render_cache.stats()["entries"]
+)
+metrics.gauge(
+    "linebot_line_api_connections_opened", "LINE API 連線池新建的連線數",
+    lambda: line_bot_api.http_client.connection_stats()[0]
+)
+
+# 預先建立固定訊息與菜單快取，部署後的第一位用戶不必等待訊息建立
+# gunicorn --preload 時在主行程執行一次，fork 出的 worker 直接共用
+WARM_UP_ON_BOOT = os.getenv("WARM_UP_ON_BOOT", "true").lower() == "true"
+
+def warm_up():
+    started = time.perf_counter()
+    count = static_messages.warm_up()
+    menu_search.refresh()
+    get_categories_menu()
+    categories = list(menu_catalog.menu)
+    for category_id in categories:
+        get_menu_messages(category_id)
+    logger.info(
+        "已預先建立 %d 則固定訊息與 %d 個分類的菜單 (%.1f ms)",
+        count, len(categories), (time.perf_counter() - started) * 1000
+    )
+
+if WARM_UP_ON_BOOT:
+    warm_up()
 
 if __name__ == "__main__":
     app.run(debug=True)
@@ -0,0 +1,132 @@
+"""Flex 訊息建立成本：預先編譯的骨架 (flex_templates) 與逐一建立 SDK 元件的比較
+
+用法: python benchmarks/bench_flex_templates.py [次數]
+
+每個訊息在購物車 1 / 10 / 50 項商品時量測：
+    - build: 建立訊息並取得可序列化的 dict (as_json_dict) 的平均時間
+    - blocks: 建立一次訊息後新增的記憶體區塊數 (tracemalloc，不含已釋放的暫存物件)
+    - KiB: 建立一次訊息的峰值記憶體
+sdk 一欄是改用骨架之前的購物車畫面寫法 (BubbleContainer / BoxComponent / TextComponent)，
+只用來對照，其餘畫面只列出骨架的數據。訂單列表以「每筆訂單的商品數」代入。
+"""
+import os
+import sys
+import timeit
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("LINE_CHANNEL_SECRET", "benchmark")
+os.environ.setdefault("LINE_CHANNEL_ACCESS_TOKEN", "benchmark")
+
+from linebot.models import (  # noqa: E402
+    FlexSendMessage, BubbleContainer, BoxComponent, TextComponent,
+    ButtonComponent, SeparatorComponent, PostbackAction
+)
+
+import app  # noqa: E402
+from store import Cart, CartLine  # noqa: E402
+
+SIZES = (1, 10, 50)
+
+
+def make_cart(size):
+    lines = {}
+    for i in range(size):
+        lines[i + 1] = CartLine(i + 1, f"商品{i + 1}", "main", 50 + i, i % 3 + 1)
+    return Cart(lines, sum(line.subtotal for line in lines.values()), datetime.now(), version=1)
+
+
+def make_orders(size):
+    items = [{"item_id": i + 1, "name": f"商品{i + 1}", "category": "main", "price": 50 + i, "quantity": 1}
+             for i in range(size)]
+    return [
+        {
+            "id": f"2025010100000000{n}", "user_id": "U0", "items": items, "status": "confirmed",
+            "total": sum(item["price"] for item in items), "created_at": "2025-01-01T12:00:00"
+        }
+        for n in range(app.ORDERS_PAGE_SIZE)
+    ]
+
+
+def sdk_cart_message(cart):
+    """改用骨架之前的購物車畫面"""
+    item_components = []
+    for idx, line in enumerate(cart.lines.values(), 1):
+        item_components.append(BoxComponent(
+            layout="vertical",
+            contents=[
+                BoxComponent(layout="baseline", contents=[
+                    TextComponent(text=f"{idx}. {line.name}", size="lg", weight="bold", color="#2c3e50", flex=4),
+                    TextComponent(text=f"x{line.quantity}", size="md", color="#7f8c8d", flex=1, align="end")
+                ]),
+                BoxComponent(layout="baseline", margin="xs", contents=[
+                    TextComponent(text=f"單價 ${line.price}", size="sm", color="#95a5a6", flex=3),
+                    TextComponent(text=f"${line.subtotal}", size="md", weight="bold", color="#e74c3c", flex=1, align="end")
+                ])
+            ],
+            margin="md"
+        ))
+
+    bubble = BubbleContainer(
+        body=BoxComponent(layout="vertical", contents=[
+            TextComponent(text="🛒 購物車", weight="bold", size="xxl", color="#e74c3c", align="center"),
+            SeparatorComponent(margin="xl", color="#ecf0f1"),
+            BoxComponent(layout="vertical", margin="xl", spacing="md", contents=item_components),
+            SeparatorComponent(margin="xl", color="#ecf0f1"),
+            BoxComponent(layout="baseline", margin="xl", contents=[
+                TextComponent(text="總金額", size="xl", color="#2c3e50", weight="bold", flex=2),
+                TextComponent(text=f"NT$ {cart.total}", size="xxl", color="#e74c3c", weight="bold", flex=2, align="end")
+            ])
+        ]),
+        footer=BoxComponent(layout="vertical", spacing="md", contents=[
+            ButtonComponent(style="primary", color="#27ae60", height="md",
+                            action=PostbackAction(label="✅ 確認訂單", data="action=confirm_order")),
+            ButtonComponent(style="secondary", height="md",
+                            action=PostbackAction(label="✏️ 編輯購物車", data="action=edit_cart")),
+            ButtonComponent(style="secondary", height="md",
+                            action=PostbackAction(label="⬅️ 繼續點餐", data="action=view_categories"))
+        ])
+    )
+    return FlexSendMessage(alt_text="🛒 購物車內容", contents=bubble)
+
+
+def measure(build, number):
+    """回傳 (平均微秒, 配置區塊數, 峰值 KiB)"""
+    seconds = timeit.timeit(lambda: build().as_json_dict(), number=number) / number
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    tracemalloc.reset_peak()
+    result = build().as_json_dict()
+    _, peak = tracemalloc.get_traced_memory()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    blocks = sum(stat.count_diff for stat in after.compare_to(before, "filename") if stat.count_diff > 0)
+    del result
+    return seconds * 1e6, blocks, peak / 1024
+
+
+def main():
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+
+    print(f"{'view':<22}{'lines':>6}{'build (us)':>12}{'blocks':>8}{'KiB':>8}")
+    for size in SIZES:
+        cart = make_cart(size)
+        orders = make_orders(size)
+        assert sdk_cart_message(cart).as_json_dict() == app.cart_message(cart).as_json_dict()
+        cases = [
+            ("cart (sdk)", lambda: sdk_cart_message(cart)),
+            ("cart", lambda: app.cart_message(cart)),
+            ("edit_cart", lambda: app.edit_cart_message(cart)),
+            ("order_confirmation", lambda: app.order_confirmation_message(cart, "20250101AQAAG0080")),
+            ("orders", lambda: app.orders_message(orders, has_more=True))
+        ]
+        for name, build in cases:
+            micros, blocks, peak = measure(build, number)
+            print(f"{name:<22}{size:>6}{micros:>12.1f}{blocks:>8}{peak:>8.1f}")
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""菜單訊息建立成本比較：每次重新建立 vs 菜單快取
+
+用法: python benchmarks/bench_menu_render.py [次數]
+"""
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("LINE_CHANNEL_SECRET", "benchmark")
+os.environ.setdefault("LINE_CHANNEL_ACCESS_TOKEN", "benchmark")
+
+import app  # noqa: E402
+
+
+def serialize(messages):
+    # 與 LineBotApi.reply_message 相同的序列化步驟
+    if not isinstance(messages, list):
+        messages = [messages]
+    return json.dumps({"messages": [m.as_json_dict() for m in messages]})
+
+
+def main():
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+    cases = [("categories", app.create_categories_menu, app.get_categories_menu)]
+    for category_id in app.MENU:
+        cases.append((
+            f"menu:{category_id}",
+            lambda c=category_id: app.create_menu_template(c),
+            lambda c=category_id: app.get_menu_messages(c)
+        ))
+
+    print(f"{'payload':<20}{'rebuild (us)':>14}{'cached (us)':>14}{'speedup':>10}")
+    for name, build, cached in cases:
+        cached()  # 預熱快取
+        before = timeit.timeit(lambda: serialize(build()), number=number) / number * 1e6
+        after = timeit.timeit(lambda: serialize(cached()), number=number) / number * 1e6
+        print(f"{name:<20}{before:>14.1f}{after:>14.1f}{before / after:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
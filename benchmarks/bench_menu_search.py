@@ -0,0 +1,82 @@
+"""菜單搜尋成本：MenuSearchIndex 的建立、增量更新與查詢時間
+
+用法: python benchmarks/bench_menu_search.py [商品數] [次數]
+
+以合成的商品名稱與描述量測：
+    - build: 第一次建立整個索引
+    - refresh: 菜單版本變更、只有一項商品被修改時的增量更新
+    - search: 不同長度查詢的平均時間；cold 為每次重新計分 (查詢結果快取未命中)，
+      cached 為菜單未變更時重複相同查詢，另列出線性掃描 (名稱或描述包含查詢字串) 作為對照
+"""
+import itertools
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from command_matcher import normalize  # noqa: E402
+from menu_search import MenuSearchIndex  # noqa: E402
+
+ADJECTIVES = ["經典", "雙層", "辣味", "起司", "照燒", "香草", "炙燒", "黑胡椒", "蜂蜜", "檸檬"]
+NOUNS = ["牛肉堡", "雞腿堡", "豬排堡", "薯條", "雞塊", "可樂", "紅茶", "奶茶", "沙拉", "濃湯", "冰淇淋", "鬆餅"]
+DESCRIPTIONS = ["現點現做", "嚴選食材", "份量加大", "店長推薦", "期間限定", "酥脆多汁", "清爽解膩"]
+QUERIES = ["堡", "可樂", "起司雞腿堡", "黑胡椒牛肉堡", "cheese"]
+
+
+def make_items(size):
+    rng = random.Random(0)
+    names = itertools.cycle(f"{adjective}{noun}" for noun in NOUNS for adjective in ADJECTIVES)
+    return [
+        {
+            "id": i + 1,
+            "name": f"{next(names)} {i + 1}號",
+            "desc": "，".join(rng.sample(DESCRIPTIONS, 2)),
+            "price": 30 + i % 120
+        }
+        for i in range(size)
+    ]
+
+
+def linear_search(items, query):
+    return [item for item in items if query in item["name"] or query in item["desc"]]
+
+
+def per_call(func, number):
+    started = time.perf_counter()
+    for _ in range(number):
+        func()
+    return (time.perf_counter() - started) / number * 1e6
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    number = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    items = make_items(size)
+    version = [1]
+    index = MenuSearchIndex(lambda: items, lambda: version[0])
+
+    started = time.perf_counter()
+    index.refresh()
+    print(f"build: {size} items in {(time.perf_counter() - started) * 1e3:.1f} ms {index.stats()}")
+
+    # 模擬後台修改一項商品：MenuCatalog 只替換有異動的 dict
+    items[size // 2] = dict(items[size // 2], name="限定松露牛肉堡")
+    version[0] += 1
+    started = time.perf_counter()
+    changed = index.refresh()
+    print(f"refresh: {changed} item(s) in {(time.perf_counter() - started) * 1e3:.2f} ms")
+    print()
+
+    print(f"{'query':<16}{'results':>8}{'cold (us)':>11}{'cached (us)':>13}{'linear (us)':>13}")
+    for query in QUERIES:
+        results = index.search(query, limit=10)
+        cold = per_call(lambda: index._rank(normalize(query), 10), number)
+        cached = per_call(lambda: index.search(query, limit=10), number)
+        linear = per_call(lambda: linear_search(items, query), max(1, number // 10))
+        print(f"{query:<16}{len(results):>8}{cold:>11.1f}{cached:>13.1f}{linear:>13.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""回覆請求的序列化成本：SDK 的 reply_message 與 line_client.reply_raw 的比較
+
+用法: python benchmarks/bench_reply_serialization.py [次數]
+
+只量測組出 HTTP 請求內容所花的 CPU 時間 (time.process_time)，不實際送出：
+    - sdk: 每次以 SDK 元件建立訊息，再由 LineBotApi.reply_message 序列化 (快取之前的做法)
+    - sdk+cache: 已快取的訊息 dict，仍由 LineBotApi.reply_message 以 json.dumps 序列化整個請求
+    - raw/json: reply_raw，使用標準函式庫 json
+    - raw/orjson: reply_raw，使用 orjson (沒有安裝時略過)
+固定訊息與菜單在快取時已經序列化 (encoder 只影響那一次)，reply_raw 只需組合 bytes；
+購物車每次由骨架產生新的訊息，每次回覆都要以目前的 encoder 序列化一次。
+"""
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("LINE_CHANNEL_SECRET", "benchmark")
+os.environ.setdefault("LINE_CHANNEL_ACCESS_TOKEN", "benchmark")
+
+import app  # noqa: E402
+import line_client  # noqa: E402
+import menu_cache  # noqa: E402
+from store import Cart, CartLine  # noqa: E402
+
+REPLY_TOKEN = "nHuyWiB7yP5Zw52FIkcQobQuGDXCTA"
+
+
+class NullLineBotApi(app.LineBotApi):
+    """序列化完成後直接丟棄請求"""
+
+    def _post(self, path, endpoint=None, data=None, headers=None, timeout=None):
+        return None
+
+
+def make_cart(size):
+    lines = {i + 1: CartLine(i + 1, f"商品{i + 1}", "main", 50 + i, 1) for i in range(size)}
+    return Cart(lines, sum(line.subtotal for line in lines.values()), datetime.now(), version=1)
+
+
+def use_encoder(encoder):
+    line_client.dumps = encoder
+    menu_cache.dumps = encoder
+
+
+def cpu_per_call(func, number):
+    started = time.process_time()
+    for _ in range(number):
+        func()
+    return (time.process_time() - started) / number * 1e6
+
+
+def main():
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    api = NullLineBotApi("benchmark")
+    category_id = next(iter(app.MENU))
+    cart = make_cart(10)
+
+    cases = [
+        ("welcome", app.create_welcome_message, lambda: app.static_messages.get("welcome")),
+        ("help", app.create_help_message, lambda: app.static_messages.get("help")),
+        (f"menu:{category_id}", lambda: app.create_menu_template(category_id),
+         lambda: app.get_menu_messages(category_id)),
+        ("cart (10 lines)", None, lambda: app.cart_message(cart))
+    ]
+    encoders = [("raw/json", line_client._json_dumps)]
+    if line_client.orjson is not None:
+        encoders.append(("raw/orjson", line_client.orjson.dumps))
+
+    columns = ["sdk", "sdk+cache"] + [name for name, _ in encoders]
+    print(f"{'reply':<22}" + "".join(f"{name + ' (us)':>16}" for name in columns))
+    for name, build, cached in cases:
+        row = []
+        if build is not None:
+            row.append(cpu_per_call(lambda: api.reply_message(REPLY_TOKEN, build()), number))
+        else:
+            row.append(None)
+        row.append(cpu_per_call(lambda: api.reply_message(REPLY_TOKEN, cached()), number))
+        for _, encoder in encoders:
+            use_encoder(encoder)
+            row.append(cpu_per_call(lambda: line_client.reply_raw(api, REPLY_TOKEN, cached()), number))
+        print(f"{name:<22}" + "".join(f"{'-':>16}" if value is None else f"{value:>16.1f}" for value in row))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""結帳並行壓力測試：多個行程 / 執行緒同時對同一批用戶加入商品與結帳
+
+用法:
+    python benchmarks/checkout_stress.py --threads 16 --rounds 50
+    python benchmarks/checkout_stress.py --processes 4 --threads 8 --users 20
+
+每一輪所有執行緒對同一個 (用戶, 訂單編號) 結帳，模擬重複點擊與 Webhook 重送；
+部分結帳帶入讀取時的購物車版本，模擬確認畫面之後購物車又被修改。
+結束後檢查：
+    - 每個訂單編號只建立一次，且回報 created 的次數與訂單數相同
+    - 每筆訂單的總金額等於商品小計加總
+    - 加入購物車的總金額 = 訂單總金額 + 剩餘購物車總金額 (沒有商品遺失或重複)
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from order_ids import order_id_floor  # noqa: E402
+from store import Database, CartStore, OrderStore, CHECKOUT_CREATED  # noqa: E402
+
+ITEMS = [(1, "main", "經典漢堡", 70), (5, "side", "薯條", 50), (9, "drink", "可樂", 30)]
+CART_TTL = timedelta(hours=24)
+# 每個 (輪次, 用戶) 的確認單編號；各行程以相同的時間推算，才會對同一個編號結帳
+ORDER_ID_EPOCH = datetime(2025, 1, 1, 12)
+
+
+def confirmation_id(round_no, user_no, users):
+    return order_id_floor(ORDER_ID_EPOCH + timedelta(milliseconds=round_no * users + user_no))
+
+
+def hammer(path, worker, threads, rounds, users):
+    """單一行程：多個執行緒輪流加入商品並結帳，回傳 (加入金額, 結帳結果次數)"""
+    db = Database(path)
+    cart_store = CartStore(db, ttl=CART_TTL)
+    order_store = OrderStore(db)
+    added = [0] * threads
+    results = [Counter() for _ in range(threads)]
+
+    def run(index):
+        rng = random.Random(worker * 1000 + index)
+        for round_no in range(rounds):
+            for user_no in range(users):
+                user_id = f"Ustress{user_no:04d}"
+                item_id, category, name, price = rng.choice(ITEMS)
+                cart_store.add_item(user_id, item_id, category, name, price)
+                added[index] += price
+
+                version = None
+                if rng.random() < 0.3:
+                    cart = cart_store.get(user_id)
+                    version = cart.version if cart is not None else None
+                result, _ = order_store.checkout(
+                    user_id, confirmation_id(round_no, user_no, users), "confirmed",
+                    cart_ttl=CART_TTL, expected_version=version
+                )
+                results[index][result] += 1
+
+    pool = [threading.Thread(target=run, args=(i,)) for i in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return sum(added), sum(results, Counter())
+
+
+def hammer_process(args):
+    return hammer(*args)
+
+
+def verify(path, added, results):
+    db = Database(path)
+    conn = db.connection()
+    errors = []
+
+    orders = conn.execute("SELECT id, items, total FROM orders").fetchall()
+    ids = [row["id"] for row in orders]
+    if len(ids) != len(set(ids)):
+        errors.append("訂單編號重複")
+    if results[CHECKOUT_CREATED] != len(orders):
+        errors.append(f"created 次數 {results[CHECKOUT_CREATED]} 與訂單數 {len(orders)} 不符")
+
+    order_total = 0
+    for row in orders:
+        items = json.loads(row["items"])
+        if sum(item["price"] * item["quantity"] for item in items) != row["total"]:
+            errors.append(f"訂單 {row['id']} 總金額與商品不符")
+        order_total += row["total"]
+
+    cart_total = conn.execute("SELECT COALESCE(SUM(price * quantity), 0) FROM cart_items").fetchone()[0]
+    cart_counter = conn.execute("SELECT COALESCE(SUM(total), 0) FROM carts").fetchone()[0]
+    if cart_total != cart_counter:
+        errors.append(f"購物車總金額 {cart_counter} 與商品小計 {cart_total} 不符")
+    if added != order_total + cart_total:
+        errors.append(f"加入 {added} != 訂單 {order_total} + 購物車 {cart_total}")
+    return len(orders), order_total, cart_total, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--processes", type=int, default=1, help="模擬多個 gunicorn worker")
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--rounds", type=int, default=30)
+    parser.add_argument("--users", type=int, default=10)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(prefix="checkout-stress-"), "restaurant.db")
+    Database(path).init_schema()
+
+    started = time.perf_counter()
+    jobs = [(path, worker, args.threads, args.rounds, args.users) for worker in range(args.processes)]
+    if args.processes == 1:
+        outcomes = [hammer_process(jobs[0])]
+    else:
+        with multiprocessing.Pool(args.processes) as pool:
+            outcomes = pool.map(hammer_process, jobs)
+    elapsed = time.perf_counter() - started
+
+    added = sum(outcome[0] for outcome in outcomes)
+    results = sum((outcome[1] for outcome in outcomes), Counter())
+    orders, order_total, cart_total, errors = verify(path, added, results)
+
+    checkouts = sum(results.values())
+    print(f"processes={args.processes} threads={args.threads} rounds={args.rounds} users={args.users}")
+    print(f"checkouts: {checkouts} in {elapsed:.2f}s ({checkouts / elapsed:.0f}/s) "
+          + ", ".join(f"{name}={count}" for name, count in sorted(results.items())))
+    print(f"orders: {orders}, order total: {order_total}, left in carts: {cart_total}, added: {added}")
+    if errors:
+        for error in errors:
+            print("FAIL:", error)
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
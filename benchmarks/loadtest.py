@@ -0,0 +1,233 @@
+"""Webhook 壓力測試：產生簽章正確的事件重播到 /callback，LINE API 由本機模擬伺服器代替
+
+用法:
+    python benchmarks/loadtest.py --requests 2000 --concurrency 32
+    python benchmarks/loadtest.py --async-webhook --api-latency 80
+
+預設在同一個行程內以多執行緒 werkzeug 伺服器啟動 app；
+指定 --target 時改打外部已啟動的服務 (該服務需以相同的
+LINE_CHANNEL_SECRET 啟動，並將 LINE_API_ENDPOINT 指向 --api-port 的模擬伺服器)。
+"""
+import argparse
+import base64
+import hashlib
+import hmac
+import itertools
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from order_ids import MAX_NODES, OrderIdGenerator  # noqa: E402
+
+CHANNEL_SECRET = "loadtest-secret"
+# 直接送出結帳的 postback 需要格式正確的訂單編號；使用 app 不會用到的節點編號，避免與確認畫面產生的編號重複
+order_ids = OrderIdGenerator(MAX_NODES - 1, lambda: 0)
+
+# 模擬使用者的操作，依權重隨機挑選
+SCENARIO = [
+    ("text:點餐", 2, lambda seq: text_event("點餐")),
+    ("text:cart", 2, lambda seq: text_event("cart")),
+    ("postback:view_menu", 3, lambda seq: postback_event("action=view_menu&category=main")),
+    ("postback:add_to_cart", 6, lambda seq: postback_event("action=add_to_cart&category=main&item=經典漢堡")),
+    ("postback:view_cart", 3, lambda seq: postback_event("action=view_cart")),
+    ("postback:confirm_order", 1, lambda seq: postback_event("action=confirm_order")),
+    ("postback:checkout", 1, lambda seq: postback_event(f"action=checkout&order_id={order_ids.next_id()}")),
+    ("postback:view_orders", 1, lambda seq: postback_event("action=view_orders")),
+]
+
+
+class MockLineApi(BaseHTTPRequestHandler):
+    """模擬 LINE Messaging API，所有請求回傳 200 {}"""
+
+    protocol_version = "HTTP/1.1"
+    latency = 0.0
+    calls = defaultdict(int)
+    lock = threading.Lock()
+
+    def _handle(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            self.calls[self.path] += 1
+
+        body = b"{}"
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST = do_PUT = do_DELETE = _handle
+
+    def log_message(self, *args):
+        pass
+
+
+def base_event(user_id):
+    return {
+        "mode": "active",
+        "timestamp": int(time.time() * 1000),
+        "source": {"type": "user", "userId": user_id},
+        "replyToken": os.urandom(16).hex(),
+        "webhookEventId": os.urandom(13).hex().upper(),
+        "deliveryContext": {"isRedelivery": False},
+    }
+
+
+def text_event(text):
+    return {"type": "message", "message": {"type": "text", "id": str(random.getrandbits(40)), "text": text}}
+
+
+def postback_event(data):
+    return {"type": "postback", "postback": {"data": data}}
+
+
+def sign(body):
+    digest = hmac.new(CHANNEL_SECRET.encode(), body, hashlib.sha256).digest()
+    return base64.b64encode(digest).decode()
+
+
+def build_requests(total, users):
+    """預先產生所有請求的 (動作名稱, body, 簽章)，避免產生成本計入延遲"""
+    names = [name for name, _, _ in SCENARIO]
+    weights = [weight for _, weight, _ in SCENARIO]
+    builders = {name: builder for name, _, builder in SCENARIO}
+    seq = itertools.count()
+
+    prepared = []
+    for _ in range(total):
+        name = random.choices(names, weights)[0]
+        event = base_event(f"Uloadtest{random.randrange(users):05d}")
+        event.update(builders[name](next(seq)))
+        body = json.dumps({"destination": "Uloadtest", "events": [event]}, ensure_ascii=False).encode()
+        prepared.append((name, body, sign(body)))
+    return prepared
+
+
+def start_server(server):
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return thread
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--api-latency", type=float, default=30, help="模擬 LINE API 延遲 (毫秒)")
+    parser.add_argument("--api-port", type=int, default=0)
+    parser.add_argument("--async-webhook", action="store_true", help="以 WEBHOOK_ASYNC=true 啟動 app")
+    parser.add_argument("--target", help="外部服務的 /callback 網址")
+    args = parser.parse_args()
+
+    MockLineApi.latency = args.api_latency / 1000
+    api_server = ThreadingHTTPServer(("127.0.0.1", args.api_port), MockLineApi)
+    api_server.daemon_threads = True
+    start_server(api_server)
+    api_endpoint = f"http://127.0.0.1:{api_server.server_port}"
+
+    app_module = None
+    if args.target:
+        target = args.target
+    else:
+        from werkzeug.serving import make_server
+
+        os.environ.update({
+            "LINE_CHANNEL_SECRET": CHANNEL_SECRET,
+            "LINE_CHANNEL_ACCESS_TOKEN": "loadtest-token",
+            "LINE_API_ENDPOINT": api_endpoint,
+            "DATABASE_PATH": os.path.join(tempfile.mkdtemp(prefix="loadtest-"), "restaurant.db"),
+            "WEBHOOK_ASYNC": "true" if args.async_webhook else "false",
+        })
+        import app as app_module
+        # app 預設輸出 INFO 日誌，壓測時只保留警告
+        logging.getLogger().setLevel(logging.WARNING)
+        logging.getLogger("werkzeug").setLevel(logging.WARNING)
+        app_server = make_server("127.0.0.1", 0, app_module.app, threaded=True)
+        start_server(app_server)
+        target = f"http://127.0.0.1:{app_server.server_port}/callback"
+
+    prepared = build_requests(args.requests, args.users)
+    local = threading.local()
+    results = defaultdict(list)
+    errors = defaultdict(int)
+    lock = threading.Lock()
+
+    def fire(item):
+        name, body, signature = item
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        started = time.perf_counter()
+        try:
+            ok = session.post(
+                target, data=body,
+                headers={"Content-Type": "application/json", "X-Line-Signature": signature},
+                timeout=30
+            ).status_code == 200
+        except requests.RequestException:
+            ok = False
+        elapsed = (time.perf_counter() - started) * 1000
+        with lock:
+            results[name].append(elapsed)
+            if not ok:
+                errors[name] += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(fire, prepared))
+    wall = time.perf_counter() - started
+
+    # 等待背景佇列處理完畢：非同步模式的 Webhook 事件，以及發送佇列中的 LINE 訊息
+    if app_module is not None:
+        if args.async_webhook:
+            while app_module.webhook_queue.stats()["depth"]:
+                time.sleep(0.05)
+        app_module.messenger.flush(60)
+        drain = time.perf_counter() - started
+    else:
+        drain = wall
+
+    print(f"target={target} requests={args.requests} concurrency={args.concurrency} "
+          f"api_latency={args.api_latency}ms async={args.async_webhook}")
+    print(f"{'action':<26}{'count':>7}{'errors':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    all_latencies = []
+    for name, _, _ in SCENARIO:
+        values = sorted(results.get(name, []))
+        all_latencies.extend(values)
+        print(f"{name:<26}{len(values):>7}{errors.get(name, 0):>8}"
+              f"{percentile(values, 50):>9.1f}{percentile(values, 95):>9.1f}{percentile(values, 99):>9.1f}")
+    all_latencies.sort()
+    print(f"{'TOTAL':<26}{len(all_latencies):>7}{sum(errors.values()):>8}"
+          f"{percentile(all_latencies, 50):>9.1f}{percentile(all_latencies, 95):>9.1f}"
+          f"{percentile(all_latencies, 99):>9.1f}")
+    print(f"throughput: {args.requests / wall:.1f} req/s (wall {wall:.2f}s, drained {drain:.2f}s)")
+    print("mock LINE API calls: " + ", ".join(f"{path}={count}" for path, count in sorted(MockLineApi.calls.items())))
+
+
+if __name__ == "__main__":
+    main()
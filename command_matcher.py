@@ -0,0 +1,237 @@
+import re
+import threading
+import unicodedata
+from collections import Counter
+
+import metrics
+
+COMMAND_MATCHES = metrics.counter(
+    "linebot_text_command_matches_total", "文字訊息比對結果 (exact 完全相同 / typo 錯一個字 / miss 未命中)", ["command", "kind"]
+)
+
+ITEM = "item"
+
+# 比對前移除的空白與標點
+_IGNORED = re.compile(r"[\s!！?？.。,，、~～:：;；'\"「」『』()（）\[\]]+")
+
+# 中文數字 (點餐常用的範圍)
+_CHINESE_NUMBERS = {
+    "一": 1, "兩": 2, "二": 2, "三": 3, "四": 4, "五": 5,
+    "六": 6, "七": 7, "八": 8, "九": 9, "十": 10
+}
+_NUMBER = r"(\d+|[一兩二三四五六七八九十])"
+_UNIT = r"(?:份|個|杯|客|盒|套|pcs?)?"
+# 「2 可樂」「2杯可樂」「兩份薯條」
+_QUANTITY_FIRST = re.compile(rf"^{_NUMBER}\s*{_UNIT}\s*(?:[x×*]\s*)?(.+?)$", re.IGNORECASE)
+# 「可樂 x2」「可樂*2」「可樂 2杯」
+_QUANTITY_LAST = re.compile(rf"^(.+?)\s*(?:[x×*]\s*)?{_NUMBER}\s*{_UNIT}$", re.IGNORECASE)
+
+# 英文前綴與參數之間的分隔
+_PREFIX_SEPARATOR = re.compile(r"[\s:：]")
+
+_UNSET = object()
+
+
+class CommandMatch:
+    """比對結果：command 為指令名稱，商品比對時另有 item 與 quantity，前綴指令另有 argument"""
+
+    __slots__ = ("command", "kind", "item", "quantity", "argument")
+
+    def __init__(self, command, kind, item=None, quantity=1, argument=None):
+        self.command = command
+        self.kind = kind
+        self.item = item
+        self.quantity = quantity
+        self.argument = argument
+
+    def __repr__(self):
+        return f"CommandMatch({self.command!r}, {self.kind!r}, quantity={self.quantity})"
+
+
+def normalize(text):
+    """全形轉半形、英文轉小寫並移除空白與標點"""
+    return _IGNORED.sub("", unicodedata.normalize("NFKC", text).lower())
+
+
+def _deletions(key):
+    return {key[:i] + key[i + 1:] for i in range(len(key))}
+
+
+class FuzzyIndex:
+    """名稱 -> 值的雜湊索引，容許一個字元的錯字
+
+    建立時除了名稱本身，也登記每個名稱刪去一個字元的變形；查詢時以輸入及其刪去一個字元的變形查找，
+    可涵蓋多打、少打、打錯一個字元 (symmetric delete)。查詢次數只與輸入長度有關，與名稱數量無關。
+    長度小於 min_fuzzy_length 的名稱只接受完全相同，避免「訂單」之類的短詞誤判；
+    變形對應到不同的值時視為無法判斷而不採用。
+    """
+
+    _AMBIGUOUS = object()
+
+    def __init__(self, entries=(), min_fuzzy_length=4):
+        self.min_fuzzy_length = min_fuzzy_length
+        self._exact = {}
+        self._fuzzy = {}
+        for name, value in entries:
+            self.add(name, value)
+
+    def add(self, name, value):
+        key = normalize(name)
+        if not key:
+            return
+        self._exact.setdefault(key, value)
+        if len(key) < self.min_fuzzy_length:
+            return
+        for variant in _deletions(key) | {key}:
+            existing = self._fuzzy.get(variant)
+            if existing is None:
+                self._fuzzy[variant] = value
+            elif existing != value:
+                self._fuzzy[variant] = self._AMBIGUOUS
+
+    def lookup(self, key):
+        """回傳 (值, 是否為錯字比對)，找不到時回傳 (None, False)"""
+        value = self._exact.get(key)
+        if value is not None:
+            return value, False
+        if len(key) < self.min_fuzzy_length - 1:
+            return None, False
+
+        candidates = [self._fuzzy.get(key)]
+        candidates.extend(self._fuzzy.get(variant) for variant in _deletions(key))
+        found = None
+        for candidate in candidates:
+            if candidate is None:
+                continue
+            if candidate is self._AMBIGUOUS or (found is not None and found != candidate):
+                return None, False
+            found = candidate
+        return found, found is not None
+
+    def __len__(self):
+        return len(self._exact)
+
+
+class CommandMatcher:
+    """文字指令比對器：啟動時建立別名索引，每則訊息只做固定次數的雜湊查找
+
+    aliases 為 {指令: [別名, ...]}，涵蓋中文、英文、簡體字與常見錯字；
+    prefixes 為 {指令: [前綴, ...]}，例如「搜尋 漢堡」，前綴之後的文字放在 argument
+    (英文前綴後面需要空白或冒號)；
+    沒有對應的指令時改以菜單商品名稱比對，「2 可樂」「可樂 x2」「兩杯紅茶」都會回傳 item 指令。
+    商品索引依 menu_version() 判斷菜單是否變更，變更時重新建立。
+    """
+
+    def __init__(self, aliases, prefixes=None, menu_items=None, menu_version=None,
+                 max_quantity=20):
+        self.max_quantity = max_quantity
+        self._commands = FuzzyIndex(
+            (alias, command) for command, names in aliases.items() for alias in [command, *names]
+        )
+        # 較長的前綴優先，例如「search」在「s」之前
+        self._prefixes = sorted(
+            ((prefix.lower(), command) for command, names in (prefixes or {}).items() for prefix in names),
+            key=lambda entry: -len(entry[0])
+        )
+        self._menu_items = menu_items
+        self._menu_version = menu_version
+        self._items_version = _UNSET
+        self._items = FuzzyIndex()
+        self._lock = threading.Lock()
+
+        # 統計數據；只記錄次數，不保留用戶訊息內容
+        self._stats_lock = threading.Lock()
+        self.hits = Counter()
+        self.misses = 0
+
+    def match(self, text):
+        """比對文字訊息，沒有對應的指令或商品時回傳 None"""
+        key = normalize(text)
+        result = None
+        if key:
+            command, typo = self._commands.lookup(key)
+            if command is not None:
+                result = CommandMatch(command, "typo" if typo else "exact")
+            else:
+                result = self._match_prefix(text) or self._match_item(text, key)
+        self._record(result)
+        return result
+
+    def _match_prefix(self, text):
+        text = unicodedata.normalize("NFKC", text).strip()
+        lowered = text.lower()
+        for prefix, command in self._prefixes:
+            if not lowered.startswith(prefix):
+                continue
+            rest = text[len(prefix):]
+            # 英文前綴後面必須是空白或冒號，避免「findings」「searching」被當成指令
+            if prefix.isascii() and rest and not _PREFIX_SEPARATOR.match(rest):
+                continue
+            return CommandMatch(command, "exact", argument=rest.strip(" :："))
+        return None
+
+    def _match_item(self, text, key):
+        items = self._item_index()
+        if not len(items):
+            return None
+
+        item, typo = items.lookup(key)
+        if item is not None and not typo:
+            return CommandMatch(ITEM, "exact", item, 1)
+        # 整段文字只是錯字比對時 (例如「2 洋蔥」對到「洋蔥圈」)，優先採用能解析出數量的結果
+        fallback = CommandMatch(ITEM, "typo", item, 1) if item is not None else None
+
+        text = unicodedata.normalize("NFKC", text).strip()
+        for pattern, name_group, number_group in ((_QUANTITY_FIRST, 2, 1), (_QUANTITY_LAST, 1, 2)):
+            found = pattern.match(text)
+            if found is None:
+                continue
+            quantity = _parse_quantity(found.group(number_group))
+            item, typo = items.lookup(normalize(found.group(name_group)))
+            if item is not None and 0 < quantity <= self.max_quantity:
+                return CommandMatch(ITEM, "typo" if typo else "exact", item, quantity)
+        return fallback
+
+    def _item_index(self):
+        if self._menu_items is None:
+            return self._items
+        version = self._menu_version() if self._menu_version is not None else None
+        if version != self._items_version:
+            with self._lock:
+                if version != self._items_version:
+                    self._items = FuzzyIndex(
+                        ((item["name"], item) for item in self._menu_items()),
+                        min_fuzzy_length=3
+                    )
+                    self._items_version = version
+        return self._items
+
+    def _record(self, result):
+        if result is not None:
+            with self._stats_lock:
+                self.hits[(result.command, result.kind)] += 1
+            COMMAND_MATCHES.inc(1, result.command, result.kind)
+            return
+        with self._stats_lock:
+            self.misses += 1
+        COMMAND_MATCHES.inc(1, "other", "miss")
+
+    def stats(self):
+        with self._stats_lock:
+            hit_counts = dict(self.hits)
+            misses = self.misses
+        hits = sum(hit_counts.values())
+        total = hits + misses
+        return {
+            "aliases": len(self._commands),
+            "items": len(self._items),
+            "hits": {f"{command}:{kind}": count for (command, kind), count in sorted(hit_counts.items())},
+            "misses": misses,
+            "hit_rate": round(hits / total, 4) if total else 0.0
+        }
+
+
+def _parse_quantity(value):
+    if value.isdigit():
+        return int(value)
+    return _CHINESE_NUMBERS.get(value, 0)
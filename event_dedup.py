@@ -0,0 +1,106 @@
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+
+DUPLICATE_EVENTS = metrics.counter(
+    "linebot_webhook_duplicate_events_total", "因重送而略過的 Webhook 事件數"
+)
+
+
+def event_key(event):
+    """事件的去重鍵：優先使用 webhookEventId，沒有時改用 reply token"""
+    if getattr(event, "webhook_event_id", None):
+        return event.webhook_event_id
+    reply_token = getattr(event, "reply_token", None)
+    if reply_token:
+        return "reply:" + reply_token
+    return None
+
+
+class EventDeduplicator:
+    """以有時間窗、有上限的已處理集合略過 LINE 重送的 Webhook 事件
+
+    記憶體內的集合依收到順序淘汰：超過 window 秒或超過 max_size 筆的最舊項目會被移除。
+    指定 shared (store.EventLog) 時另以 SQLite 記錄，讓多個 gunicorn worker 共用。
+    """
+
+    def __init__(self, window=3600, max_size=50000, shared=None):
+        self.window = window
+        self.max_size = max_size
+        self.shared = shared
+        self._seen = OrderedDict()
+        self._lock = threading.Lock()
+        self._next_prune = 0.0
+
+        # 統計數據
+        self.accepted = 0
+        self.duplicates = 0
+
+    def first_seen(self, event):
+        """第一次收到此事件時記錄並回傳 True，重送的事件回傳 False"""
+        key = event_key(event)
+        if key is None:
+            return True
+
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            duplicate = key in self._seen
+            if not duplicate:
+                self._seen[key] = now
+
+        if not duplicate and self.shared is not None:
+            try:
+                duplicate = not self.shared.claim(key, now)
+            except Exception:
+                # 資料庫暫時無法寫入時仍以記憶體內的集合為準
+                duplicate = False
+            self._prune_shared(now)
+
+        with self._lock:
+            if duplicate:
+                self.duplicates += 1
+            else:
+                self.accepted += 1
+        if duplicate:
+            DUPLICATE_EVENTS.inc()
+        return not duplicate
+
+    def forget(self, event):
+        """處理失敗時移除記錄，讓 LINE 重送的事件可以再處理一次"""
+        key = event_key(event)
+        if key is None:
+            return
+        with self._lock:
+            self._seen.pop(key, None)
+        if self.shared is not None:
+            self.shared.release(key)
+
+    def _expire(self, now):
+        cutoff = now - self.window
+        seen = self._seen
+        while seen:
+            key, received_at = next(iter(seen.items()))
+            if received_at >= cutoff and len(seen) < self.max_size:
+                break
+            seen.popitem(last=False)
+
+    def _prune_shared(self, now):
+        # 每個時間窗清理一次資料庫中過期的記錄
+        if now < self._next_prune:
+            return
+        self._next_prune = now + self.window
+        self.shared.prune(now - self.window)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "window_seconds": self.window,
+                "max_size": self.max_size,
+                "shared": self.shared is not None,
+                "resident": len(self._seen),
+                "accepted": self.accepted,
+                "duplicates": self.duplicates
+            }
@@ -0,0 +1,119 @@
+from menu_cache import CachedMessage
+
+
+class Slot:
+    """骨架中的欄位，render 時以 values[name] 取代"""
+
+    __slots__ = ("name",)
+
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return f"Slot({self.name!r})"
+
+
+class Repeat:
+    """骨架列表中的重複區段，render 時依 values[name] 的每一筆資料展開 item 骨架
+
+    只出現 0 或 1 次的區塊 (例如「更多訂單」按鈕) 也以 Repeat 表示，傳入空列表即可省略。
+    """
+
+    __slots__ = ("name", "render")
+
+    def __init__(self, name, item):
+        self.name = name
+        self.render = _compile(item) or (lambda entry: item)
+
+    def __repr__(self):
+        return f"Repeat({self.name!r})"
+
+
+def _compile(node):
+    """把骨架編譯成 render(values) 函式；不含欄位的子樹回傳 None，render 時直接共用"""
+    if isinstance(node, Slot):
+        name = node.name
+        return lambda values: values[name]
+
+    if isinstance(node, dict):
+        renderers = [(key, _compile(value)) for key, value in node.items()]
+        renderers = [(key, render) for key, render in renderers if render is not None]
+        if not renderers:
+            return None
+        # 先複製整個 dict 保留欄位順序，再覆寫有欄位的鍵
+        base = dict(node)
+
+        def render_dict(values):
+            result = base.copy()
+            for key, render in renderers:
+                result[key] = render(values)
+            return result
+        return render_dict
+
+    if isinstance(node, list):
+        if len(node) == 1 and isinstance(node[0], Repeat):
+            # 最常見的情況：整個 contents 都是重複區段
+            name, render = node[0].name, node[0].render
+            return lambda values: [render(entry) for entry in values[name]]
+
+        parts = []
+        dynamic = False
+        for child in node:
+            if isinstance(child, Repeat):
+                parts.append((True, child))
+                dynamic = True
+            else:
+                render = _compile(child)
+                parts.append((False, child if render is None else render))
+                dynamic = dynamic or render is not None
+        if not dynamic:
+            return None
+
+        def render_list(values):
+            result = []
+            for repeat, part in parts:
+                if repeat:
+                    result.extend([part.render(entry) for entry in values[part.name]])
+                elif callable(part):
+                    result.append(part(values))
+                else:
+                    result.append(part)
+            return result
+        return render_list
+
+    return None
+
+
+class FlexTemplate:
+    """預先編譯的訊息骨架
+
+    skeleton 是 LINE Messaging API 的 JSON 結構 (鍵名為 camelCase)，以 Slot / Repeat 標記
+    會變動的部分。編譯時找出所有欄位的位置，render 只重建通往欄位的 dict / list，
+    其餘不變的子樹直接共用同一個物件，不必逐一建立 SDK 元件再序列化。
+    """
+
+    def __init__(self, skeleton):
+        self.skeleton = skeleton
+        self._render = _compile(skeleton)
+
+    def render(self, values=None):
+        """填入欄位，回傳可直接序列化的 dict (共用的子樹不可修改)"""
+        if self._render is None:
+            return self.skeleton
+        return self._render(values)
+
+    def message(self, values=None):
+        """填入欄位，回傳可交給 LineBotApi / OutboundQueue 發送的訊息"""
+        return CachedMessage(self.render(values))
+
+
+def postback_button(label, data, style="secondary", height="md", **options):
+    """Postback 按鈕的骨架，data 可以是 Slot"""
+    button = {
+        "type": "button",
+        "action": {"type": "postback", "label": label, "data": data},
+        "style": style,
+        "height": height
+    }
+    button.update(options)
+    return button
@@ -0,0 +1,14 @@
+import os
+
+# gthread：每個請求 (包含訂單即時推播的 SSE 連線) 在連線期間占用一個執行緒
+#
+# 執行緒數量估算 (每個 worker 行程各自計算)：
+#     WEB_THREADS >= ORDER_STREAM_MAX_CLIENTS + ORDER_STREAM_RESERVED_THREADS
+# SSE 連線最長會占用執行緒 ORDER_STREAM_MAX_SECONDS 秒，保留的執行緒用來處理 /callback
+# 與其他請求；保留不足時 LINE Webhook 會排隊到逾時。app.py 會把 ORDER_STREAM_MAX_CLIENTS
+# 限制在 WEB_THREADS - ORDER_STREAM_RESERVED_THREADS 以內，超過上限的管理畫面改以輪詢更新。
+# 預設 16 個執行緒、保留 6 個：每個 worker 最多 10 條 SSE 連線 (10 個同時開啟的管理畫面)；
+# 需要更多管理畫面時調高 WEB_THREADS 或 WEB_CONCURRENCY，而不是減少保留的執行緒。
+worker_class = "gthread"
+workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+threads = int(os.getenv("WEB_THREADS", "16"))
@@ -1,72 +1,187 @@
+import os
 import sqlite3
 from werkzeug.security import generate_password_hash
 
+DATABASE_PATH = os.getenv("DATABASE_PATH", "restaurant.db")
+
+# 菜單資料表；menu_version 由觸發器維護，供機器人判斷是否需要重新載入菜單
+# 索引與觸發器會用到後來新增的欄位，須在 migrate_menu_tables 補齊欄位之後才建立
+TABLES = """
+CREATE TABLE IF NOT EXISTS menu_categories (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    slug TEXT NOT NULL UNIQUE,
+    name TEXT NOT NULL,
+    description TEXT,
+    image_url TEXT,
+    display_order INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS menu_items (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    category_id INTEGER NOT NULL REFERENCES menu_categories (id),
+    name TEXT NOT NULL,
+    description TEXT,
+    price INTEGER NOT NULL,
+    image_url TEXT,
+    is_available INTEGER NOT NULL DEFAULT 1,
+    is_recommended INTEGER NOT NULL DEFAULT 0,
+    display_order INTEGER NOT NULL DEFAULT 0,
+    version INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS admin_users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username TEXT NOT NULL UNIQUE,
+    password_hash TEXT NOT NULL,
+    role TEXT NOT NULL
+);
+
+-- version: 任何菜單變更都會遞增；structure_version: 分類變更或刪除商品時遞增 (需完整重新載入)
+CREATE TABLE IF NOT EXISTS menu_version (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    version INTEGER NOT NULL,
+    structure_version INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO menu_version (id, version, structure_version) VALUES (1, 0, 0);
+"""
+
+INDEXES = """
+CREATE UNIQUE INDEX IF NOT EXISTS idx_menu_categories_slug ON menu_categories (slug);
+CREATE INDEX IF NOT EXISTS idx_menu_items_version ON menu_items (version);
+
+CREATE TRIGGER IF NOT EXISTS menu_items_after_insert AFTER INSERT ON menu_items
+BEGIN
+    UPDATE menu_version SET version = version + 1;
+    UPDATE menu_items SET version = (SELECT version FROM menu_version) WHERE id = NEW.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS menu_items_after_update AFTER UPDATE ON menu_items
+WHEN NEW.version = OLD.version
+BEGIN
+    UPDATE menu_version SET version = version + 1;
+    UPDATE menu_items SET version = (SELECT version FROM menu_version) WHERE id = NEW.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS menu_items_after_delete AFTER DELETE ON menu_items
+BEGIN
+    UPDATE menu_version SET version = version + 1, structure_version = structure_version + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS menu_categories_after_insert AFTER INSERT ON menu_categories
+BEGIN
+    UPDATE menu_version SET version = version + 1, structure_version = structure_version + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS menu_categories_after_update AFTER UPDATE ON menu_categories
+BEGIN
+    UPDATE menu_version SET version = version + 1, structure_version = structure_version + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS menu_categories_after_delete AFTER DELETE ON menu_categories
+BEGIN
+    UPDATE menu_version SET version = version + 1, structure_version = structure_version + 1;
+END;
+"""
+
+# 舊版資料庫的分類沒有 slug，依原本的分類名稱補上，其他分類以 id 命名
+BASELINE_CATEGORY_SLUGS = {
+    '🔥 推薦餐點': 'recommended',
+    '🍔 主餐': 'main',
+    '🍟 副餐': 'side',
+    '🥤 飲料': 'drink'
+}
+
+def table_columns(c, table):
+    return {row[1] for row in c.execute(f"PRAGMA table_info({table})")}
+
+# 為舊版的菜單資料表補上新欄位
+def migrate_menu_tables(c):
+    if 'version' not in table_columns(c, 'menu_items'):
+        c.execute("ALTER TABLE menu_items ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+
+    if 'slug' not in table_columns(c, 'menu_categories'):
+        c.execute("ALTER TABLE menu_categories ADD COLUMN slug TEXT")
+        c.execute("SELECT id, name FROM menu_categories")
+        c.executemany(
+            "UPDATE menu_categories SET slug = ? WHERE id = ?",
+            [(BASELINE_CATEGORY_SLUGS.get(name, f'category-{id}'), id) for id, name in c.fetchall()]
+        )
+
 def init_database():
-    conn = sqlite3.connect('restaurant.db')
+    conn = sqlite3.connect(DATABASE_PATH)
     c = conn.cursor()
-    
+    c.executescript(TABLES)
+    migrate_menu_tables(c)
+    c.executescript(INDEXES)
+
+    # 已有菜單資料時不重複建立
+    c.execute("SELECT COUNT(*) FROM menu_categories")
+    if c.fetchone()[0] == 0:
+        seed_menu(c)
+
+    # 創建管理員帳號
+    try:
+        c.execute("INSERT INTO admin_users (username, password_hash, role) VALUES (?, ?, ?)",
+                  ('admin', generate_password_hash('admin123'), 'admin'))
+        c.execute("INSERT INTO admin_users (username, password_hash, role) VALUES (?, ?, ?)",
+                  ('staff', generate_password_hash('staff123'), 'staff'))
+    except sqlite3.IntegrityError:
+        pass  # 用戶已存在
+
+    conn.commit()
+    conn.close()
+    print("數據庫初始化完成！")
+
+def seed_menu(c):
     # 創建菜單分類
     categories = [
-        ('推薦餐點', '最受歡迎的餐點組合', 'https://via.placeholder.com/300x200/FF6B6B/FFFFFF?text=推薦餐點', 1),
-        ('主餐', '美味主餐', 'https://via.placeholder.com/300x200/4ECDC4/FFFFFF?text=主餐', 2),
-        ('副餐', '精選副餐', 'https://via.placeholder.com/300x200/45B7D1/FFFFFF?text=副餐', 3),
-        ('飲料', '清涼飲品', 'https://via.placeholder.com/300x200/96CEB4/FFFFFF?text=飲料', 4)
+        ('recommended', '🔥 推薦餐點', '最受歡迎的餐點組合', 'https://images.unsplash.com/photo-1514933651103-005eec06c04b?w=1024&h=1024&fit=crop', 1),
+        ('main', '🍔 主餐', '美味主餐', 'https://images.unsplash.com/photo-1571091718767-18b5b1457add?w=1024&h=1024&fit=crop', 2),
+        ('side', '🍟 副餐', '精選副餐', 'https://images.unsplash.com/photo-1573080496219-bb080dd4f877?w=1024&h=1024&fit=crop', 3),
+        ('drink', '🥤 飲料', '清涼飲品', 'https://images.unsplash.com/photo-1544145945-f90425340c7e?w=1024&h=1024&fit=crop', 4)
     ]
-    
+
     c.executemany(
-        'INSERT INTO menu_categories (name, description, image_url, display_order) VALUES (?, ?, ?, ?)',
+        'INSERT INTO menu_categories (slug, name, description, image_url, display_order) VALUES (?, ?, ?, ?, ?)',
         categories
     )
-    
+
     # 獲取分類ID
-    c.execute("SELECT id, name FROM menu_categories")
-    category_map = {name: id for id, name in c.fetchall()}
-    
+    c.execute("SELECT id, slug FROM menu_categories")
+    category_map = {slug: id for id, slug in c.fetchall()}
+
     # 創建菜單項目
     menu_items = [
         # 推薦餐點
-        (category_map['推薦餐點'], '1號餐', '漢堡+薯條+可樂', 120, 'https://via.placeholder.com/300x200/FF6B6B/FFFFFF?text=1號餐', 1, 1, 1),
-        (category_map['推薦餐點'], '2號餐', '雙層漢堡+薯條+紅茶', 150, 'https://via.placeholder.com/300x200/4ECDC4/FFFFFF?text=2號餐', 1, 1, 2),
-        (category_map['推薦餐點'], '3號餐', '雞腿堡+雞塊+雪碧', 180, 'https://via.placeholder.com/300x200/45B7D1/FFFFFF?text=3號餐', 1, 1, 3),
-        
+        (category_map['recommended'], '1號餐', '漢堡+薯條+可樂', 120, 'https://images.unsplash.com/photo-1571091718767-18b5b1457add?w=400&h=300&fit=crop', 1, 1, 1),
+        (category_map['recommended'], '2號餐', '雙層漢堡+薯條+紅茶', 150, 'https://images.unsplash.com/photo-1553979459-d2229ba7433a?w=400&h=300&fit=crop', 1, 1, 2),
+        (category_map['recommended'], '3號餐', '雞腿堡+雞塊+雪碧', 180, 'https://images.unsplash.com/photo-1594212699903-ec8a3eca50f5?w=400&h=300&fit=crop', 1, 1, 3),
+
         # 主餐
-        (category_map['主餐'], '經典漢堡', '100%純牛肉', 70, 'https://via.placeholder.com/300x200/FF6B6B/FFFFFF?text=經典漢堡', 1, 0, 1),
-        (category_map['主餐'], '雙層起司堡', '雙倍起司雙倍滿足', 90, 'https://via.placeholder.com/300x200/4ECDC4/FFFFFF?text=雙層起司堡', 1, 0, 2),
-        (category_map['主餐'], '照燒雞腿堡', '鮮嫩多汁的雞腿肉', 85, 'https://via.placeholder.com/300x200/45B7D1/FFFFFF?text=照燒雞腿堡', 1, 0, 3),
-        (category_map['主餐'], '素食蔬菜堡', '健康素食選擇', 75, 'https://via.placeholder.com/300x200/96CEB4/FFFFFF?text=素食蔬菜堡', 1, 0, 4),
-        
+        (category_map['main'], '經典漢堡', '100%純牛肉漢堡', 70, 'https://images.unsplash.com/photo-1568901346375-23c9450c58cd?w=400&h=300&fit=crop', 1, 0, 1),
+        (category_map['main'], '雙層起司堡', '雙倍起司雙倍滿足', 90, 'https://images.unsplash.com/photo-1572802419224-296b0aeee0d9?w=400&h=300&fit=crop', 1, 0, 2),
+        (category_map['main'], '照燒雞腿堡', '鮮嫩多汁的雞腿肉', 85, 'https://images.unsplash.com/photo-1606755962773-d324e503c3ea?w=400&h=300&fit=crop', 1, 0, 3),
+        (category_map['main'], '素食蔬菜堡', '健康素食選擇', 75, 'https://images.unsplash.com/photo-1520072959219-c595dc870360?w=400&h=300&fit=crop', 1, 0, 4),
+
         # 副餐
-        (category_map['副餐'], '薯條', '金黃酥脆', 50, 'https://via.placeholder.com/300x200/FF6B6B/FFFFFF?text=薯條', 1, 0, 1),
-        (category_map['副餐'], '洋蔥圈', '香脆可口', 60, 'https://via.placeholder.com/300x200/4ECDC4/FFFFFF?text=洋蔥圈', 1, 0, 2),
-        (category_map['副餐'], '雞塊', '6塊裝', 65, 'https://via.placeholder.com/300x200/45B7D1/FFFFFF?text=雞塊', 1, 0, 3),
-        (category_map['副餐'], '沙拉', '新鮮蔬菜', 70, 'https://via.placeholder.com/300x200/96CEB4/FFFFFF?text=沙拉', 1, 0, 4),
-        
+        (category_map['side'], '薯條', '金黃酥脆薯條', 50, 'https://images.unsplash.com/photo-1573080496219-bb080dd4f877?w=400&h=300&fit=crop', 1, 0, 1),
+        (category_map['side'], '洋蔥圈', '香脆可口洋蔥圈', 60, 'https://images.unsplash.com/photo-1639024471283-03518883512d?w=400&h=300&fit=crop', 1, 0, 2),
+        (category_map['side'], '雞塊', '6塊裝雞塊', 65, 'https://images.unsplash.com/photo-1562967914-608f82629710?w=400&h=300&fit=crop', 1, 0, 3),
+        (category_map['side'], '沙拉', '新鮮蔬菜沙拉', 70, 'https://images.unsplash.com/photo-1512621776951-a57141f2eefd?w=400&h=300&fit=crop', 1, 0, 4),
+
         # 飲料
-        (category_map['飲料'], '可樂', '冰涼暢快', 30, 'https://via.placeholder.com/300x200/FF6B6B/FFFFFF?text=可樂', 1, 0, 1),
-        (category_map['飲料'], '雪碧', '清爽解渴', 30, 'https://via.placeholder.com/300x200/4ECDC4/FFFFFF?text=雪碧', 1, 0, 2),
-        (category_map['飲料'], '紅茶', '香醇濃郁', 25, 'https://via.placeholder.com/300x200/45B7D1/FFFFFF?text=紅茶', 1, 0, 3),
-        (category_map['飲料'], '咖啡', '現煮咖啡', 40, 'https://via.placeholder.com/300x200/96CEB4/FFFFFF?text=咖啡', 1, 0, 4)
+        (category_map['drink'], '可樂', '冰涼暢快可樂', 30, 'https://images.unsplash.com/photo-1629203851122-3726ecdf080e?w=400&h=300&fit=crop', 1, 0, 1),
+        (category_map['drink'], '雪碧', '清爽解渴雪碧', 30, 'https://images.unsplash.com/photo-1581636625402-29b2a704ef13?w=400&h=300&fit=crop', 1, 0, 2),
+        (category_map['drink'], '紅茶', '香醇濃郁紅茶', 25, 'https://images.unsplash.com/photo-1558618666-fcd25c85cd64?w=400&h=300&fit=crop', 1, 0, 3),
+        (category_map['drink'], '咖啡', '現煮香醇咖啡', 40, 'https://images.unsplash.com/photo-1509042239860-f550ce710b93?w=400&h=300&fit=crop', 1, 0, 4)
     ]
-    
+
     c.executemany(
-        '''INSERT INTO menu_items 
-           (category_id, name, description, price, image_url, is_available, is_recommended, display_order) 
+        '''INSERT INTO menu_items
+           (category_id, name, description, price, image_url, is_available, is_recommended, display_order)
            VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
         menu_items
     )
-    
-    # 創建管理員帳號
-    try:
-        c.execute("INSERT INTO admin_users (username, password_hash, role) VALUES (?, ?, ?)",
-                  ('admin', generate_password_hash('admin123'), 'admin'))
-        c.execute("INSERT INTO admin_users (username, password_hash, role) VALUES (?, ?, ?)",
-                  ('staff', generate_password_hash('staff123'), 'staff'))
-    except sqlite3.IntegrityError:
-        pass  # 用戶已存在
-    
-    conn.commit()
-    conn.close()
-    print("數據庫初始化完成！")
 
 if __name__ == "__main__":
     init_database()
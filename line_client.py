@@ -0,0 +1,214 @@
+import json
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from linebot.http_client import RequestsHttpClient, RequestsHttpResponse
+
+import metrics
+from outbound import REPLY, PUSH
+
+try:
+    import orjson
+except ImportError:  # 選用套件，沒有安裝時改用標準函式庫
+    orjson = None
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+LINE_API_SECONDS = metrics.histogram(
+    "linebot_line_api_request_seconds", "LINE API 呼叫耗時 (含重試)", ["path"]
+)
+LINE_API_RESPONSES = metrics.counter(
+    "linebot_line_api_responses_total", "LINE API 回應狀態碼", ["path", "status"]
+)
+
+
+class JitterRetry(Retry):
+    """指數退避加上隨機抖動，避免多個 worker 同時重試"""
+
+    def get_backoff_time(self):
+        backoff = super().get_backoff_time()
+        return random.uniform(0, backoff) if backoff > 0 else 0
+
+
+class PooledHttpClient(RequestsHttpClient):
+    """共用 requests.Session 的 HttpClient：連線池、keep-alive 與 429/5xx 重試
+
+    只重試連線失敗 (請求尚未送出) 與 status_forcelist；讀取逾時時 LINE 可能已經處理過請求，
+    重送 POST 會讓客人收到重複的訊息，因此不重試。
+    由 outbound.OutboundQueue 負責重試時傳入 status_forcelist=()，避免兩層重試相乘，
+    也不會在發送執行緒中等待 Retry-After。
+    LineBotApi 以 http_client(timeout=...) 建立實例，
+    其他參數請用 functools.partial 綁定。
+    """
+
+    def __init__(self, timeout=RequestsHttpClient.DEFAULT_TIMEOUT,
+                 pool_size=10, max_retries=3, backoff_factor=0.3, status_forcelist=RETRY_STATUSES):
+        super().__init__(timeout)
+        retry = JitterRetry(
+            total=max_retries,
+            read=0,
+            backoff_factor=backoff_factor,
+            status_forcelist=status_forcelist,
+            allowed_methods=None,  # LINE API 主要是 POST，也需要重試
+            raise_on_status=False,
+            respect_retry_after_header=True
+        )
+        self.adapter = HTTPAdapter(
+            pool_connections=pool_size,
+            pool_maxsize=pool_size,
+            max_retries=retry
+        )
+        self.session = requests.Session()
+        self.session.mount("https://", self.adapter)
+        self.session.mount("http://", self.adapter)
+
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._statuses = {}
+
+    def get(self, url, headers=None, params=None, stream=False, timeout=None):
+        return self._request("GET", url, headers=headers, params=params,
+                             stream=stream, timeout=timeout)
+
+    def post(self, url, headers=None, data=None, timeout=None):
+        return self._request("POST", url, headers=headers, data=data, timeout=timeout)
+
+    def delete(self, url, headers=None, data=None, timeout=None):
+        return self._request("DELETE", url, headers=headers, data=data, timeout=timeout)
+
+    def put(self, url, headers=None, data=None, timeout=None):
+        return self._request("PUT", url, headers=headers, data=data, timeout=timeout)
+
+    def _request(self, method, url, timeout=None, **kwargs):
+        if timeout is None:
+            timeout = self.timeout
+
+        started = time.perf_counter()
+        status = "error"
+        try:
+            response = self.session.request(method, url, timeout=timeout, **kwargs)
+            status = response.status_code
+            return RequestsHttpResponse(response)
+        finally:
+            self._record(url, status, time.perf_counter() - started)
+
+    def _record(self, url, status, elapsed):
+        # 只保留路徑前四段，避免帶有 id 的路徑造成統計項目無限增加
+        path = "/".join(urlsplit(url).path.split("/")[:5])
+        LINE_API_SECONDS.observe(elapsed, path)
+        LINE_API_RESPONSES.inc(1, path, str(status))
+        with self._lock:
+            stat = self._calls.get(path)
+            if stat is None:
+                stat = self._calls[path] = {"calls": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0}
+            elapsed_ms = elapsed * 1000
+            stat["calls"] += 1
+            stat["total_ms"] += elapsed_ms
+            stat["max_ms"] = max(stat["max_ms"], elapsed_ms)
+            if status == "error" or status >= 400:
+                stat["errors"] += 1
+            self._statuses[status] = self._statuses.get(status, 0) + 1
+
+    def connection_stats(self):
+        """回傳 (新建連線數, 請求數)；請求數扣掉新建連線數即為重複使用的次數"""
+        connections = 0
+        jobscount = 0
+        pools = self.adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is not None:
+                connections += pool.num_connections
+                jobscount += pool.num_requests
+        return connections, jobscount
+
+    def stats(self):
+        connections, jobscount = self.connection_stats()
+        with self._lock:
+            calls = {
+                path: {
+                    "calls": stat["calls"],
+                    "errors": stat["errors"],
+                    "avg_ms": round(stat["total_ms"] / stat["calls"], 2),
+                    "max_ms": round(stat["max_ms"], 2)
+                }
+                for path, stat in self._calls.items()
+            }
+            statuses = {str(status): count for status, count in self._statuses.items()}
+        return {
+            "calls": calls,
+            "statuses": statuses,
+            "connections_opened": connections,
+            "requests": jobscount,
+            "connection_reuse_rate": (
+                round(1 - connections / jobscount, 4) if jobscount else 0.0
+            )
+        }
+
+
+# LINE 單次回覆 / 推播最多可帶 5 則訊息
+MAX_MESSAGES_PER_CALL = 5
+
+
+def send_messages(line_bot_api, reply_token, to, messages):
+    """以最少的 API 呼叫送出多則訊息，回傳呼叫次數
+
+    前 5 則併入同一次回覆，超過的部分才改用推播 (每次最多 5 則)。
+    line_bot_api 為 OutboundQueue 時以 submit_all 依序發送，回覆送出後才推播後面的訊息。
+    """
+    if not isinstance(messages, (list, tuple)):
+        messages = [messages]
+
+    submit_all = getattr(line_bot_api, "submit_all", None)
+    if submit_all is not None:
+        jobs = [(REPLY, reply_token, list(messages[:MAX_MESSAGES_PER_CALL]))]
+        for start in range(MAX_MESSAGES_PER_CALL, len(messages), MAX_MESSAGES_PER_CALL):
+            jobs.append((PUSH, to, list(messages[start:start + MAX_MESSAGES_PER_CALL])))
+        submit_all(jobs)
+        return len(jobs)
+
+    line_bot_api.reply_message(reply_token, list(messages[:MAX_MESSAGES_PER_CALL]))
+    calls = 1
+    for start in range(MAX_MESSAGES_PER_CALL, len(messages), MAX_MESSAGES_PER_CALL):
+        line_bot_api.push_message(to, list(messages[start:start + MAX_MESSAGES_PER_CALL]))
+        calls += 1
+    return calls
+
+
+def _json_dumps(obj):
+    # ensure_ascii 輸出較長，但標準函式庫的 C 編碼器在這個模式下最快
+    return json.dumps(obj, separators=(",", ":")).encode("ascii")
+
+
+# 序列化成 UTF-8 JSON bytes；有安裝 orjson 時使用 orjson
+dumps = orjson.dumps if orjson is not None else _json_dumps
+
+
+def encode_message(message):
+    """取得訊息的 JSON bytes；CachedMessage 會重複使用已序列化的結果"""
+    encoded = getattr(message, "encoded", None)
+    if encoded is not None:
+        return encoded()
+    return dumps(message.as_json_dict())
+
+
+def reply_raw(line_bot_api, reply_token, messages):
+    """與 LineBotApi.reply_message 相同，但直接組合已序列化的訊息送出
+
+    SDK 每次都會對訊息呼叫 as_json_dict() 再 json.dumps 整個請求；
+    這裡只序列化回覆權杖，訊息的 JSON 由 encode_message 取得 (快取訊息不需重新序列化)。
+    錯誤處理沿用 LineBotApi._post，失敗時同樣拋出 LineBotApiError。
+    """
+    if not isinstance(messages, (list, tuple)):
+        messages = [messages]
+
+    body = b"".join((
+        b'{"replyToken":', dumps(reply_token),
+        b',"messages":[', b",".join([encode_message(message) for message in messages]),
+        b'],"notificationDisabled":false}'
+    ))
+    return line_bot_api._post("/v2/bot/message/reply", data=body)
@@ -0,0 +1,134 @@
+import threading
+
+from line_client import dumps
+
+
+class CachedMessage:
+    """已序列化的訊息，LineBotApi 送出時直接取用快取的 dict
+
+    encoded() 回傳 JSON bytes，第一次呼叫後保留下來，供 line_client.reply_raw 直接送出。
+    """
+
+    __slots__ = ("payload", "_encoded")
+
+    def __init__(self, payload):
+        self.payload = payload
+        self._encoded = None
+
+    def as_json_dict(self):
+        return self.payload
+
+    def encoded(self):
+        # 多個執行緒同時序列化只會得到相同的結果，不需要加鎖
+        if self._encoded is None:
+            self._encoded = dumps(self.payload)
+        return self._encoded
+
+
+class MenuRenderCache:
+    """依菜單版本快取已序列化的菜單訊息，版本改變時整批失效"""
+
+    def __init__(self, version_fn):
+        self._version_fn = version_fn
+        self._version = None
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, build):
+        """取得快取訊息，未命中時呼叫 build() 建立並序列化
+
+        build 回傳 SendMessage 或 SendMessage 列表，回傳 None 時不快取。
+        """
+        version = self._version_fn()
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    self._entries = {}
+                    self._version = version
+
+        entries = self._entries
+        cached = entries.get(key)
+        if cached is not None:
+            self.hits += 1
+            return cached
+
+        with self._lock:
+            cached = entries.get(key)
+            if cached is not None:
+                return cached
+
+            self.misses += 1
+            result = build()
+            if result is None:
+                return None
+
+            if isinstance(result, (list, tuple)):
+                cached = [CachedMessage(message.as_json_dict()) for message in result]
+                for message in cached:
+                    message.encoded()
+            else:
+                cached = CachedMessage(result.as_json_dict())
+                cached.encoded()
+            entries[key] = cached
+            return cached
+
+    def stats(self):
+        return {
+            "version": self._version,
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+
+class StaticMessages:
+    """內容固定的訊息 (歡迎、說明、確認對話框等)
+
+    以 register(key, build) 登記建立函式，第一次取用或 warm_up() 時建立並序列化成 JSON 一次，
+    之後所有請求共用同一份 CachedMessage。
+    """
+
+    def __init__(self):
+        self._builders = {}
+        self._messages = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.builds = 0
+
+    def register(self, key, build=None):
+        """登記建立函式；不傳 build 時可當作裝飾器使用"""
+        if build is None:
+            return lambda func: self.register(key, func)
+        self._builders[key] = build
+        return build
+
+    def get(self, key):
+        message = self._messages.get(key)
+        if message is not None:
+            self.hits += 1
+            return message
+
+        with self._lock:
+            message = self._messages.get(key)
+            if message is None:
+                message = CachedMessage(self._builders[key]().as_json_dict())
+                message.encoded()
+                self._messages[key] = message
+                self.builds += 1
+            return message
+
+    def warm_up(self):
+        """建立所有尚未建立的訊息，回傳訊息數"""
+        for key in list(self._builders):
+            self.get(key)
+        return len(self._messages)
+
+    def stats(self):
+        return {
+            "registered": len(self._builders),
+            "built": len(self._messages),
+            "hits": self.hits,
+            "builds": self.builds
+        }
@@ -0,0 +1,183 @@
+import logging
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_SELECT_VERSION = "SELECT version, structure_version FROM menu_version WHERE id = 1"
+_SELECT_CATEGORIES = (
+    "SELECT id, slug, name, image_url FROM menu_categories ORDER BY display_order, id"
+)
+_SELECT_ITEMS = (
+    "SELECT id, category_id, name, description, price, image_url, is_available, "
+    "is_recommended, display_order FROM menu_items WHERE version > ?"
+)
+
+
+class MenuCatalog:
+    """菜單目錄：從資料庫載入菜單並建立記憶體索引，版本變更時自動重新載入
+
+    資料庫沒有菜單資料表時使用 fallback_menu (格式同 app.MENU)。
+    """
+
+    def __init__(self, db, fallback_menu, check_interval=5.0):
+        self.db = db
+        self.fallback_menu = fallback_menu
+        self.check_interval = check_interval
+        self.version = 0
+        self.source = None
+        self._structure_version = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+        self._category_slugs = {}  # 資料庫分類 id -> slug
+        self._order = {}  # 商品 id -> display_order
+        self._state = _build_state(fallback_menu)
+        self.refresh()
+
+    # 查詢 (皆為 O(1) 字典查找，不存取資料庫)
+    @property
+    def menu(self):
+        """{分類 id: {"id", "name", "image", "items": {商品名稱: 商品}}}"""
+        return self._state["menu"]
+
+    def get_category(self, category_id):
+        return self._state["menu"].get(category_id)
+
+    def get_item(self, category_id, item_name):
+        category = self._state["menu"].get(category_id)
+        if category is None:
+            return None
+        return category["items"].get(item_name)
+
+    def get_item_by_id(self, item_id):
+        return self._state["by_id"].get(item_id)
+
+    def find_item(self, item_name):
+        return self._state["by_name"].get(item_name)
+
+    def get_items(self):
+        return self._state["by_id"].values()
+
+    def current_version(self):
+        """回傳菜單版本，每 check_interval 秒最多檢查一次資料庫"""
+        if time.monotonic() >= self._next_check:
+            self.refresh()
+        return self.version
+
+    def refresh(self):
+        # 其他執行緒正在重新載入時直接使用現有資料
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            self._next_check = time.monotonic() + self.check_interval
+            conn = self.db.connection()
+            try:
+                row = conn.execute(_SELECT_VERSION).fetchone()
+            except sqlite3.OperationalError:
+                row = None
+            if row is None or row[0] == 0:
+                if self.source != "fallback":
+                    logger.info("資料庫沒有菜單資料，使用內建菜單")
+                    self.source = "fallback"
+                return
+
+            version, structure_version = row
+            if self.source == "database" and version == self.version:
+                return
+
+            if self.source != "database" or structure_version != self._structure_version:
+                self._load_full(conn)
+            else:
+                self._load_changes(conn, self.version)
+
+            self.version = version
+            self._structure_version = structure_version
+            self.source = "database"
+            logger.info("菜單已載入 (版本 %s)", version)
+        finally:
+            self._lock.release()
+
+    def _load_full(self, conn):
+        menu = {}
+        self._category_slugs = {}
+        for category in conn.execute(_SELECT_CATEGORIES):
+            self._category_slugs[category["id"]] = category["slug"]
+            menu[category["slug"]] = {
+                "id": category["slug"],
+                "name": category["name"],
+                "image": category["image_url"],
+                "items": {}
+            }
+
+        self._order = {}
+        rows = sorted(conn.execute(_SELECT_ITEMS, (0,)), key=lambda r: (r["display_order"], r["id"]))
+        for row in rows:
+            self._apply_row(menu, row)
+        self._state = _build_state(menu)
+
+    def _load_changes(self, conn, since_version):
+        # 只套用版本號大於上次載入的商品，其餘分類沿用原本的字典
+        rows = conn.execute(_SELECT_ITEMS, (since_version,)).fetchall()
+        old_menu = self._state["menu"]
+        menu = dict(old_menu)
+        touched = set()
+
+        for row in rows:
+            old = self._state["by_id"].get(row["id"])
+            if old is not None:
+                touched.add(old["category"])
+            slug = self._category_slugs.get(row["category_id"])
+            if slug is not None:
+                touched.add(slug)
+
+        for slug in touched:
+            if slug in menu:
+                menu[slug] = dict(menu[slug], items=dict(menu[slug]["items"]))
+
+        for row in rows:
+            old = self._state["by_id"].get(row["id"])
+            if old is not None and old["category"] in menu:
+                menu[old["category"]]["items"].pop(old["name"], None)
+            self._apply_row(menu, row)
+
+        # 依 display_order 重新排序有變動的分類
+        for slug in touched:
+            if slug in menu:
+                items = menu[slug]["items"]
+                ordered = sorted(items.values(), key=lambda item: (self._order[item["id"]], item["id"]))
+                menu[slug]["items"] = {item["name"]: item for item in ordered}
+
+        self._state = _build_state(menu)
+
+    def _apply_row(self, menu, row):
+        slug = self._category_slugs.get(row["category_id"])
+        if slug is None or not row["is_available"]:
+            return
+        self._order[row["id"]] = row["display_order"]
+        menu[slug]["items"][row["name"]] = {
+            "id": row["id"],
+            "name": row["name"],
+            "price": row["price"],
+            "desc": row["description"] or "",
+            "image": row["image_url"],
+            "category": slug,
+            "recommended": bool(row["is_recommended"])
+        }
+
+
+def _build_state(menu):
+    """建立依 id、名稱查找商品的索引"""
+    by_id = {}
+    by_name = {}
+    next_id = 1
+    for category_id, category in menu.items():
+        for item in category["items"].values():
+            # 內建菜單沒有商品 id，依序補上
+            if "id" not in item:
+                item["id"] = next_id
+                item["category"] = category_id
+            next_id = max(next_id, item["id"]) + 1
+            by_id[item["id"]] = item
+            by_name.setdefault(item["name"], item)
+    return {"menu": menu, "by_id": by_id, "by_name": by_name}
@@ -0,0 +1,176 @@
+import heapq
+import math
+import threading
+import time
+
+import metrics
+from command_matcher import normalize
+
+MENU_SEARCH_SECONDS = metrics.histogram(
+    "linebot_menu_search_seconds", "菜單搜尋耗時 (不含索引更新)"
+)
+
+_UNSET = object()
+
+
+def ngrams(text):
+    """正規化後的單字元與雙字元 n-gram；中文不需要斷詞，英文也能以部分字母比對"""
+    text = normalize(text)
+    grams = set(text)
+    grams.update(text[i:i + 2] for i in range(len(text) - 1))
+    return grams
+
+
+def _query_grams(text):
+    # 查詢兩個字以上時只用雙字元，避免單一常見字 (例如「堡」) 拉進大量無關商品
+    text = normalize(text)
+    if len(text) < 2:
+        return set(text)
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+class MenuSearchIndex:
+    """菜單全文搜尋：商品名稱與描述的字元 n-gram 反向索引
+
+    每個 n-gram 對應 {商品 id: 權重}，名稱的權重高於描述；查詢時依 n-gram 的 idf 加總分數，
+    並要求至少命中一半的查詢 n-gram，名稱包含完整查詢字串的商品額外加分。
+    索引依 menu_version() 判斷菜單是否變更，變更時只重新切分有異動的商品
+    (MenuCatalog 重新載入時未變動的商品會沿用同一個 dict)；最近 max_cached 個查詢的結果
+    保留到菜單下一次變更，常用的關鍵字不必重新計分。
+    """
+
+    def __init__(self, menu_items=None, menu_version=None, name_weight=3.0, desc_weight=1.0,
+                 max_cached=256):
+        self._menu_items = menu_items
+        self._menu_version = menu_version
+        self.name_weight = name_weight
+        self.desc_weight = desc_weight
+        self.max_cached = max_cached
+        self._version = _UNSET
+        self._postings = {}  # n-gram -> {商品 id: 權重}
+        self._items = {}  # 商品 id -> (商品, {n-gram: 權重}, 正規化的名稱)
+        self._results = {}  # (正規化的查詢, limit) -> 排序後的結果，菜單變更時清空
+        self._lock = threading.Lock()
+
+        # 統計數據
+        self.searches = 0
+        self.cache_hits = 0
+        self.rebuilt_items = 0
+
+    def refresh(self):
+        """菜單版本變更時同步索引，回傳重新切分的商品數"""
+        if self._menu_items is None:
+            return 0
+        version = self._menu_version() if self._menu_version is not None else None
+        if version == self._version:
+            return 0
+        with self._lock:
+            if version == self._version:
+                return 0
+            changed = self._sync(list(self._menu_items()))
+            self._results.clear()
+            self._version = version
+            return changed
+
+    def _sync(self, items):
+        seen = set()
+        changed = 0
+        for item in items:
+            item_id = item["id"]
+            seen.add(item_id)
+            indexed = self._items.get(item_id)
+            if indexed is not None and indexed[0] is item:
+                continue
+            if indexed is not None:
+                self._remove(item_id)
+            self._add(item)
+            changed += 1
+        for item_id in [item_id for item_id in self._items if item_id not in seen]:
+            self._remove(item_id)
+            changed += 1
+        self.rebuilt_items += changed
+        return changed
+
+    def _add(self, item):
+        weights = {}
+        for gram in ngrams(item["name"]):
+            weights[gram] = weights.get(gram, 0.0) + self.name_weight
+        for gram in ngrams(item.get("desc") or ""):
+            weights[gram] = weights.get(gram, 0.0) + self.desc_weight
+        item_id = item["id"]
+        for gram, weight in weights.items():
+            self._postings.setdefault(gram, {})[item_id] = weight
+        self._items[item_id] = (item, weights, normalize(item["name"]))
+
+    def _remove(self, item_id):
+        _, weights, _ = self._items.pop(item_id)
+        for gram in weights:
+            posting = self._postings.get(gram)
+            if posting is None:
+                continue
+            posting.pop(item_id, None)
+            if not posting:
+                del self._postings[gram]
+
+    def search(self, query, limit=10):
+        """回傳依分數排序的 [(分數, 商品), ...]；相同的查詢在菜單變更前直接回傳上次的結果"""
+        self.refresh()
+        started = time.perf_counter()
+        phrase = normalize(query)
+        if not phrase:
+            return []
+        key = (phrase, limit)
+
+        with self._lock:
+            self.searches += 1
+            ranked = self._results.get(key)
+            if ranked is not None:
+                self.cache_hits += 1
+            else:
+                ranked = self._rank(phrase, limit)
+                if len(self._results) >= self.max_cached:
+                    # 移除最早加入的查詢
+                    del self._results[next(iter(self._results))]
+                self._results[key] = ranked
+
+        MENU_SEARCH_SECONDS.observe(time.perf_counter() - started)
+        return ranked
+
+    def _rank(self, phrase, limit):
+        grams = _query_grams(phrase)
+        total = len(self._items)
+        scores = {}
+        hits = {}
+        for gram in grams:
+            posting = self._postings.get(gram)
+            if not posting:
+                continue
+            idf = math.log(1 + total / len(posting))
+            for item_id, weight in posting.items():
+                scores[item_id] = scores.get(item_id, 0.0) + idf * weight
+                hits[item_id] = hits.get(item_id, 0) + 1
+
+        required = max(1, math.ceil(len(grams) / 2))
+        items = self._items
+        results = []
+        for item_id, score in scores.items():
+            if hits[item_id] < required:
+                continue
+            item, _, name = items[item_id]
+            if name == phrase:
+                score *= 3
+            elif phrase in name:
+                score *= 2
+            results.append((score, -item_id, item))
+        return [(score, item) for score, _, item in heapq.nlargest(limit, results)]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "items": len(self._items),
+                "ngrams": len(self._postings),
+                "searches": self.searches,
+                "cache_hits": self.cache_hits,
+                "cached_queries": len(self._results),
+                "rebuilt_items": self.rebuilt_items
+            }
@@ -0,0 +1,204 @@
+import threading
+import time
+import weakref
+from bisect import bisect_left
+from functools import wraps
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class _Shard:
+    """單一執行緒專用的數值，只有擁有者執行緒會寫入，因此不需要加鎖"""
+
+    __slots__ = ("values", "thread", "__weakref__")
+
+    def __init__(self, thread):
+        self.values = {}
+        self.thread = weakref.ref(thread)
+
+
+class Registry:
+    """Prometheus 格式的指標註冊表
+
+    計數與直方圖寫入各執行緒自己的分片，匯出時才加總，
+    熱路徑上不需要取得全域鎖。
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards = []
+        self._retired = {}  # 已結束執行緒的數值
+        self._metrics = {}
+        self._gauges = []
+
+    def _values(self):
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = _Shard(threading.current_thread())
+            with self._lock:
+                self._shards.append(shard)
+        return shard.values
+
+    def counter(self, name, help_text, labels=()):
+        return self._register(Counter(self, name, help_text, labels))
+
+    def histogram(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(self, name, help_text, labels, buckets))
+
+    def gauge(self, name, help_text, callback, labels=()):
+        """註冊回呼式量測值；callback 回傳數值，或 {標籤值 tuple: 數值}"""
+        with self._lock:
+            self._gauges.append((name, help_text, tuple(labels), callback))
+
+    def _register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"指標重複註冊: {metric.name}")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def _collect(self):
+        """加總所有分片；已結束的執行緒併入 _retired 後移除"""
+        with self._lock:
+            totals = {}
+            alive = []
+            for shard in self._shards:
+                values = shard.values.copy()
+                if shard.thread() is None or not shard.thread().is_alive():
+                    _merge(self._retired, values)
+                else:
+                    alive.append(shard)
+                    _merge(totals, values)
+            self._shards = alive
+            _merge(totals, self._retired)
+            return totals
+
+    def render(self):
+        """輸出 Prometheus 文字格式"""
+        totals = self._collect()
+        by_metric = {}
+        for (name, label_values), value in totals.items():
+            by_metric.setdefault(name, []).append((label_values, value))
+
+        lines = []
+        for name, metric in sorted(self._metrics.items()):
+            lines.append(f"# HELP {name} {metric.help}")
+            lines.append(f"# TYPE {name} {metric.type}")
+            for label_values, value in sorted(by_metric.get(name, ())):
+                metric.render(lines, label_values, value)
+
+        for name, help_text, labels, callback in self._gauges:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            try:
+                value = callback()
+            except Exception:
+                continue
+            if isinstance(value, dict):
+                for label_values, item in sorted(value.items()):
+                    lines.append(f"{name}{_labels(labels, label_values)} {_number(item)}")
+            else:
+                lines.append(f"{name} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+class Counter:
+    type = "counter"
+
+    def __init__(self, registry, name, help_text, labels):
+        self.registry = registry
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+
+    def inc(self, amount=1, *label_values):
+        values = self.registry._values()
+        key = (self.name, label_values)
+        values[key] = values.get(key, 0) + amount
+
+    def render(self, lines, label_values, value):
+        lines.append(f"{self.name}{_labels(self.labels, label_values)} {_number(value)}")
+
+
+class Histogram:
+    type = "histogram"
+
+    def __init__(self, registry, name, help_text, labels, buckets):
+        self.registry = registry
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, seconds, *label_values):
+        values = self.registry._values()
+        key = (self.name, label_values)
+        data = values.get(key)
+        if data is None:
+            # 各區間次數 (最後一格為 +Inf)、總和、次數
+            data = values[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+        data[bisect_left(self.buckets, seconds)] += 1
+        data[-2] += seconds
+        data[-1] += 1
+
+    def time(self, *label_values):
+        """以裝飾器量測函式執行時間"""
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.observe(time.perf_counter() - started, *label_values)
+            return wrapper
+        return decorator
+
+    def render(self, lines, label_values, data):
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), data):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            lines.append(
+                f"{self.name}_bucket{_labels(self.labels + ('le',), label_values + (le,))} {cumulative}"
+            )
+        label_text = _labels(self.labels, label_values)
+        lines.append(f"{self.name}_sum{label_text} {_number(data[-2])}")
+        lines.append(f"{self.name}_count{label_text} {data[-1]}")
+
+
+def _merge(target, values):
+    for key, value in values.items():
+        current = target.get(key)
+        if current is None:
+            target[key] = list(value) if isinstance(value, list) else value
+        elif isinstance(value, list):
+            for i, item in enumerate(value):
+                current[i] += item
+        else:
+            target[key] = current + value
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _number(value):
+    if isinstance(value, float):
+        return repr(round(value, 6))
+    return str(value)
+
+
+# 全域註冊表，各模組在匯入時註冊自己的指標
+REGISTRY = Registry()
+counter = REGISTRY.counter
+histogram = REGISTRY.histogram
+gauge = REGISTRY.gauge
@@ -0,0 +1,144 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+
+from linebot.models import TextSendMessage
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+# LINE multicast 單次最多 500 位收件人
+MAX_MULTICAST_RECIPIENTS = 500
+
+NOTIFICATIONS_SENT = metrics.counter(
+    "linebot_status_notifications_total", "訂單狀態通知數 (queued 已交給發送佇列、dropped 佇列已滿)", ["result"]
+)
+
+
+class StatusNotifier:
+    """訂單狀態通知的批次合併器
+
+    狀態變更只放入佇列，由背景執行緒每 batch_window 秒合併一次：
+    同一位用戶的多筆異動合併成一則訊息，內容相同的訊息以 multicast 一次送給多位用戶。
+    實際發送交給 messenger (outbound.OutboundQueue)，由其負責限流、重試與 dead letter。
+    format_text(user_id, updates) 以 [(訂單編號, 狀態), ...] 產生該用戶的訊息文字。
+    """
+
+    def __init__(self, messenger, format_text, batch_window=1.0, max_pending=10000):
+        self._messenger = messenger
+        self._format_text = format_text
+        self._batch_window = batch_window
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._lock = threading.Lock()
+        self._thread = None
+
+        # 統計數據
+        self.enqueued = 0
+        self.dropped = 0  # 佇列已滿而放棄的通知數
+        self.batches = 0
+        self.api_calls = 0
+
+    def start(self):
+        # 延遲到第一次使用時才啟動，避免 gunicorn fork 前建立的執行緒失效
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="status-notifier", daemon=True)
+            self._thread.start()
+        atexit.register(self.stop)
+
+    def notify(self, user_id, order_id, status):
+        """放入通知佇列，佇列已滿時回傳 False"""
+        if self._thread is None:
+            self.start()
+        try:
+            self._queue.put_nowait((user_id, order_id, status))
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            NOTIFICATIONS_SENT.inc(1, "dropped")
+            return False
+        with self._lock:
+            self.enqueued += 1
+        return True
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            batch = [item]
+            deadline = time.monotonic() + self._batch_window
+            stop = False
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+                batch.append(item)
+
+            try:
+                self._send(batch)
+            except Exception:
+                logger.exception("合併訂單狀態通知失敗")
+            if stop:
+                return
+
+    def _send(self, batch):
+        # 依用戶合併，同一筆訂單只通知最新的狀態
+        updates = {}
+        for user_id, order_id, status in batch:
+            updates.setdefault(user_id, {})[order_id] = status
+
+        recipients = {}
+        for user_id, user_updates in updates.items():
+            text = self._format_text(user_id, list(user_updates.items()))
+            recipients.setdefault(text, []).append(user_id)
+
+        api_calls = 0
+        for text, user_ids in recipients.items():
+            message = TextSendMessage(text=text)
+            for start in range(0, len(user_ids), MAX_MULTICAST_RECIPIENTS):
+                chunk = user_ids[start:start + MAX_MULTICAST_RECIPIENTS]
+                if len(chunk) == 1:
+                    self._messenger.push_message(chunk[0], message)
+                else:
+                    self._messenger.multicast(chunk, message)
+                api_calls += 1
+                NOTIFICATIONS_SENT.inc(len(chunk), "queued")
+        with self._lock:
+            self.batches += 1
+            self.api_calls += api_calls
+
+    def stop(self, timeout=5.0):
+        """送出佇列中剩餘的通知後停止"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            return
+        thread.join(timeout)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "pending": self._queue.qsize(),
+                "enqueued": self.enqueued,
+                "dropped": self.dropped,
+                "batches": self.batches,
+                "api_calls": self.api_calls
+            }
@@ -0,0 +1,112 @@
+import json
+import os
+import queue
+import threading
+from collections import deque
+
+
+class Subscription:
+    """單一 SSE 連線的事件佇列"""
+
+    __slots__ = ("_queue", "closed")
+
+    def __init__(self, size):
+        self._queue = queue.Queue(maxsize=size)
+        self.closed = False
+
+    def put(self, message):
+        try:
+            self._queue.put_nowait(message)
+        except queue.Full:
+            # 消化太慢的連線直接結束，瀏覽器重連時以 Last-Event-ID 補回遺漏的事件
+            self.closed = True
+
+    def get(self, timeout):
+        """取得下一則 (revision, 訊息)，逾時回傳 None"""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class OrderEventBroker:
+    """行程內的訂單事件廣播，供廚房 / 管理畫面以 SSE 接收
+
+    事件在發布時序列化一次，之後只把同一個字串放進各連線的佇列；
+    資料中的 revision 會一併傳給連線，用來判斷是否有其他 worker 的異動。
+    最近 history 筆事件會保留下來，重新連線時依 Last-Event-ID 補送；
+    事件編號帶有行程識別碼，連到其他 worker 或遺漏太多時改送 resync。
+    """
+
+    def __init__(self, history=200, queue_size=100, max_subscribers=100):
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self._boot = os.urandom(3).hex()
+        self._seq = 0
+        self._history = deque(maxlen=history)
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+        # 統計數據
+        self.published = 0
+        self.dropped = 0
+
+    def publish(self, event_type, data):
+        with self._lock:
+            self._seq += 1
+            event_id = f"{self._boot}-{self._seq}"
+            item = (data.get("revision"), format_event(event_type, data, event_id))
+            self._history.append((self._seq, item))
+            self.published += 1
+            for subscription in list(self._subscribers):
+                subscription.put(item)
+                if subscription.closed:
+                    self._subscribers.discard(subscription)
+                    self.dropped += 1
+        return event_id
+
+    def subscribe(self, last_event_id=None):
+        """建立訂閱並補送 last_event_id 之後的事件；連線數已滿時回傳 None"""
+        subscription = Subscription(self.queue_size)
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                return None
+            if last_event_id:
+                for item in self._replay(last_event_id):
+                    subscription.put(item)
+            self._subscribers.add(subscription)
+        return subscription
+
+    def _replay(self, last_event_id):
+        boot, _, seq = last_event_id.partition("-")
+        if boot != self._boot or not seq.isdigit():
+            return [(None, format_event("resync", {}))]
+        seq = int(seq)
+        if self._history and seq < self._history[0][0] - 1:
+            return [(None, format_event("resync", {}))]
+        return [item for event_seq, item in self._history if event_seq > seq]
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "subscribers": len(self._subscribers),
+                "max_subscribers": self.max_subscribers,
+                "published": self.published,
+                "dropped": self.dropped,
+                "history": len(self._history)
+            }
+
+
+def format_event(event_type, data, event_id=None):
+    """組成 SSE 訊息"""
+    lines = []
+    if event_id:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event_type}")
+    lines.append("data: " + json.dumps(data, ensure_ascii=False, separators=(",", ":")))
+    return "\n".join(lines) + "\n\n"
+
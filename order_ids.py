@@ -0,0 +1,116 @@
+import os
+import re
+import threading
+from datetime import datetime, timedelta
+
+# Crockford Base32：不含 I、L、O、U，字元順序與 ASCII 排序一致
+ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+
+NODE_BITS = 5
+WORKER_BITS = 5
+SEQUENCE_BITS = 8
+MAX_NODES = 1 << NODE_BITS
+MAX_WORKERS = 1 << WORKER_BITS
+MAX_SEQUENCE = 1 << SEQUENCE_BITS
+
+# 當日毫秒數 (27 bits) + 節點 + worker + 序號 = 45 bits，剛好 9 個 Base32 字元
+SUFFIX_LENGTH = 9
+
+_ORDER_ID = re.compile(rf"\d{{8}}[{ALPHABET}]{{{SUFFIX_LENGTH}}}")
+
+
+def _encode(value, length):
+    chars = []
+    for _ in range(length):
+        value, digit = divmod(value, 32)
+        chars.append(ALPHABET[digit])
+    return "".join(reversed(chars))
+
+
+def _decode(chars):
+    value = 0
+    for char in chars:
+        value = value * 32 + ALPHABET.index(char)
+    return value
+
+
+def _millis_of_day(now):
+    return ((now.hour * 60 + now.minute) * 60 + now.second) * 1000 + now.microsecond // 1000
+
+
+def order_id_floor(when):
+    """指定時間點之後產生的訂單編號都不小於此值，可用於訂單編號的範圍查詢"""
+    return when.strftime("%Y%m%d") + _encode(_millis_of_day(when) << (NODE_BITS + WORKER_BITS + SEQUENCE_BITS), SUFFIX_LENGTH)
+
+
+def order_id_time(order_id):
+    """訂單編號中的時間 (毫秒)；訂單的 created_at 以此為準，與編號的排序與範圍查詢一致"""
+    millis = _decode(order_id[8:]) >> (NODE_BITS + WORKER_BITS + SEQUENCE_BITS)
+    # 序號用完時會借用下一毫秒，跨過午夜時仍算在編號上的日期
+    millis = min(millis, 24 * 60 * 60 * 1000 - 1)
+    return datetime.strptime(order_id[:8], "%Y%m%d") + timedelta(milliseconds=millis)
+
+
+def is_order_id(value):
+    """是否為 OrderIdGenerator 產生的編號格式；訂單編號同時是排序與範圍查詢的鍵，不接受其他格式"""
+    return value is not None and _ORDER_ID.fullmatch(value) is not None
+
+
+class OrderIdGenerator:
+    """可依時間排序、跨 worker 不重複的訂單編號
+
+    格式為 YYYYMMDD + 9 個 Base32 字元 (當日毫秒數、節點、worker、序號)，
+    例如 20250101AQAAG0080。同一毫秒內以序號區分，序號用完時借用下一毫秒；
+    系統時間倒退時沿用上一次的時間，確保同一個 worker 產生的編號遞增。
+    worker_id 由 claim_worker 取得，fork 之後會重新取得。
+    """
+
+    def __init__(self, node_id, claim_worker):
+        if not 0 <= node_id < MAX_NODES:
+            raise ValueError(f"NODE_ID 必須介於 0 到 {MAX_NODES - 1}")
+        self.node_id = node_id
+        self._claim_worker = claim_worker
+        self._lock = threading.Lock()
+        self._pid = None
+        self._worker_id = None
+        self._day = None
+        self._last_ms = -1
+        self._sequence = 0
+
+    @property
+    def worker_id(self):
+        # gunicorn --preload 會在主行程匯入 app 後 fork，每個 worker 需要自己的編號
+        if self._pid != os.getpid():
+            worker_id = self._claim_worker()
+            if not 0 <= worker_id < MAX_WORKERS:
+                raise ValueError(f"WORKER_ID 必須介於 0 到 {MAX_WORKERS - 1}")
+            self._worker_id = worker_id
+            self._pid = os.getpid()
+        return self._worker_id
+
+    def next_id(self, now=None):
+        now = now or datetime.now()
+        day = now.strftime("%Y%m%d")
+        millis = _millis_of_day(now)
+
+        with self._lock:
+            worker_id = self.worker_id
+            if day != self._day:
+                if self._day is not None and day < self._day:
+                    # 時間倒退到前一天，沿用上一次的日期
+                    day, millis = self._day, self._last_ms
+                else:
+                    self._day = day
+                    self._last_ms = -1
+
+            if millis > self._last_ms:
+                self._last_ms = millis
+                self._sequence = 0
+            else:
+                self._sequence += 1
+                if self._sequence >= MAX_SEQUENCE:
+                    self._last_ms += 1
+                    self._sequence = 0
+            value = ((self._last_ms << NODE_BITS | self.node_id) << WORKER_BITS | worker_id) << SEQUENCE_BITS | self._sequence
+
+        return day + _encode(value, SUFFIX_LENGTH)
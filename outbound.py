@@ -0,0 +1,337 @@
+import atexit
+import heapq
+import itertools
+import json
+import logging
+import queue
+import threading
+import time
+import uuid
+
+import requests
+from linebot.exceptions import LineBotApiError
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+REPLY = "reply"
+PUSH = "push"
+MULTICAST = "multicast"
+
+# 回覆權杖約一分鐘後失效，超過就不再重試
+REPLY_TOKEN_TTL = 50.0
+
+OUTBOUND_QUEUE_SECONDS = metrics.histogram(
+    "linebot_outbound_queue_seconds", "訊息從排入佇列到開始發送的等待時間", ["kind"]
+)
+OUTBOUND_DELIVERY_SECONDS = metrics.histogram(
+    "linebot_outbound_delivery_seconds", "訊息從排入佇列到發送成功的時間 (含重試)", ["kind"]
+)
+OUTBOUND_RESULTS = metrics.counter(
+    "linebot_outbound_results_total", "訊息發送結果", ["kind", "result"]
+)
+
+
+class TokenBucket:
+    """權杖桶限流：平均每秒 rate 次，最多累積 burst 次"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or max(1.0, rate)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """取得一個權杖，不足時等待"""
+        if self.rate <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        # 在鎖外等待；權杖已預先扣除，其他執行緒會排在後面
+        if wait:
+            time.sleep(wait)
+
+
+class _Job:
+    __slots__ = ("kind", "target", "messages", "retry_key", "enqueued_at", "attempts", "next")
+
+    def __init__(self, kind, target, messages):
+        self.kind = kind
+        self.target = target
+        self.messages = messages
+        # push / multicast 重試時帶相同的 retry key，LINE 不會重複送出
+        self.retry_key = str(uuid.uuid4()) if kind != REPLY else None
+        self.enqueued_at = time.monotonic()
+        self.attempts = 0
+        self.next = None  # 送達或放棄後才排入佇列的下一個請求 (見 submit_all)
+
+
+class OutboundQueue:
+    """LINE 訊息的背景發送佇列
+
+    reply_message / push_message / multicast 與 LineBotApi 的用法相同，但只放入佇列立即返回，
+    由工作執行緒依權杖桶限流送出。429 / 5xx 與連線錯誤以指數退避重試 (遵守 Retry-After)，
+    超過重試次數或無法重試的訊息寫入 dead_letters (store.DeadLetterStore)。
+    佇列已滿時改由呼叫端的執行緒直接發送。
+    重試只由佇列負責：line_bot_api 的 HTTP client 不應再重試 429 / 5xx (見 line_client.PooledHttpClient)。
+    reply(reply_token, messages) 可替換回覆的發送方式 (例如 line_client.reply_raw)，預設使用 LineBotApi。
+    """
+
+    def __init__(self, line_bot_api, dead_letters=None, workers=4, max_size=10000,
+                 rate=1000.0, multicast_rate=100.0, max_retries=4, backoff=0.5, max_backoff=30.0,
+                 reply=None):
+        self._line_bot_api = line_bot_api
+        self._reply = reply
+        self._dead_letters = dead_letters
+        self._workers = max(1, workers)
+        self._queue = queue.Queue(maxsize=max_size)
+        self._buckets = {
+            REPLY: TokenBucket(rate),
+            PUSH: TokenBucket(rate),
+            MULTICAST: TokenBucket(multicast_rate)
+        }
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+        self._threads = []
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._retry_ready = threading.Condition(threading.Lock())
+        self._retries = []
+        self._retry_seq = itertools.count()
+        self._started = False
+
+        # 統計數據
+        self.capacity = max_size
+        self.pending = 0  # 尚未送達或放棄的訊息數 (含等待重試)
+        self.enqueued = 0
+        self.sent = 0
+        self.retried = 0
+        self.dead_lettered = 0
+        self.inline = 0  # 佇列已滿、由呼叫端直接發送的次數
+
+    # 與 LineBotApi 相同的發送介面
+    def reply_message(self, reply_token, messages, **kwargs):
+        return self.submit(REPLY, reply_token, messages)
+
+    def push_message(self, to, messages, **kwargs):
+        return self.submit(PUSH, to, messages)
+
+    def multicast(self, to, messages, **kwargs):
+        return self.submit(MULTICAST, list(to), messages)
+
+    def submit(self, kind, target, messages):
+        if not isinstance(messages, (list, tuple)):
+            messages = [messages]
+        job = _Job(kind, target, list(messages))
+        with self._lock:
+            self.pending += 1
+            self.enqueued += 1
+        return self._enqueue(job)
+
+    def submit_all(self, requests):
+        """依序發送 [(kind, target, messages), ...]：前一個請求送達或放棄後才排入下一個
+
+        例如回覆之後接著推播超過 5 則的部分，不會因為由不同的工作執行緒發送而順序顛倒。
+        """
+        jobs = [_Job(kind, target, list(messages)) for kind, target, messages in requests]
+        if not jobs:
+            return True
+        for job, following in zip(jobs, jobs[1:]):
+            job.next = following
+        with self._lock:
+            self.pending += len(jobs)
+            self.enqueued += len(jobs)
+        return self._enqueue(jobs[0])
+
+    def _enqueue(self, job):
+        if not self._started:
+            self.start()
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                self.inline += 1
+            self._deliver_safely(job)
+            return False
+        return True
+
+    def start(self):
+        # 延遲到第一次使用時才啟動，避免 gunicorn fork 前建立的執行緒失效
+        with self._lock:
+            if self._started:
+                return
+            for i in range(self._workers):
+                thread = threading.Thread(target=self._worker, name=f"outbound-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            thread = threading.Thread(target=self._scheduler, name="outbound-retry", daemon=True)
+            thread.start()
+            self._started = True
+        atexit.register(self.stop)
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            if job is _STOP:
+                return
+            self._deliver_safely(job)
+
+    def _deliver_safely(self, job):
+        # 未預期的錯誤也要結束這個工作，pending 才會歸零、後續的請求才會排入
+        try:
+            self._deliver(job)
+        except Exception:
+            logger.exception("發送訊息時發生未預期的錯誤")
+            self._finish(job, "dead_letter", "unexpected error")
+
+    def _deliver(self, job):
+        if job.attempts == 0:
+            OUTBOUND_QUEUE_SECONDS.observe(time.monotonic() - job.enqueued_at, job.kind)
+        job.attempts += 1
+        self._buckets[job.kind].acquire()
+
+        try:
+            if job.kind == REPLY and self._reply is not None:
+                self._reply(job.target, job.messages)
+            elif job.kind == REPLY:
+                self._line_bot_api.reply_message(job.target, job.messages)
+            elif job.kind == PUSH:
+                self._line_bot_api.push_message(job.target, job.messages, retry_key=job.retry_key)
+            else:
+                self._line_bot_api.multicast(job.target, job.messages, retry_key=job.retry_key)
+        except LineBotApiError as e:
+            # 409 且帶有 accepted request id：同一個 retry key 先前已經送達
+            if e.status_code == 409 and e.accepted_request_id:
+                self._finish(job, "sent")
+                return
+            retryable = e.status_code == 429 or e.status_code >= 500
+            self._fail(job, retryable, f"{e.status_code} {e.error.message}", _retry_after(e.headers))
+            return
+        except requests.RequestException as e:
+            self._fail(job, True, f"{type(e).__name__}: {e}")
+            return
+        self._finish(job, "sent")
+
+    def _fail(self, job, retryable, error, retry_after=None):
+        expired = job.kind == REPLY and time.monotonic() - job.enqueued_at > REPLY_TOKEN_TTL
+        if not retryable or expired or job.attempts > self.max_retries:
+            logger.warning("訊息發送失敗，移入 dead letter (%s, %d 次): %s", job.kind, job.attempts, error)
+            self._finish(job, "dead_letter", error)
+            return
+
+        delay = min(self.max_backoff, self.backoff * 2 ** (job.attempts - 1))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        with self._lock:
+            self.retried += 1
+        OUTBOUND_RESULTS.inc(1, job.kind, "retried")
+        self._schedule_retry(job, delay)
+
+    def _schedule_retry(self, job, delay):
+        with self._retry_ready:
+            heapq.heappush(self._retries, (time.monotonic() + delay, next(self._retry_seq), job))
+            self._retry_ready.notify()
+
+    def _scheduler(self):
+        """到期的重試放回佇列"""
+        while True:
+            with self._retry_ready:
+                while not self._retries or self._retries[0][0] > time.monotonic():
+                    timeout = self._retries[0][0] - time.monotonic() if self._retries else None
+                    self._retry_ready.wait(timeout)
+                _, _, job = heapq.heappop(self._retries)
+            if job is _STOP:
+                return
+            try:
+                self._queue.put_nowait(job)
+            except queue.Full:
+                # 佇列已滿時不阻塞排程執行緒，稍後再放回佇列 (不計入重試次數)
+                self._schedule_retry(job, max(self.backoff, 0.1))
+
+    def _finish(self, job, result, error=None):
+        if result == "sent":
+            OUTBOUND_DELIVERY_SECONDS.observe(time.monotonic() - job.enqueued_at, job.kind)
+        elif self._dead_letters is not None:
+            try:
+                self._dead_letters.add(
+                    job.kind,
+                    job.target if isinstance(job.target, str) else json.dumps(job.target),
+                    json.dumps([message.as_json_dict() for message in job.messages], ensure_ascii=False),
+                    job.attempts,
+                    error
+                )
+            except Exception:
+                logger.exception("寫入 dead letter 失敗")
+        OUTBOUND_RESULTS.inc(1, job.kind, result)
+
+        with self._lock:
+            if result == "sent":
+                self.sent += 1
+            else:
+                self.dead_lettered += 1
+            self.pending -= 1
+            if self.pending == 0:
+                self._idle.notify_all()
+
+        if job.next is not None:
+            job.next.enqueued_at = time.monotonic()
+            self._enqueue(job.next)
+
+    def flush(self, timeout=None):
+        """等待所有訊息送達或放棄，逾時回傳 False"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            while self.pending:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._idle.wait(remaining)
+        return True
+
+    def stop(self, timeout=5.0):
+        """等待佇列清空後停止工作執行緒"""
+        with self._lock:
+            if not self._started:
+                return
+            self._started = False
+            threads, self._threads = self._threads, []
+        self.flush(timeout)
+        for _ in threads:
+            self._queue.put(_STOP)
+        with self._retry_ready:
+            heapq.heappush(self._retries, (0.0, next(self._retry_seq), _STOP))
+            self._retry_ready.notify()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self._workers,
+                "depth": self._queue.qsize(),
+                "capacity": self.capacity,
+                "waiting_retry": len(self._retries),
+                "pending": self.pending,
+                "enqueued": self.enqueued,
+                "sent": self.sent,
+                "retried": self.retried,
+                "dead_lettered": self.dead_lettered,
+                "inline": self.inline
+            }
+
+
+def _retry_after(headers):
+    headers = headers or {}
+    value = headers.get("Retry-After", headers.get("retry-after"))
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
@@ -0,0 +1,114 @@
+import logging
+import threading
+import time
+from urllib.parse import parse_qsl, urlencode
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+POSTBACK_SECONDS = metrics.histogram(
+    "linebot_postback_seconds", "各 postback 動作的處理時間", ["action"]
+)
+POSTBACK_ERRORS = metrics.counter(
+    "linebot_postback_errors_total", "postback 處理失敗次數", ["action"]
+)
+POSTBACK_UNKNOWN = metrics.counter(
+    "linebot_postback_unknown_total", "無對應動作的 postback 次數"
+)
+
+
+def postback_data(action, **params):
+    """組成 postback data，參數值會經過 URL 編碼"""
+    return urlencode({"action": action, **params})
+
+
+def parse_postback(data):
+    """解析 postback data 並進行 URL 解碼"""
+    return dict(parse_qsl(data, keep_blank_values=True))
+
+
+class PostbackRouter:
+    """以動作名稱查表分派 postback，並記錄各動作的處理時間
+
+    用法:
+        @router.route("add_to_cart", category=str, item=str)
+        def on_add_to_cart(event, user_id, category, item): ...
+
+    參數缺少或型別轉換失敗時傳入 None。
+    """
+
+    def __init__(self):
+        self._routes = {}
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def route(self, action, **schema):
+        def decorator(func):
+            if action in self._routes:
+                raise ValueError(f"postback 動作重複註冊: {action}")
+            self._routes[action] = (func, tuple(schema.items()))
+            return func
+        return decorator
+
+    def dispatch(self, event, user_id, data):
+        """分派 postback，找不到對應動作時回傳 False"""
+        params = parse_postback(data)
+        action = params.get("action", "")
+        route = self._routes.get(action)
+        if route is None:
+            POSTBACK_UNKNOWN.inc()
+            return False
+
+        func, schema = route
+        kwargs = {}
+        for name, type_ in schema:
+            value = params.get(name)
+            if value is not None and type_ is not str:
+                try:
+                    value = type_(value)
+                except ValueError:
+                    value = None
+            kwargs[name] = value
+
+        started = time.perf_counter()
+        failed = False
+        try:
+            func(event, user_id, **kwargs)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self._record(action, time.perf_counter() - started, failed)
+        return True
+
+    def _record(self, action, elapsed, failed):
+        POSTBACK_SECONDS.observe(elapsed, action)
+        if failed:
+            POSTBACK_ERRORS.inc(1, action)
+        elapsed_ms = elapsed * 1000
+        with self._lock:
+            stat = self._stats.get(action)
+            if stat is None:
+                stat = self._stats[action] = {"calls": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0}
+            stat["calls"] += 1
+            stat["total_ms"] += elapsed_ms
+            stat["max_ms"] = max(stat["max_ms"], elapsed_ms)
+            if failed:
+                stat["errors"] += 1
+
+    @property
+    def actions(self):
+        return list(self._routes)
+
+    def stats(self):
+        with self._lock:
+            return {
+                action: {
+                    "calls": stat["calls"],
+                    "errors": stat["errors"],
+                    "avg_ms": round(stat["total_ms"] / stat["calls"], 2),
+                    "max_ms": round(stat["max_ms"], 2)
+                }
+                for action, stat in self._stats.items()
+            }
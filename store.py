@@ -0,0 +1,739 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from werkzeug.security import check_password_hash
+
+import metrics
+from order_ids import is_order_id, order_id_floor, order_id_time
+
+logger = logging.getLogger(__name__)
+
+STORE_OPERATION_SECONDS = metrics.histogram(
+    "linebot_store_operation_seconds", "購物車 / 訂單存取耗時", ["store", "operation"]
+)
+_timed = STORE_OPERATION_SECONDS.time
+
+SCHEMA = """
+-- total 為購物車總金額，隨每次商品異動在同一交易中更新
+-- version 每次異動 +1，結帳時用來確認購物車與確認畫面一致
+CREATE TABLE IF NOT EXISTS carts (
+    user_id TEXT PRIMARY KEY,
+    total INTEGER NOT NULL DEFAULT 0,
+    updated_at TEXT NOT NULL,
+    version INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS cart_items (
+    user_id TEXT NOT NULL,
+    item_id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    category TEXT NOT NULL,
+    price INTEGER NOT NULL,
+    quantity INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (user_id, item_id)
+);
+
+-- 非 INTEGER 的 PRIMARY KEY 在 SQLite 中允許 NULL，需另外加上 NOT NULL
+CREATE TABLE IF NOT EXISTS orders (
+    id TEXT NOT NULL PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    items TEXT NOT NULL,
+    total INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+
+-- 訂單統計計數器：total、day:YYYY-MM-DD、status:<狀態>，與訂單寫入同一交易更新
+CREATE TABLE IF NOT EXISTS order_counters (
+    key TEXT PRIMARY KEY,
+    count INTEGER NOT NULL
+);
+
+-- 已處理的 Webhook 事件，用來略過 LINE 重送的事件 (見 event_dedup.py)
+CREATE TABLE IF NOT EXISTS webhook_events (
+    event_id TEXT PRIMARY KEY,
+    received_at REAL NOT NULL
+);
+
+-- 訂單編號產生器的 worker 編號，由同一台主機上的 worker 行程各自占用
+CREATE TABLE IF NOT EXISTS worker_slots (
+    slot INTEGER PRIMARY KEY,
+    pid INTEGER NOT NULL,
+    claimed_at TEXT NOT NULL
+);
+
+-- 重試後仍無法送出的 LINE 訊息 (見 outbound.py)
+CREATE TABLE IF NOT EXISTS outbound_dead_letters (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    target TEXT NOT NULL,
+    messages TEXT NOT NULL,
+    attempts INTEGER NOT NULL,
+    error TEXT,
+    created_at TEXT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_cart_items_position ON cart_items (user_id, position);
+CREATE INDEX IF NOT EXISTS idx_carts_updated ON carts (updated_at);
+-- 訂單編號依時間排序 (見 order_ids.py)，分頁與日期範圍都直接以編號查詢
+CREATE INDEX IF NOT EXISTS idx_orders_user_id ON orders (user_id, id);
+CREATE INDEX IF NOT EXISTS idx_orders_status_id ON orders (status, id);
+CREATE INDEX IF NOT EXISTS idx_webhook_events_received ON webhook_events (received_at);
+"""
+
+
+class Database:
+    """SQLite 連線池：每個執行緒重複使用自己的連線 (WAL 模式)"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # isolation_level=None 由 transaction() 自行控制交易範圍
+            conn = sqlite3.connect(
+                self.path,
+                timeout=30,
+                isolation_level=None,
+                check_same_thread=False,
+                cached_statements=256
+            )
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        """寫入交易，BEGIN IMMEDIATE 避免多個 worker 同時升級寫鎖造成死結"""
+        conn = self.connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        else:
+            conn.execute("COMMIT")
+
+    def init_schema(self):
+        self.connection().executescript(SCHEMA)
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+# 購物車 SQL
+_SELECT_CART = "SELECT total, updated_at, version FROM carts WHERE user_id = ?"
+_SELECT_CART_ITEMS = (
+    "SELECT item_id, name, category, price, quantity FROM cart_items "
+    "WHERE user_id = ? ORDER BY position"
+)
+_TOUCH_CART = (
+    "INSERT INTO carts (user_id, total, updated_at) VALUES (?, ?, ?) "
+    "ON CONFLICT(user_id) DO UPDATE SET "
+    "total = total + excluded.total, updated_at = excluded.updated_at, version = version + 1"
+)
+# 新建立的購物車 version 為 0，用來判斷是否需要更新購物車數量
+_TOUCH_CART_RETURNING_VERSION = _TOUCH_CART + " RETURNING version"
+_ADD_CART_ITEM = (
+    "INSERT INTO cart_items (user_id, item_id, name, category, price, quantity, position) "
+    "VALUES (?, ?, ?, ?, ?, ?, "
+    "(SELECT COALESCE(MAX(position), 0) + 1 FROM cart_items WHERE user_id = ?)) "
+    "ON CONFLICT(user_id, item_id) DO UPDATE SET quantity = quantity + excluded.quantity "
+    "RETURNING name, category, price, quantity"
+)
+_CHANGE_CART_ITEM_QUANTITY = (
+    "UPDATE cart_items SET quantity = quantity + ? WHERE user_id = ? AND item_id = ? "
+    "RETURNING name, category, price, quantity"
+)
+_DELETE_CART_ITEM = (
+    "DELETE FROM cart_items WHERE user_id = ? AND item_id = ? "
+    "RETURNING name, category, price, quantity"
+)
+_CLEAR_CART_ITEMS = "DELETE FROM cart_items WHERE user_id = ?"
+_RESET_CART = "UPDATE carts SET total = 0, updated_at = ?, version = version + 1 WHERE user_id = ?"
+_RESET_EXPIRED_CART = "UPDATE carts SET total = 0 WHERE user_id = ? AND updated_at < ?"
+_COUNT_CARTS = "SELECT COUNT(*) FROM carts"
+_DELETE_EXPIRED_CART_ITEMS = (
+    "DELETE FROM cart_items WHERE user_id IN "
+    "(SELECT user_id FROM carts WHERE updated_at < ?)"
+)
+_DELETE_EXPIRED_CARTS = "DELETE FROM carts WHERE updated_at < ?"
+_SELECT_LRU_CUTOFF = "SELECT updated_at FROM carts ORDER BY updated_at DESC LIMIT 1 OFFSET ?"
+
+
+class CartLine:
+    """購物車中的一項商品"""
+
+    __slots__ = ("item_id", "name", "category", "price", "quantity")
+
+    def __init__(self, item_id, name, category, price, quantity):
+        self.item_id = item_id
+        self.name = name
+        self.category = category
+        self.price = price
+        self.quantity = quantity
+
+    @property
+    def subtotal(self):
+        return self.price * self.quantity
+
+    def to_dict(self):
+        return {
+            "item_id": self.item_id,
+            "name": self.name,
+            "category": self.category,
+            "price": self.price,
+            "quantity": self.quantity
+        }
+
+
+class Cart:
+    """購物車：商品 id -> CartLine 的有序對應，total 為同步維護的總金額"""
+
+    __slots__ = ("lines", "total", "updated_at", "version")
+
+    def __init__(self, lines, total, updated_at, version=0):
+        self.lines = lines
+        self.total = total
+        self.updated_at = updated_at
+        self.version = version
+
+    def __bool__(self):
+        return bool(self.lines)
+
+    def __len__(self):
+        return len(self.lines)
+
+    def to_items(self):
+        """轉為訂單保存用的商品列表"""
+        return [line.to_dict() for line in self.lines.values()]
+
+
+def _line_from_row(item_id, row):
+    return CartLine(item_id, row["name"], row["category"], row["price"], row["quantity"])
+
+
+class CartStore:
+    """購物車資料存取，每個操作都是單一交易，並行的 postback 不會互相覆蓋
+
+    超過 ttl 未更新的購物車視為過期；每 sweep_interval 秒由背景執行緒移除過期購物車，
+    並在數量超過 max_carts 時依最後更新時間淘汰最久未使用的購物車。
+    """
+
+    def __init__(self, db, ttl=timedelta(hours=24), max_carts=100000, sweep_interval=None):
+        self.db = db
+        self.ttl = ttl
+        self.max_carts = max_carts
+        self.sweep_interval = sweep_interval
+        self._lock = threading.Lock()
+        self._sweeper = None
+
+        # 統計數據
+        self.resident = 0
+        self.expired = 0
+        self.evicted = 0
+        self.sweeps = 0
+        self.last_sweep_ms = 0.0
+
+    @_timed("cart", "get")
+    def get(self, user_id):
+        conn = self.db.connection()
+        row = conn.execute(_SELECT_CART, (user_id,)).fetchone()
+        if row is None:
+            return None
+        # 已過期但尚未被清理的購物車視為空的
+        if row["updated_at"] < (datetime.now() - self.ttl).isoformat():
+            return None
+
+        lines = {}
+        for item in conn.execute(_SELECT_CART_ITEMS, (user_id,)):
+            lines[item["item_id"]] = _line_from_row(item["item_id"], item)
+        return Cart(lines, row["total"], row["updated_at"], row["version"])
+
+    def _discard_expired(self, conn, user_id):
+        """已過期但尚未被清理的購物車先清空，之後的異動從空的購物車開始 (與 get 的判斷一致)"""
+        cutoff = (datetime.now() - self.ttl).isoformat()
+        if conn.execute(_RESET_EXPIRED_CART, (user_id, cutoff)).rowcount:
+            conn.execute(_CLEAR_CART_ITEMS, (user_id,))
+
+    @_timed("cart", "add_item")
+    def add_item(self, user_id, item_id, category, name, price, quantity=1):
+        """加入商品，已存在時增加數量，回傳更新後的 CartLine"""
+        if self._sweeper is None and self.sweep_interval:
+            self.start_sweeper()
+        resident = None
+        with self.db.transaction() as conn:
+            self._discard_expired(conn, user_id)
+            row = conn.execute(
+                _ADD_CART_ITEM, (user_id, item_id, name, category, price, quantity, user_id)
+            ).fetchone()
+            cart = conn.execute(
+                _TOUCH_CART_RETURNING_VERSION, (user_id, row["price"] * quantity, datetime.now().isoformat())
+            ).fetchone()
+            if cart["version"] == 0:
+                resident = conn.execute(_COUNT_CARTS).fetchone()[0]
+        if resident is not None:
+            self.resident = resident
+        return _line_from_row(item_id, row)
+
+    @_timed("cart", "change_quantity")
+    def change_quantity(self, user_id, item_id, delta):
+        """調整數量，降到 0 時移除商品；回傳更新後的 CartLine，找不到商品時回傳 None"""
+        with self.db.transaction() as conn:
+            self._discard_expired(conn, user_id)
+            row = conn.execute(
+                _CHANGE_CART_ITEM_QUANTITY, (delta, user_id, item_id)
+            ).fetchone()
+            if row is None:
+                return None
+            if row["quantity"] <= 0:
+                conn.execute(_DELETE_CART_ITEM, (user_id, item_id)).fetchall()
+                delta -= row["quantity"]
+            conn.execute(_TOUCH_CART, (user_id, row["price"] * delta, datetime.now().isoformat()))
+        line = _line_from_row(item_id, row)
+        line.quantity = max(line.quantity, 0)
+        return line
+
+    @_timed("cart", "remove_item")
+    def remove_item(self, user_id, item_id):
+        """移除商品，回傳被移除的 CartLine，找不到商品時回傳 None"""
+        with self.db.transaction() as conn:
+            self._discard_expired(conn, user_id)
+            row = conn.execute(_DELETE_CART_ITEM, (user_id, item_id)).fetchone()
+            if row is None:
+                return None
+            conn.execute(_TOUCH_CART, (user_id, -row["price"] * row["quantity"], datetime.now().isoformat()))
+        return _line_from_row(item_id, row)
+
+    @_timed("cart", "clear")
+    def clear(self, user_id):
+        with self.db.transaction() as conn:
+            conn.execute(_CLEAR_CART_ITEMS, (user_id,))
+            conn.execute(_RESET_CART, (datetime.now().isoformat(), user_id))
+
+    @_timed("cart", "sweep")
+    def sweep(self):
+        """移除過期購物車，並將購物車數量控制在 max_carts 以內"""
+        started = time.monotonic()
+        cutoff = (datetime.now() - self.ttl).isoformat()
+        with self.db.transaction() as conn:
+            conn.execute(_DELETE_EXPIRED_CART_ITEMS, (cutoff,))
+            expired = conn.execute(_DELETE_EXPIRED_CARTS, (cutoff,)).rowcount
+
+            evicted = 0
+            row = conn.execute(_SELECT_LRU_CUTOFF, (self.max_carts,)).fetchone()
+            if row is not None:
+                # 淘汰最後更新時間不晚於第 max_carts+1 新的購物車
+                lru_cutoff = row["updated_at"] + "\0"
+                conn.execute(_DELETE_EXPIRED_CART_ITEMS, (lru_cutoff,))
+                evicted = conn.execute(_DELETE_EXPIRED_CARTS, (lru_cutoff,)).rowcount
+
+            resident = conn.execute(_COUNT_CARTS).fetchone()[0]
+
+        self.expired += expired
+        self.evicted += evicted
+        self.resident = resident
+        self.sweeps += 1
+        self.last_sweep_ms = round((time.monotonic() - started) * 1000, 2)
+        return expired, evicted
+
+    def start_sweeper(self):
+        """啟動背景清理執行緒；延遲到第一次加入商品時才啟動，避免 gunicorn fork 前建立的執行緒失效"""
+
+        def run():
+            while True:
+                try:
+                    self.sweep()
+                except Exception:
+                    logger.exception("清理購物車失敗")
+                time.sleep(self.sweep_interval)
+
+        with self._lock:
+            if self._sweeper is not None:
+                return
+            self._sweeper = threading.Thread(target=run, name="cart-sweeper", daemon=True)
+            self._sweeper.start()
+
+    def stats(self):
+        return {
+            "resident": self.resident,
+            "max_carts": self.max_carts,
+            "ttl_seconds": int(self.ttl.total_seconds()),
+            "expired": self.expired,
+            "evicted": self.evicted,
+            "sweeps": self.sweeps,
+            "last_sweep_ms": self.last_sweep_ms
+        }
+
+
+# 訂單 SQL
+_SELECT_COUNTER = "SELECT count FROM order_counters WHERE key = ?"
+_INCREMENT_COUNTER = (
+    "INSERT INTO order_counters (key, count) VALUES (?, ?) "
+    "ON CONFLICT(key) DO UPDATE SET count = count + excluded.count"
+)
+_SET_COUNTER = (
+    "INSERT INTO order_counters (key, count) VALUES (?, ?) "
+    "ON CONFLICT(key) DO UPDATE SET count = excluded.count"
+)
+_BUMP_REVISION = _INCREMENT_COUNTER + " RETURNING count"
+_SELECT_ORDER_STATUS = "SELECT user_id, status FROM orders WHERE id = ?"
+_SELECT_ORDER = "SELECT * FROM orders WHERE id = ?"
+_UPDATE_ORDER_STATUS = "UPDATE orders SET status = ?, updated_at = ? WHERE id = ?"
+_INSERT_ORDER = (
+    "INSERT INTO orders (id, user_id, items, total, status, created_at, updated_at) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?)"
+)
+_SELECT_USER_ORDERS = "SELECT * FROM orders WHERE user_id = ? ORDER BY id DESC LIMIT ?"
+_SELECT_USER_ORDERS_BEFORE = (
+    "SELECT * FROM orders WHERE user_id = ? AND id < ? ORDER BY id DESC LIMIT ?"
+)
+_SELECT_RECENT_ORDERS = "SELECT * FROM orders ORDER BY id DESC LIMIT ?"
+
+
+def _order_from_row(row):
+    order = dict(row)
+    order["items"] = json.loads(order["items"])
+    return order
+
+
+# 結帳結果
+CHECKOUT_CREATED = "created"
+CHECKOUT_DUPLICATE = "duplicate"  # 同一訂單編號已經建立過 (重複點擊或重送)
+CHECKOUT_EMPTY = "empty"
+CHECKOUT_CHANGED = "changed"  # 購物車在確認訂單後又被修改
+
+
+# 訂單事件
+ORDER_CREATED = "order_created"
+ORDER_STATUS_CHANGED = "order_status"
+
+
+class OrderStore:
+    """訂單資料存取
+
+    訂單建立或狀態變更並提交後，會以 (事件類型, 資料) 通知 add_listener 註冊的函式。
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self._listeners = []
+
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    def _notify(self, event_type, data):
+        for listener in self._listeners:
+            try:
+                listener(event_type, data)
+            except Exception:
+                logger.exception("訂單事件通知失敗")
+
+    @_timed("order", "create")
+    def create(self, order):
+        with self.db.transaction() as conn:
+            revision = self._insert(conn, order)
+        self._notify(ORDER_CREATED, dict(order, revision=revision))
+
+    def _insert(self, conn, order):
+        conn.execute(_INSERT_ORDER, (
+            order["id"],
+            order["user_id"],
+            json.dumps(order["items"], ensure_ascii=False),
+            order["total"],
+            order["status"],
+            order["created_at"],
+            order["updated_at"]
+        ))
+        conn.execute(_INCREMENT_COUNTER, ("total", 1))
+        conn.execute(_INCREMENT_COUNTER, ("day:" + order["created_at"][:10], 1))
+        conn.execute(_INCREMENT_COUNTER, ("status:" + order["status"], 1))
+        return self._touch(conn)
+
+    def _touch(self, conn):
+        """revision 與 modified 供管理 API 產生 ETag / Last-Modified，回傳新的 revision"""
+        conn.execute(_SET_COUNTER, ("modified", int(time.time())))
+        return conn.execute(_BUMP_REVISION, ("revision", 1)).fetchone()[0]
+
+    @_timed("order", "checkout")
+    def checkout(self, user_id, order_id, status, cart_ttl, expected_version=None):
+        """在同一個交易內把購物車轉成訂單並清空購物車，回傳 (結帳結果, 訂單)
+
+        BEGIN IMMEDIATE 讓同一時間只有一個結帳能讀寫購物車，
+        訂單編號已存在時直接回傳既有訂單，重複結帳不會產生第二筆訂單。
+        expected_version 與購物車版本不符時不建立訂單。
+        created_at 取自訂單編號的時間，每日計數與依編號的日期範圍查詢使用同一個時間。
+        """
+        if not is_order_id(order_id):
+            raise ValueError(f"結帳需要 OrderIdGenerator 產生的訂單編號: {order_id!r}")
+        now = datetime.now()
+        with self.db.transaction() as conn:
+            row = conn.execute(_SELECT_ORDER, (order_id,)).fetchone()
+            if row is not None:
+                return CHECKOUT_DUPLICATE, _order_from_row(row)
+
+            cart = conn.execute(_SELECT_CART, (user_id,)).fetchone()
+            if cart is None or cart["updated_at"] < (now - cart_ttl).isoformat():
+                return CHECKOUT_EMPTY, None
+            if expected_version is not None and cart["version"] != expected_version:
+                return CHECKOUT_CHANGED, None
+
+            items = [
+                _line_from_row(item["item_id"], item).to_dict()
+                for item in conn.execute(_SELECT_CART_ITEMS, (user_id,))
+            ]
+            if not items:
+                return CHECKOUT_EMPTY, None
+
+            order = {
+                "id": order_id,
+                "user_id": user_id,
+                "items": items,
+                "total": cart["total"],
+                "status": status,
+                "created_at": order_id_time(order_id).isoformat(),
+                "updated_at": now.isoformat()
+            }
+            revision = self._insert(conn, order)
+            conn.execute(_CLEAR_CART_ITEMS, (user_id,))
+            conn.execute(_RESET_CART, (now.isoformat(), user_id))
+        self._notify(ORDER_CREATED, dict(order, revision=revision))
+        return CHECKOUT_CREATED, order
+
+    @_timed("order", "update_status")
+    def update_status(self, order_id, status, allowed_from=None):
+        """更新訂單狀態並調整狀態計數，回傳原狀態 (找不到訂單時回傳 None)
+
+        指定 allowed_from 時，只有原狀態在其中才會更新。
+        """
+        return self.update_statuses([order_id], status, allowed_from).get(order_id)
+
+    @_timed("order", "update_statuses")
+    def update_statuses(self, order_ids, status, allowed_from=None):
+        """在同一個交易內更新多筆訂單狀態，回傳 {訂單編號: 原狀態}，找不到的訂單不會出現"""
+        old_statuses = {}
+        changes = []
+        updated_at = datetime.now().isoformat()
+        with self.db.transaction() as conn:
+            for order_id in dict.fromkeys(order_ids):
+                row = conn.execute(_SELECT_ORDER_STATUS, (order_id,)).fetchone()
+                if row is None:
+                    continue
+                old_status = old_statuses[order_id] = row["status"]
+                if old_status == status or (allowed_from is not None and old_status not in allowed_from):
+                    continue
+                conn.execute(_UPDATE_ORDER_STATUS, (status, updated_at, order_id))
+                conn.execute(_INCREMENT_COUNTER, ("status:" + old_status, -1))
+                conn.execute(_INCREMENT_COUNTER, ("status:" + status, 1))
+                changes.append({
+                    "id": order_id,
+                    "user_id": row["user_id"],
+                    "status": status,
+                    "old_status": old_status,
+                    "updated_at": updated_at,
+                    "revision": self._touch(conn)
+                })
+        for change in changes:
+            self._notify(ORDER_STATUS_CHANGED, change)
+        return old_statuses
+
+    @_timed("order", "list_by_user")
+    def list_by_user(self, user_id, limit, before=None):
+        """取得用戶的訂單 (新到舊)，before 為上一頁最後一筆訂單編號"""
+        conn = self.db.connection()
+        if before:
+            rows = conn.execute(_SELECT_USER_ORDERS_BEFORE, (user_id, before, limit))
+        else:
+            rows = conn.execute(_SELECT_USER_ORDERS, (user_id, limit))
+        return [_order_from_row(row) for row in rows]
+
+    @_timed("order", "recent")
+    def recent(self, limit):
+        conn = self.db.connection()
+        return [_order_from_row(row) for row in conn.execute(_SELECT_RECENT_ORDERS, (limit,))]
+
+    @_timed("order", "search")
+    def search(self, statuses=None, user_id=None, start=None, end=None, limit=20, before=None):
+        """依條件查詢訂單 (新到舊)
+
+        start / end 為 datetime (含 start、不含 end)，以 order_id_floor 換算成訂單編號的範圍，
+        依訂單編號中的時間 (確認訂單的時間) 篩選；before 為上一頁最後一筆訂單編號。
+        排序、分頁與時間範圍都只用到訂單編號，各條件皆有對應的索引。
+        """
+        clauses = []
+        params = []
+        if statuses:
+            clauses.append("status IN (" + ", ".join("?" * len(statuses)) + ")")
+            params.extend(statuses)
+        if user_id:
+            clauses.append("user_id = ?")
+            params.append(user_id)
+        if start:
+            clauses.append("id >= ?")
+            params.append(order_id_floor(start))
+        if end:
+            clauses.append("id < ?")
+            params.append(order_id_floor(end))
+        if before:
+            clauses.append("id < ?")
+            params.append(before)
+
+        sql = "SELECT * FROM orders"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY id DESC LIMIT ?"
+        params.append(limit)
+        return [_order_from_row(row) for row in self.db.connection().execute(sql, params)]
+
+    # 統計查詢皆讀取計數器，與訂單數量無關
+    def _counter(self, key):
+        row = self.db.connection().execute(_SELECT_COUNTER, (key,)).fetchone()
+        return row[0] if row else 0
+
+    def count(self):
+        return self._counter("total")
+
+    def revision(self):
+        """回傳 (異動次數, 最後異動時間 epoch 秒)，任何訂單新增或狀態變更都會改變"""
+        return self._counter("revision"), self._counter("modified")
+
+    def count_on(self, day):
+        """指定日期 (date) 的訂單數"""
+        return self._counter("day:" + day.isoformat())
+
+    def count_by_status(self, statuses):
+        return sum(self._counter("status:" + status) for status in statuses)
+
+    def count_other_orders(self, user_id, order_id, statuses, since):
+        """用戶在 since (datetime) 之後、狀態為 statuses 之一的其他訂單數"""
+        sql = (
+            "SELECT COUNT(*) FROM orders WHERE user_id = ? AND id >= ? AND id != ? "
+            "AND status IN (" + ", ".join("?" * len(statuses)) + ")"
+        )
+        params = [user_id, order_id_floor(since), order_id, *statuses]
+        return self.db.connection().execute(sql, params).fetchone()[0]
+
+
+# 管理員帳號 SQL (資料表由 init_database.py 建立)
+_SELECT_ADMIN_USER = "SELECT username, password_hash, role FROM admin_users WHERE username = ?"
+
+
+class AdminUserStore:
+    """管理後台帳號"""
+
+    def __init__(self, db):
+        self.db = db
+
+    def authenticate(self, username, password):
+        """帳號密碼正確時回傳角色，否則回傳 None"""
+        try:
+            row = self.db.connection().execute(_SELECT_ADMIN_USER, (username,)).fetchone()
+        except sqlite3.OperationalError:
+            logger.warning("找不到 admin_users 資料表，請先執行 init_database.py")
+            return None
+        if row is None or not check_password_hash(row["password_hash"], password):
+            return None
+        return row["role"]
+
+
+# Webhook 事件 SQL
+_CLAIM_EVENT = "INSERT OR IGNORE INTO webhook_events (event_id, received_at) VALUES (?, ?)"
+_RELEASE_EVENT = "DELETE FROM webhook_events WHERE event_id = ?"
+_PRUNE_EVENTS = "DELETE FROM webhook_events WHERE received_at < ?"
+
+
+class EventLog:
+    """已處理的 Webhook 事件 id，多個 worker 共用"""
+
+    def __init__(self, db):
+        self.db = db
+
+    def claim(self, event_id, received_at):
+        """記錄事件，已被其他 worker 記錄過時回傳 False"""
+        return self.db.connection().execute(_CLAIM_EVENT, (event_id, received_at)).rowcount == 1
+
+    def release(self, event_id):
+        self.db.connection().execute(_RELEASE_EVENT, (event_id,))
+
+    def prune(self, before):
+        return self.db.connection().execute(_PRUNE_EVENTS, (before,)).rowcount
+
+
+# worker 編號 SQL
+_SELECT_WORKER_SLOTS = "SELECT slot, pid FROM worker_slots"
+_CLAIM_WORKER_SLOT = (
+    "INSERT INTO worker_slots (slot, pid, claimed_at) VALUES (?, ?, ?) "
+    "ON CONFLICT(slot) DO UPDATE SET pid = excluded.pid, claimed_at = excluded.claimed_at"
+)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class WorkerSlots:
+    """分配同一台主機上各 worker 行程的編號，已結束行程的編號可以重新使用"""
+
+    def __init__(self, db):
+        self.db = db
+
+    def claim(self, pid, limit):
+        with self.db.transaction() as conn:
+            owners = {row["slot"]: row["pid"] for row in conn.execute(_SELECT_WORKER_SLOTS)}
+            for slot in range(limit):
+                owner = owners.get(slot)
+                if owner is None or owner == pid or not _pid_alive(owner):
+                    conn.execute(_CLAIM_WORKER_SLOT, (slot, pid, datetime.now().isoformat()))
+                    return slot
+        raise RuntimeError(f"worker 編號已用完 (上限 {limit})")
+
+
+# dead letter SQL
+_INSERT_DEAD_LETTER = (
+    "INSERT INTO outbound_dead_letters (kind, target, messages, attempts, error, created_at) "
+    "VALUES (?, ?, ?, ?, ?, ?)"
+)
+_SELECT_DEAD_LETTERS = "SELECT * FROM outbound_dead_letters ORDER BY id DESC LIMIT ?"
+_COUNT_DEAD_LETTERS = "SELECT COUNT(*) FROM outbound_dead_letters"
+
+
+class DeadLetterStore:
+    """重試後仍發送失敗的訊息，保留原始內容供查詢或人工補送"""
+
+    def __init__(self, db):
+        self.db = db
+
+    def add(self, kind, target, messages, attempts, error):
+        self.db.connection().execute(_INSERT_DEAD_LETTER, (
+            kind, target, messages, attempts, error, datetime.now().isoformat()
+        ))
+
+    def recent(self, limit):
+        rows = self.db.connection().execute(_SELECT_DEAD_LETTERS, (limit,))
+        return [dict(row, messages=json.loads(row["messages"])) for row in rows]
+
+    def count(self):
+        return self.db.connection().execute(_COUNT_DEAD_LETTERS).fetchone()[0]
@@ -0,0 +1,28 @@
+"""並行結帳：同一張確認單只建立一筆訂單，購物車異動不會遺失"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+from checkout_stress import hammer, verify  # noqa: E402
+from store import CHECKOUT_CREATED, Database  # noqa: E402
+
+THREADS = 8
+ROUNDS = 5
+USERS = 4
+
+
+def test_threaded_checkout(tmp_path):
+    path = str(tmp_path / "restaurant.db")
+    Database(path).init_schema()
+
+    added, results = hammer(path, 0, THREADS, ROUNDS, USERS)
+    orders, order_total, cart_total, errors = verify(path, added, results)
+
+    assert errors == []
+    # 每輪每位用戶的確認單最多建立一筆訂單，其餘都是重複結帳或購物車已變更
+    assert sum(results.values()) == THREADS * ROUNDS * USERS
+    assert 0 < results[CHECKOUT_CREATED] == orders <= ROUNDS * USERS
+    assert added == order_total + cart_total
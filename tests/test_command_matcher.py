@@ -0,0 +1,56 @@
+"""文字指令比對：別名、前綴指令與商品名稱"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from command_matcher import CommandMatcher, ITEM  # noqa: E402
+
+MENU_ITEMS = [
+    {"id": 1, "name": "洋蔥圈", "category": "side"},
+    {"id": 2, "name": "可樂", "category": "drink"},
+    {"id": 3, "name": "經典漢堡", "category": "main"}
+]
+
+
+@pytest.fixture
+def matcher():
+    return CommandMatcher(
+        {"menu": ["菜單"], "help": ["說明"]},
+        prefixes={"search": ["搜尋", "search", "find"]},
+        menu_items=lambda: MENU_ITEMS,
+        menu_version=lambda: 1
+    )
+
+
+@pytest.mark.parametrize("text, argument", [
+    ("搜尋 漢堡", "漢堡"),
+    ("搜尋漢堡", "漢堡"),
+    ("search cola", "cola"),
+    ("Find: 可樂", "可樂"),
+    ("search", "")
+])
+def test_search_prefix(matcher, text, argument):
+    match = matcher.match(text)
+    assert match.command == "search"
+    assert match.argument == argument
+
+
+@pytest.mark.parametrize("text", ["findings", "searching", "找不到路", "找 漢堡"])
+def test_prefix_needs_word_boundary(matcher, text):
+    match = matcher.match(text)
+    assert match is None or match.command != "search"
+
+
+def test_item_with_quantity(matcher):
+    match = matcher.match("可樂 x2")
+    assert (match.command, match.kind, match.item["id"], match.quantity) == (ITEM, "exact", 2, 2)
+
+
+@pytest.mark.parametrize("text, quantity", [("洋蔥", 1), ("2 洋蔥", 2), ("洋蔥 x3", 3)])
+def test_partial_item_name_is_typo(matcher, text, quantity):
+    # 名稱不完全相同的商品不直接加入購物車，由 app 請用戶確認
+    match = matcher.match(text)
+    assert (match.command, match.kind, match.item["id"], match.quantity) == (ITEM, "typo", 1, quantity)
@@ -0,0 +1,117 @@
+"""發送佇列：回覆與推播的順序、重試只發生在佇列這一層"""
+import http.server
+import os
+import sys
+import threading
+import time
+from functools import partial
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from linebot import LineBotApi  # noqa: E402
+from linebot.models import TextSendMessage  # noqa: E402
+
+from line_client import PooledHttpClient, send_messages  # noqa: E402
+from outbound import OutboundQueue  # noqa: E402
+
+
+class RecordingLineBotApi:
+    """記錄呼叫順序；回覆刻意變慢，讓並行的工作執行緒有機會先送出推播"""
+
+    def __init__(self):
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def reply_message(self, reply_token, messages, **kwargs):
+        time.sleep(0.05)
+        self._record("reply", messages)
+
+    def push_message(self, to, messages, **kwargs):
+        self._record("push", messages)
+
+    def _record(self, kind, messages):
+        with self._lock:
+            self.calls.append((kind, [message.text for message in messages]))
+
+
+class DeadLetters:
+    def __init__(self):
+        self.letters = []
+
+    def add(self, kind, target, messages, attempts, error):
+        self.letters.append((kind, attempts, error))
+
+
+def test_reply_before_overflow_pushes():
+    line_bot_api = RecordingLineBotApi()
+    messenger = OutboundQueue(line_bot_api, workers=4, rate=0)
+    messages = [TextSendMessage(text=str(i)) for i in range(12)]
+
+    assert send_messages(messenger, "token", "U1", messages) == 3
+    assert messenger.flush(5)
+    messenger.stop()
+
+    assert [kind for kind, _ in line_bot_api.calls] == ["reply", "push", "push"]
+    assert [text for _, texts in line_bot_api.calls for text in texts] == [str(i) for i in range(12)]
+
+
+def test_failed_push_retried_by_queue_only():
+    requests = []
+
+    class Unavailable(http.server.BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers["Content-Length"]))
+            requests.append(self.headers.get("X-Line-Retry-Key"))
+            self.send_response(503)
+            self.send_header("Content-Type", "application/json")
+            self.end_headers()
+            self.wfile.write(b'{"message":"unavailable"}')
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Unavailable)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        line_bot_api = LineBotApi(
+            "token",
+            endpoint=f"http://127.0.0.1:{server.server_port}",
+            http_client=partial(PooledHttpClient, max_retries=3, backoff_factor=0, status_forcelist=())
+        )
+        dead_letters = DeadLetters()
+        messenger = OutboundQueue(line_bot_api, dead_letters=dead_letters, rate=0, max_retries=2, backoff=0.01)
+        messenger.push_message("U1", TextSendMessage(text="hi"))
+        assert messenger.flush(5)
+        messenger.stop()
+    finally:
+        server.shutdown()
+
+    # 第一次發送加上 2 次重試，HTTP 層不另外重試；每次都帶相同的 retry key
+    assert len(requests) == 3
+    assert len(set(requests)) == 1 and requests[0]
+    assert dead_letters.letters == [("push", 3, "503 unavailable")]
+
+
+def test_inline_delivery_error_still_finishes_job():
+    released = threading.Event()
+
+    class BrokenLineBotApi:
+        def reply_message(self, reply_token, messages, **kwargs):
+            released.wait(5)
+
+        def push_message(self, to, messages, **kwargs):
+            raise RuntimeError("boom")
+
+    dead_letters = DeadLetters()
+    messenger = OutboundQueue(BrokenLineBotApi(), dead_letters=dead_letters, workers=1, max_size=1, rate=0)
+    messenger.reply_message("token", TextSendMessage(text="slow"))
+    time.sleep(0.05)
+    # 工作執行緒卡在回覆、佇列已滿：第三則由呼叫端直接發送並拋出錯誤
+    messenger.push_message("U1", TextSendMessage(text="queued"))
+    assert messenger.push_message("U1", TextSendMessage(text="inline")) is False
+    released.set()
+
+    assert messenger.flush(5)
+    messenger.stop()
+    assert messenger.inline == 1
+    assert dead_letters.letters == [("push", 1, "unexpected error")] * 2
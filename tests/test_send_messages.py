@@ -0,0 +1,67 @@
+"""菜單訊息的 API 呼叫次數：前 5 則併入回覆，超過的部分才推播"""
+import os
+import sys
+import tempfile
+from unittest import mock
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("LINE_CHANNEL_SECRET", "test")
+os.environ.setdefault("LINE_CHANNEL_ACCESS_TOKEN", "test")
+os.environ.setdefault("DATABASE_PATH", os.path.join(tempfile.mkdtemp(), "test.db"))
+os.environ.setdefault("WARM_UP_ON_BOOT", "false")
+
+import app  # noqa: E402
+from line_client import MAX_MESSAGES_PER_CALL, send_messages  # noqa: E402
+
+REPLY_TOKEN = "nHuyWiB7yP5Zw52FIkcQobQuGDXCTA"
+USER_ID = "U4af4980629"
+
+
+def make_items(size):
+    return [
+        {
+            "id": i + 1,
+            "name": f"商品{i + 1}",
+            "category": "test",
+            "price": 50 + i,
+            "desc": "測試商品",
+            "image": "https://example.com/item.jpg"
+        }
+        for i in range(size)
+    ]
+
+
+def send_menu(size):
+    line_bot_api = mock.Mock(spec=["reply_message", "push_message"])
+    messages = app.menu_pages("測試 菜單", make_items(size))
+    calls = send_messages(line_bot_api, REPLY_TOKEN, USER_ID, messages)
+    return line_bot_api, messages, calls
+
+
+@pytest.mark.parametrize("size, pages, pushes", [(10, 1, 0), (25, 3, 0), (60, 6, 1)])
+def test_menu_call_count(size, pages, pushes):
+    line_bot_api, messages, calls = send_menu(size)
+
+    assert len(messages) == pages
+    assert calls == 1 + pushes
+    assert line_bot_api.reply_message.call_count == 1
+    assert line_bot_api.push_message.call_count == pushes
+
+    reply_token, replied = line_bot_api.reply_message.call_args.args
+    assert reply_token == REPLY_TOKEN
+    assert replied == messages[:MAX_MESSAGES_PER_CALL]
+    pushed = [message for call in line_bot_api.push_message.call_args_list for message in call.args[1]]
+    assert all(call.args[0] == USER_ID for call in line_bot_api.push_message.call_args_list)
+    assert replied + pushed == messages
+
+
+@pytest.mark.parametrize("size", [10, 25, 60])
+def test_quick_reply_on_last_message(size):
+    _, messages, _ = send_menu(size)
+
+    payloads = [message.as_json_dict() for message in messages]
+    assert "quickReply" in payloads[-1]
+    assert all("quickReply" not in payload for payload in payloads[:-1])
+    assert sum(len(payload["contents"]["contents"]) for payload in payloads) == size
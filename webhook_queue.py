@@ -0,0 +1,129 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+QUEUE_WAIT_SECONDS = metrics.histogram(
+    "linebot_webhook_queue_wait_seconds", "事件在佇列中等待處理的時間"
+)
+
+
+class WebhookQueue:
+    """有界事件佇列 + 工作執行緒池，讓 /callback 驗證簽章後立即回應"""
+
+    def __init__(self, process_event, workers=4, max_size=1000):
+        self._process_event = process_event
+        self._workers = max(1, workers)
+        self._queue = queue.Queue(maxsize=max_size)
+        self._threads = []
+        self._lock = threading.Lock()
+        self._started = False
+
+        # 統計數據
+        self.capacity = max_size
+        self.enqueued = 0
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0  # 佇列已滿、改由請求執行緒同步處理的事件數
+        self.max_depth = 0
+        self.total_wait = 0.0
+
+    def start(self):
+        # 延遲到第一次使用時才啟動，避免 gunicorn fork 前建立的執行緒失效
+        with self._lock:
+            if self._started:
+                return
+            for i in range(self._workers):
+                thread = threading.Thread(
+                    target=self._worker,
+                    name=f"webhook-worker-{i}",
+                    daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+            self._started = True
+        atexit.register(self.stop)
+
+    def submit(self, event):
+        """放入佇列，佇列已滿時回傳 False 由呼叫端自行處理"""
+        if not self._started:
+            self.start()
+
+        try:
+            self._queue.put_nowait((event, time.monotonic()))
+        except queue.Full:
+            with self._lock:
+                self.rejected += 1
+            return False
+
+        with self._lock:
+            self.enqueued += 1
+            depth = self._queue.qsize()
+            if depth > self.max_depth:
+                self.max_depth = depth
+        return True
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            if job is _STOP:
+                self._queue.task_done()
+                return
+
+            event, queued_at = job
+            wait = time.monotonic() - queued_at
+            QUEUE_WAIT_SECONDS.observe(wait)
+            try:
+                self._process_event(event)
+                ok = True
+            except Exception:
+                logger.exception("處理 Webhook 事件失敗")
+                ok = False
+            finally:
+                self._queue.task_done()
+
+            with self._lock:
+                self.total_wait += wait
+                if ok:
+                    self.processed += 1
+                else:
+                    self.failed += 1
+
+    def stop(self, timeout=5.0):
+        """等待佇列清空後停止工作執行緒"""
+        with self._lock:
+            if not self._started:
+                return
+            self._started = False
+            threads, self._threads = self._threads, []
+
+        deadline = time.monotonic() + timeout
+        for _ in threads:
+            try:
+                self._queue.put(_STOP, timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Full:
+                break
+        for thread in threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+
+    def stats(self):
+        with self._lock:
+            done = self.processed + self.failed
+            return {
+                "workers": self._workers,
+                "depth": self._queue.qsize(),
+                "capacity": self.capacity,
+                "max_depth": self.max_depth,
+                "enqueued": self.enqueued,
+                "processed": self.processed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "avg_wait_ms": round(self.total_wait / done * 1000, 2) if done else 0.0
+            }